@@ -68,6 +68,7 @@ def run_migrations_offline() -> None:
         dialect_opts={"paramstyle": "named"},
         compare_type=True,
         compare_server_default=True,
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
@@ -81,6 +82,9 @@ def do_run_migrations(connection: Connection) -> None:
         target_metadata=target_metadata,
         compare_type=True,
         compare_server_default=True,
+        # Una transacción por migración: las que usan autocommit_block()
+        # (CREATE INDEX CONCURRENTLY) no arrastran a las demás fuera de su transacción
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
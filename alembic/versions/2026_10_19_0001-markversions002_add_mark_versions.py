@@ -0,0 +1,43 @@
+"""add_mark_versions
+
+Revision ID: markversions002
+Revises: initial001
+Create Date: 2026-10-19 00:01:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'markversions002'
+down_revision: Union[str, None] = 'initial001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Crea la tabla de versiones de cambios por usuario.
+
+    Cada mutación de marcas incrementa la versión del usuario dentro de la misma
+    transacción; los listados la exponen como ETag para responder 304 sin leer marks.
+    """
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS mark_versions (
+            user_id INTEGER PRIMARY KEY REFERENCES "user"(id) ON DELETE CASCADE,
+            version BIGINT NOT NULL DEFAULT 0
+        );
+    """)
+
+    print("✅ Tabla mark_versions creada correctamente")
+
+
+def downgrade() -> None:
+    """
+    Revertir la migración: Eliminar la tabla de versiones.
+    """
+    op.execute("DROP TABLE IF EXISTS mark_versions;")
+
+    print("✅ Tabla mark_versions eliminada correctamente")
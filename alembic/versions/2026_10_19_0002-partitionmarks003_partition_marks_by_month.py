@@ -0,0 +1,127 @@
+"""partition_marks_by_month
+
+Revision ID: partitionmarks003
+Revises: markversions002
+Create Date: 2026-10-19 00:02:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'partitionmarks003'
+down_revision: Union[str, None] = 'markversions002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Meses futuros que se dejan creados (la app los mantiene al arrancar y cada día)
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    """
+    Convierte marks en una tabla particionada por rango mensual de timestamp.
+
+    - La PK pasa a ser (id, timestamp): Postgres exige que incluya la llave de partición.
+    - Los índices se crean sobre la tabla padre y se propagan a cada partición.
+    - ensure_marks_partitions(desde, hasta) crea las particiones mensuales faltantes.
+    - No hay partición DEFAULT: impediría el Append ordenado que permite a los
+      listados (ORDER BY timestamp DESC LIMIT n) leer solo las particiones recientes.
+    """
+    # Tabla actual -> legacy (se copia y se elimina al final)
+    op.execute("ALTER TABLE marks RENAME TO marks_legacy;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_user_type_timestamp;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_user_timestamp;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_timestamp;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_user_id;")
+
+    # Misma estructura y defaults (incluye nextval de marks_id_seq)
+    op.execute("""
+        CREATE TABLE marks (LIKE marks_legacy INCLUDING DEFAULTS)
+        PARTITION BY RANGE (timestamp);
+    """)
+    op.execute("ALTER TABLE marks ADD PRIMARY KEY (id, timestamp);")
+    op.execute("""
+        ALTER TABLE marks
+        ADD CONSTRAINT marks_user_id_fkey FOREIGN KEY (user_id) REFERENCES "user"(id);
+    """)
+
+    # Función para crear particiones mensuales (idempotente)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION ensure_marks_partitions(from_ts timestamp, to_ts timestamp)
+        RETURNS integer AS $$
+        DECLARE
+            month_start date := date_trunc('month', from_ts)::date;
+            partition_name text;
+            created integer := 0;
+        BEGIN
+            WHILE month_start <= to_ts LOOP
+                partition_name := 'marks_' || to_char(month_start, 'YYYY_MM');
+                IF to_regclass(partition_name) IS NULL THEN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF marks FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month_start, (month_start + interval '1 month')::date
+                    );
+                    created := created + 1;
+                END IF;
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # Particiones desde el primer mes con datos hasta MONTHS_AHEAD meses en el futuro
+    op.execute(f"""
+        SELECT ensure_marks_partitions(
+            COALESCE((SELECT min(timestamp) FROM marks_legacy), now()::timestamp),
+            GREATEST(
+                COALESCE((SELECT max(timestamp) FROM marks_legacy), now()::timestamp),
+                now()::timestamp + interval '{MONTHS_AHEAD} months'
+            )
+        );
+    """)
+
+    # Copiar datos y mover la secuencia a la tabla nueva
+    op.execute("INSERT INTO marks SELECT * FROM marks_legacy;")
+    op.execute("ALTER SEQUENCE marks_id_seq OWNED BY marks.id;")
+    op.execute("DROP TABLE marks_legacy;")
+
+    # Índices particionados (uno por partición, más pequeños que los globales)
+    op.execute("CREATE INDEX idx_marks_user_id ON marks(user_id);")
+    op.execute("CREATE INDEX idx_marks_timestamp ON marks(timestamp);")
+    op.execute("CREATE INDEX idx_marks_user_timestamp ON marks(user_id, timestamp);")
+    op.execute("CREATE INDEX idx_marks_user_type_timestamp ON marks(user_id, mark_type, timestamp);")
+
+    print("✅ Tabla marks particionada por mes")
+
+
+def downgrade() -> None:
+    """
+    Revertir la migración: volver a una tabla marks sin particionar.
+    """
+    op.execute("ALTER TABLE marks RENAME TO marks_partitioned;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_user_type_timestamp;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_user_timestamp;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_timestamp;")
+    op.execute("DROP INDEX IF EXISTS idx_marks_user_id;")
+
+    op.execute("CREATE TABLE marks (LIKE marks_partitioned INCLUDING DEFAULTS);")
+    op.execute("ALTER TABLE marks ADD PRIMARY KEY (id);")
+    op.execute("""
+        ALTER TABLE marks
+        ADD CONSTRAINT marks_user_id_fkey FOREIGN KEY (user_id) REFERENCES "user"(id);
+    """)
+    op.execute("INSERT INTO marks SELECT * FROM marks_partitioned;")
+    op.execute("ALTER SEQUENCE marks_id_seq OWNED BY marks.id;")
+    op.execute("DROP TABLE marks_partitioned CASCADE;")
+    op.execute("DROP FUNCTION IF EXISTS ensure_marks_partitions(timestamp, timestamp);")
+
+    op.execute("CREATE INDEX idx_marks_user_id ON marks(user_id);")
+    op.execute("CREATE INDEX idx_marks_timestamp ON marks(timestamp);")
+    op.execute("CREATE INDEX idx_marks_user_timestamp ON marks(user_id, timestamp);")
+    op.execute("CREATE INDEX idx_marks_user_type_timestamp ON marks(user_id, mark_type, timestamp);")
+
+    print("✅ Tabla marks sin particionar restaurada")
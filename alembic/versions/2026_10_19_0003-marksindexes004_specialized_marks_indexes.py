@@ -0,0 +1,114 @@
+"""specialized_marks_indexes
+
+Revision ID: marksindexes004
+Revises: partitionmarks003
+Create Date: 2026-10-19 00:03:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'marksindexes004'
+down_revision: Union[str, None] = 'partitionmarks003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (nombre del índice padre, sufijo por partición, definición)
+NEW_INDEXES = (
+    # Rangos de tiempo de todos los usuarios (summary-report, archivado): marks es casi
+    # append-only, así que un BRIN de pocas páginas reemplaza al B-tree global de timestamp
+    (
+        "idx_marks_timestamp_brin", "ts_brin",
+        "USING brin (timestamp) WITH (pages_per_range = 32)",
+    ),
+    # Listados por usuario (my-marks, user/{id}) y reporte semanal: orden descendente
+    # nativo y columnas de proyección/validación sin visitar el heap
+    (
+        "idx_marks_user_timestamp_covering", "user_ts_cov",
+        "(user_id, timestamp DESC) INCLUDE (id, mark_type, po_number)",
+    ),
+    # Búsquedas del clock in de referencia (último antes de / siguiente después de)
+    (
+        "idx_marks_clock_in_user_timestamp", "clock_in_user_ts",
+        "(user_id, timestamp) INCLUDE (id, po_number) WHERE mark_type = 'CLOCK_IN'",
+    ),
+)
+
+# Cubiertos por los índices nuevos
+REDUNDANT_INDEXES = (
+    "idx_marks_user_id",
+    "idx_marks_timestamp",
+    "idx_marks_user_timestamp",
+    "idx_marks_user_type_timestamp",
+)
+
+
+def _partitions() -> list[str]:
+    result = op.get_bind().execute(sa.text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'marks'::regclass
+        ORDER BY c.relname
+    """))
+    return [row[0] for row in result]
+
+
+def _drop_if_invalid(index_name: str) -> None:
+    # Un CONCURRENTLY interrumpido deja un índice INVALID que IF NOT EXISTS no reconstruiría
+    invalid = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": index_name}).scalar()
+    if invalid:
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}";')
+
+
+def upgrade() -> None:
+    """
+    Índices especializados para marks sin bloquear escrituras.
+
+    marks está particionada y Postgres no admite CONCURRENTLY sobre la tabla padre, así que:
+      1. CREATE INDEX ... ON ONLY marks crea el índice padre vacío (inválido, instantáneo).
+      2. CREATE INDEX CONCURRENTLY en cada partición (fuera de la transacción).
+      3. ALTER INDEX ... ATTACH PARTITION; con todas adjuntas el padre queda válido y las
+         particiones futuras lo heredan al crearse.
+    """
+    for name, suffix, definition in NEW_INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY marks {definition};")
+
+    with op.get_context().autocommit_block():
+        for partition in _partitions():
+            for name, suffix, definition in NEW_INDEXES:
+                partition_index = f"{partition}_{suffix}"
+                _drop_if_invalid(partition_index)
+                op.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" '
+                    f'ON "{partition}" {definition};'
+                )
+                op.execute(f'ALTER INDEX {name} ATTACH PARTITION "{partition_index}";')
+
+    # Borrar un índice particionado no reescribe nada (lock breve sobre marks)
+    for name in REDUNDANT_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name};")
+
+    print("✅ Índices especializados de marks creados (BRIN, covering y parcial de clock in)")
+
+
+def downgrade() -> None:
+    """
+    Revertir la migración: restaurar los índices B-tree originales.
+    """
+    op.execute("CREATE INDEX IF NOT EXISTS idx_marks_user_id ON marks(user_id);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_marks_timestamp ON marks(timestamp);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_marks_user_timestamp ON marks(user_id, timestamp);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_marks_user_type_timestamp ON marks(user_id, mark_type, timestamp);")
+
+    for name, _, _ in NEW_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name};")
+
+    print("✅ Índices originales de marks restaurados")
@@ -0,0 +1,70 @@
+"""payroll_period_snapshots
+
+Revision ID: payrollperiods005
+Revises: marksindexes004
+Create Date: 2026-10-19 00:04:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'payrollperiods005'
+down_revision: Union[str, None] = 'marksindexes004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Periodos de nómina cerrados y sus snapshots inmutables.
+
+    - payroll_periods: rango del periodo (fechas y límites en timestamps de marks),
+      zona con la que se cerró, versión vigente y si está cerrado. Los rangos no pueden
+      traslaparse.
+    - payroll_snapshots: reporte semanal de cada usuario por versión, JSON comprimido
+      con zlib, más total_hours para el reporte sumario sin descomprimir.
+    """
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_periods (
+            id SERIAL PRIMARY KEY,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            timezone_offset_minutes INTEGER NOT NULL DEFAULT 0,
+            timezone VARCHAR(64),
+            range_start TIMESTAMP NOT NULL,
+            range_end TIMESTAMP NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            closed_at TIMESTAMP,
+            closed_by_id INTEGER REFERENCES "user"(id) ON DELETE SET NULL,
+            CONSTRAINT payroll_periods_no_overlap
+                EXCLUDE USING gist (tsrange(range_start, range_end, '[]') WITH &&)
+        );
+    """)
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS payroll_snapshots (
+            id SERIAL PRIMARY KEY,
+            period_id INTEGER NOT NULL REFERENCES payroll_periods(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+            version INTEGER NOT NULL,
+            total_hours DOUBLE PRECISION NOT NULL,
+            data BYTEA NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            CONSTRAINT payroll_snapshots_period_user_version UNIQUE (period_id, version, user_id)
+        );
+    """)
+
+    print("✅ Tablas payroll_periods y payroll_snapshots creadas correctamente")
+
+
+def downgrade() -> None:
+    """
+    Revertir la migración: Eliminar las tablas de periodos de nómina.
+    """
+    op.execute("DROP TABLE IF EXISTS payroll_snapshots;")
+    op.execute("DROP TABLE IF EXISTS payroll_periods;")
+
+    print("✅ Tablas de periodos de nómina eliminadas correctamente")
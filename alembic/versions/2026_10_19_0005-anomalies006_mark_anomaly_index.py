@@ -0,0 +1,164 @@
+"""mark_anomaly_index
+
+Revision ID: anomalies006
+Revises: payrollperiods005
+Create Date: 2026-10-19 00:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'anomalies006'
+down_revision: Union[str, None] = 'payrollperiods005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Ediciones recientes: índice parcial (solo filas editadas alguna vez)
+UPDATED_AT_INDEX = "idx_marks_updated_at"
+UPDATED_AT_DEFINITION = "(updated_at) WHERE updated_at IS NOT NULL"
+
+
+def _partitions() -> list[str]:
+    result = op.get_bind().execute(sa.text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'marks'::regclass
+        ORDER BY c.relname
+    """))
+    return [row[0] for row in result]
+
+
+def _drop_if_invalid(index_name: str) -> None:
+    invalid = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": index_name}).scalar()
+    if invalid:
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}";')
+
+
+def upgrade() -> None:
+    """
+    Índice de anomalías de marcas mantenido de forma incremental (ver app/marks/anomalies.py).
+
+    - marks.updated_at: lo fija un trigger cuando cambian las columnas que usa el escaneo
+      (timestamp, mark_type, po_number, user_id); la dirección del geocoding no cuenta.
+    - marks_rescan_queue: posición anterior de las marcas eliminadas o movidas (trigger;
+      se omite con SET LOCAL app.skip_anomaly_rescan = 'on', como en el archivo de marcas).
+    - mark_anomalies: sesiones abiertas/largas, clock outs huérfanos y PO distintos.
+    - anomaly_scan_state: marcas de agua del último escaneo (una sola fila).
+    """
+    # Columna nullable sin default: solo cambia el catálogo, no reescribe particiones
+    op.execute("ALTER TABLE marks ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;")
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION marks_touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now() AT TIME ZONE 'utc';
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("DROP TRIGGER IF EXISTS marks_touch_updated_at ON marks;")
+    op.execute("""
+        CREATE TRIGGER marks_touch_updated_at
+        BEFORE UPDATE OF timestamp, mark_type, po_number, user_id ON marks
+        FOR EACH ROW
+        WHEN (
+            OLD.timestamp IS DISTINCT FROM NEW.timestamp
+            OR OLD.mark_type IS DISTINCT FROM NEW.mark_type
+            OR OLD.po_number IS DISTINCT FROM NEW.po_number
+            OR OLD.user_id IS DISTINCT FROM NEW.user_id
+        )
+        EXECUTE FUNCTION marks_touch_updated_at();
+    """)
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS marks_rescan_queue (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL
+        );
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION marks_queue_rescan() RETURNS trigger AS $$
+        BEGIN
+            -- El archivo de marcas (app/marks/archive.py) borra meses completos: no son
+            -- ediciones y no deben vaciar las anomalías de esos meses
+            IF current_setting('app.skip_anomaly_rescan', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            INSERT INTO marks_rescan_queue (user_id, timestamp) VALUES (OLD.user_id, OLD.timestamp);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("DROP TRIGGER IF EXISTS marks_queue_rescan ON marks;")
+    op.execute("""
+        CREATE TRIGGER marks_queue_rescan
+        AFTER DELETE OR UPDATE OF timestamp, user_id ON marks
+        FOR EACH ROW EXECUTE FUNCTION marks_queue_rescan();
+    """)
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS mark_anomalies (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+            kind VARCHAR(32) NOT NULL,
+            mark_id INTEGER NOT NULL,
+            mark_timestamp TIMESTAMP NOT NULL,
+            detail JSONB,
+            detected_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            CONSTRAINT mark_anomalies_kind_mark UNIQUE (kind, mark_id)
+        );
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mark_anomalies_user_timestamp
+        ON mark_anomalies(user_id, mark_timestamp);
+    """)
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS anomaly_scan_state (
+            id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            last_mark_id INTEGER NOT NULL DEFAULT 0,
+            last_updated_at TIMESTAMP,
+            last_scanned_at TIMESTAMP
+        );
+    """)
+    op.execute("INSERT INTO anomaly_scan_state (id) VALUES (1) ON CONFLICT DO NOTHING;")
+
+    # Mismo esquema que marksindexes004: padre ON ONLY y CONCURRENTLY por partición
+    op.execute(f"CREATE INDEX IF NOT EXISTS {UPDATED_AT_INDEX} ON ONLY marks {UPDATED_AT_DEFINITION};")
+    with op.get_context().autocommit_block():
+        for partition in _partitions():
+            partition_index = f"{partition}_updated_at"
+            _drop_if_invalid(partition_index)
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" '
+                f'ON "{partition}" {UPDATED_AT_DEFINITION};'
+            )
+            op.execute(f'ALTER INDEX {UPDATED_AT_INDEX} ATTACH PARTITION "{partition_index}";')
+
+    print("✅ Índice de anomalías de marcas creado correctamente")
+
+
+def downgrade() -> None:
+    """
+    Revertir la migración: Eliminar el índice de anomalías y sus triggers.
+    """
+    op.execute(f"DROP INDEX IF EXISTS {UPDATED_AT_INDEX};")
+    op.execute("DROP TABLE IF EXISTS anomaly_scan_state;")
+    op.execute("DROP TABLE IF EXISTS mark_anomalies;")
+    op.execute("DROP TRIGGER IF EXISTS marks_queue_rescan ON marks;")
+    op.execute("DROP FUNCTION IF EXISTS marks_queue_rescan();")
+    op.execute("DROP TABLE IF EXISTS marks_rescan_queue;")
+    op.execute("DROP TRIGGER IF EXISTS marks_touch_updated_at ON marks;")
+    op.execute("DROP FUNCTION IF EXISTS marks_touch_updated_at();")
+    op.execute("ALTER TABLE marks DROP COLUMN IF EXISTS updated_at;")
+
+    print("✅ Índice de anomalías de marcas eliminado correctamente")
@@ -0,0 +1,81 @@
+"""marks_timestamp_desc_index
+
+Revision ID: markstimestamp007
+Revises: anomalies006
+Create Date: 2026-10-19 00:06:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'markstimestamp007'
+down_revision: Union[str, None] = 'anomalies006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Listado de todos los usuarios (GET /marks/all: ORDER BY timestamp DESC LIMIT n). El BRIN
+# de marksindexes004 no da orden, así que sin este índice se ordenaba la tabla completa
+TIMESTAMP_DESC_INDEX = "idx_marks_timestamp_desc"
+TIMESTAMP_DESC_DEFINITION = "(timestamp DESC)"
+
+# Reemplazado: el B-tree también resuelve los rangos de tiempo (summary-report, archivado)
+BRIN_INDEX = "idx_marks_timestamp_brin"
+BRIN_DEFINITION = "USING brin (timestamp) WITH (pages_per_range = 32)"
+
+
+def _partitions() -> list[str]:
+    result = op.get_bind().execute(sa.text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'marks'::regclass
+        ORDER BY c.relname
+    """))
+    return [row[0] for row in result]
+
+
+def _drop_if_invalid(index_name: str) -> None:
+    invalid = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": index_name}).scalar()
+    if invalid:
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}";')
+
+
+def upgrade() -> None:
+    """
+    Índice B-tree descendente de timestamp para el listado de marcas de todos los usuarios.
+    Con él, el Append ordenado lee las particiones más recientes y se detiene en el LIMIT.
+    Los rangos de una semana también lo usan, así que el BRIN de timestamp sobra.
+    """
+    # Mismo esquema que marksindexes004: padre ON ONLY y CONCURRENTLY por partición
+    op.execute(f"CREATE INDEX IF NOT EXISTS {TIMESTAMP_DESC_INDEX} ON ONLY marks {TIMESTAMP_DESC_DEFINITION};")
+    with op.get_context().autocommit_block():
+        for partition in _partitions():
+            partition_index = f"{partition}_ts_desc"
+            _drop_if_invalid(partition_index)
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" '
+                f'ON "{partition}" {TIMESTAMP_DESC_DEFINITION};'
+            )
+            op.execute(f'ALTER INDEX {TIMESTAMP_DESC_INDEX} ATTACH PARTITION "{partition_index}";')
+
+    # Borrar un índice particionado no reescribe nada (lock breve sobre marks)
+    op.execute(f"DROP INDEX IF EXISTS {BRIN_INDEX};")
+
+    print("✅ Índice descendente de timestamp de marks creado correctamente")
+
+
+def downgrade() -> None:
+    """
+    Revertir la migración: restaurar el BRIN y eliminar el índice descendente de timestamp.
+    """
+    op.execute(f"CREATE INDEX IF NOT EXISTS {BRIN_INDEX} ON marks {BRIN_DEFINITION};")
+    op.execute(f"DROP INDEX IF EXISTS {TIMESTAMP_DESC_INDEX};")
+
+    print("✅ Índice descendente de timestamp de marks eliminado correctamente")
@@ -0,0 +1,215 @@
+"""
+Control de admisión y rate limit por usuario (middleware ASGI).
+
+Cada request cae en una clase según su método y ruta:
+- critical: clock in/out (latencia de los empleados)
+- heavy: reportes, exportaciones y operaciones masivas, con su propio semáforo chico
+- default: todo lo demás
+Cada clase tiene su límite de concurrencia y un plazo máximo de espera en cola. Si la
+espera estimada ya supera el plazo (cola × duración media / concurrencia) el request se
+rechaza al instante con 503 y Retry-After, sin esperar a que venza; así una ráfaga de
+reportes no ocupa los slots ni retrasa los clock in/out.
+
+Además, un token bucket por usuario (el del token si ya está en el cache de
+autenticación o, si no, IP del cliente) responde 429 con Retry-After a quien supera
+RATE_LIMIT_PER_SECOND.
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.core.metrics import registry, Counter, Gauge
+from app.users.cache import auth_cache
+
+# (clase, método, patrón de la ruta); la primera coincidencia gana
+ROUTE_CLASSES = (
+    ("critical", "POST", re.compile(r"^/marks/clock-(in|out)$")),
+    ("heavy", "GET", re.compile(r"^/marks/(weekly-report/[^/]+|summary-report|analytics/.*)$")),
+    ("heavy", "POST", re.compile(r"^/marks/(bulk|archive|anomalies/scan|payroll-periods/close)$")),
+    ("heavy", "POST", re.compile(r"^/admin/users/bulk$")),
+)
+
+# Sin control de admisión: health checks y streams de larga duración (ocuparían un slot)
+EXEMPT_PATHS = re.compile(r"^/(health|metrics|marks/live)$")
+
+# Buckets de usuarios distintos que se recuerdan por worker (se descartan los más viejos)
+MAX_BUCKETS = 10000
+
+# Peso de cada request nuevo en la duración media de su clase
+SERVICE_TIME_ALPHA = 0.2
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Clase de admisión del request (None si está exento)."""
+    if EXEMPT_PATHS.match(path):
+        return None
+    for name, route_method, pattern in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            return name
+    return "default"
+
+
+class AdmissionClass:
+    """Semáforo con cola acotada por tiempo y duración media de servicio (EWMA)."""
+
+    def __init__(self, name: str, concurrency: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_time = 0.0
+
+    def expected_wait(self) -> float:
+        if self.in_flight < self.concurrency:
+            return 0.0
+        return (self.waiting + 1) * self.service_time / self.concurrency
+
+    async def acquire(self) -> bool:
+        """False si el request se debe rechazar (espera estimada o real mayor al plazo)."""
+        if self.expected_wait() > self.queue_timeout:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self, duration: float) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+        if self.service_time == 0.0:
+            self.service_time = duration
+        else:
+            self.service_time += SERVICE_TIME_ALPHA * (duration - self.service_time)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait() or self.queue_timeout))
+
+
+class TokenBucketLimiter:
+    """Un token bucket por llave: `rate` tokens por segundo, hasta `burst` acumulados."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """Consume un token. Devuelve 0 si se admite, o los segundos hasta el próximo token."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens >= 1.0:
+            self._buckets[key] = (tokens - 1.0, now)
+            wait = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            wait = (1.0 - tokens) / self.rate
+        if len(self._buckets) > MAX_BUCKETS:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def _client_key(scope) -> str:
+    """
+    Llave del rate limit: el usuario del bearer token si el token ya se verificó antes
+    (está en auth_cache); aquí no se verifica ningún JWT, eso queda para la autenticación
+    de la ruta. Con un token desconocido o sin token, la IP del cliente: así rotar tokens
+    falsos no da buckets nuevos, y el primer request de un token válido cuenta para su IP.
+    """
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"")
+    token = authorization[7:] if authorization[:7].lower() == b"bearer " else b""
+    if not token and scope.get("query_string"):
+        match = re.search(rb"(?:^|&)access_token=([^&]+)", scope["query_string"])
+        token = match.group(1) if match else b""
+    if token:
+        user_id = auth_cache.user_id(token.decode("latin-1"))
+        if user_id is not None:
+            return f"u:{user_id}"
+    # Detrás del proxy de Fly la IP real viene en Fly-Client-IP (la fija el proxy);
+    # X-Forwarded-For no: el cliente lo puede mandar con cualquier valor
+    client_ip = headers.get(b"fly-client-ip", b"")
+    if not client_ip and scope.get("client"):
+        client_ip = scope["client"][0].encode()
+    return "ip:" + client_ip.decode("latin-1")
+
+
+async def _reject(send, status: int, detail: str, retry_after: int) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: rate limit por usuario y concurrencia por clase de ruta."""
+
+    def __init__(
+        self,
+        app,
+        limits: dict[str, tuple[int, float]],
+        rate_per_second: float = 0.0,
+        burst: int = 0,
+    ):
+        self.app = app
+        self.classes = {
+            name: AdmissionClass(name, concurrency, queue_timeout)
+            for name, (concurrency, queue_timeout) in limits.items()
+        }
+        self.limiter = TokenBucketLimiter(rate_per_second, burst) if rate_per_second > 0 else None
+        for admission_class in self.classes.values():
+            admission_in_flight.set_function(lambda c=admission_class: c.in_flight, admission_class.name)
+            admission_waiting.set_function(lambda c=admission_class: c.waiting, admission_class.name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.limiter is not None:
+            wait = self.limiter.take(_client_key(scope))
+            if wait > 0:
+                admission_rejected.inc(name, "rate_limited")
+                await _reject(send, 429, "Too many requests", max(1, math.ceil(wait)))
+                return
+
+        admission_class = self.classes[name]
+        if not await admission_class.acquire():
+            admission_rejected.inc(name, "shed")
+            await _reject(send, 503, "Server busy, retry later", admission_class.retry_after())
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_class.release(time.perf_counter() - start)
+
+
+admission_rejected = registry.register(Counter(
+    "admission_rejected_total", "Requests rejected by admission control", ("class", "reason")
+))
+admission_in_flight = registry.register(Gauge("admission_in_flight", "Requests running per admission class", ("class",)))
+admission_waiting = registry.register(Gauge("admission_waiting", "Requests queued per admission class", ("class",)))
@@ -1,7 +1,9 @@
+from functools import lru_cache
 from app.core.env_vars import EnvVars
 
+@lru_cache(maxsize=None)
 def get_env_vars() -> EnvVars:
     """
-    Returns an instance of the EnvVars class.
+    Returns the cached EnvVars instance (.env is read once per process).
     """
     return EnvVars()
\ No newline at end of file
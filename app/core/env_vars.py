@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
 
@@ -9,10 +10,126 @@ class EnvVars(BaseSettings):
     # Postgres connection string
     POSTGRES_DATABASE_URL: str
 
+    # Pool de conexiones (por worker y por engine)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_PRE_PING: bool = True
+    # Conexiones que se abren en segundo plano al arrancar (0 = abrir bajo demanda)
+    DB_PREWARM_CONNECTIONS: int = 2
+
+    # Presupuesto de conexiones del cluster: el pool de cada worker se recorta a
+    # DB_CLUSTER_MAX_CONNECTIONS / (DB_INSTANCE_COUNT * WEB_CONCURRENCY)
+    DB_CLUSTER_MAX_CONNECTIONS: Optional[int] = None
+    DB_INSTANCE_COUNT: int = 1
+    WEB_CONCURRENCY: int = 2
+
+    # PgBouncer en modo transacción (desactiva prepared statements cacheados;
+    # con DB_POOL_SIZE=0 usa NullPool y deja el pooling a PgBouncer)
+    DB_PGBOUNCER_TRANSACTION_MODE: bool = False
+    # Conexión directa a Postgres (sin PgBouncer) para LISTEN y advisory locks de sesión,
+    # que no funcionan en modo transacción; obligatoria con DB_PGBOUNCER_TRANSACTION_MODE
+    POSTGRES_DIRECT_URL: Optional[str] = None
+
+    # Réplica de lectura opcional (reportes y listados)
+    POSTGRES_READ_REPLICA_URL: Optional[str] = None
+    READ_REPLICA_MAX_LAG_SECONDS: float = 5.0
+    READ_REPLICA_LAG_CHECK_SECONDS: float = 5.0
+    # Ventana en la que las lecturas de un usuario van al primary tras escribir
+    READ_YOUR_WRITES_SECONDS: float = 10.0
+
+    # Logging (JSON por línea, escrito desde un hilo aparte)
+    LOG_LEVEL: str = "INFO"
+    # Se registra 1 de cada N mensajes de geocodificación (los errores siempre)
+    LOG_GEOCODING_SAMPLE_EVERY: int = 10
+
+    # Métricas Prometheus en /metrics (pool, SQL por ruta, latencia HTTP); desactivadas por
+    # defecto: exponen rutas y tiempos. Con METRICS_TOKEN el scrape exige Bearer <token>
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: Optional[str] = None
+
+    # Archivo en frío de marcas (archivos Arrow por mes; montar un volumen en producción)
+    ARCHIVE_DIR: str = "archive"
+    ARCHIVE_DELETE_BATCH_SIZE: int = 5000
+
+    # Profiler de requests lentos (sin costo si está desactivado)
+    PROFILER_ENABLED: bool = False
+    PROFILER_SLOW_MS: float = 1000.0
+    # Fracción de requests que se capturan aunque no sean lentos
+    PROFILER_SAMPLE_RATE: float = 0.0
+    PROFILER_BUFFER_SIZE: int = 100
+    PROFILER_MAX_STATEMENTS: int = 200
+    # Muestreo de stacks del event loop (0 = desactivado)
+    PROFILER_STACK_INTERVAL_MS: float = 0.0
+
+    # Control de admisión por clase de ruta (por worker): concurrencia y espera máxima en cola
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_CRITICAL_CONCURRENCY: int = 20
+    ADMISSION_CRITICAL_QUEUE_SECONDS: float = 10.0
+    ADMISSION_DEFAULT_CONCURRENCY: int = 10
+    ADMISSION_DEFAULT_QUEUE_SECONDS: float = 2.0
+    ADMISSION_HEAVY_CONCURRENCY: int = 4
+    ADMISSION_HEAVY_QUEUE_SECONDS: float = 5.0
+    # Rate limit por usuario (token bucket; 0 lo desactiva)
+    RATE_LIMIT_PER_SECOND: float = 10.0
+    RATE_LIMIT_BURST: int = 40
+
+    # Presupuesto de queries por ruta: off, log o raise (ver app/core/query_budget.py;
+    # las pruebas lo aplican siempre)
+    QUERY_BUDGET_MODE: str = "off"
+
+    # Feed en vivo de marcas (SSE en /marks/live)
+    LIVE_CLIENT_BUFFER_SIZE: int = 256
+    LIVE_MAX_SUBSCRIBERS: int = 500
+    LIVE_KEEPALIVE_SECONDS: float = 15.0
+
+    # Índice de anomalías de marcas (escaneo incremental; 0 desactiva el escaneo en segundo plano)
+    ANOMALY_OPEN_SESSION_HOURS: float = 16.0
+    ANOMALY_SCAN_INTERVAL_SECONDS: int = 300
+
+    # Heatmap de horas (GET /marks/analytics/heatmap): tiempo máximo de la consulta y
+    # duración máxima de una sesión que se cuenta
+    ANALYTICS_STATEMENT_TIMEOUT_MS: int = 10000
+    ANALYTICS_MAX_SESSION_HOURS: int = 24
+
+    # SMTP del digest semanal (scripts/send_weekly_digests.py)
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    # TLS implícito (puerto 465); sin él se usa STARTTLS si el servidor lo ofrece
+    SMTP_USE_TLS: bool = False
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+    DIGEST_FROM_EMAIL: str = "reports@localhost"
+    # Emails separados por coma que reciben el resumen de horas de todos
+    DIGEST_ADMIN_EMAILS: str = ""
+    # Conexiones SMTP en paralelo (cada una se reutiliza para todos sus envíos)
+    DIGEST_SMTP_CONNECTIONS: int = 1
+    DIGEST_MAX_RETRIES: int = 3
+    # No enviar el digest a quien no tiene marcas en la semana
+    DIGEST_SKIP_EMPTY: bool = True
+
     # JWT config
     JWT_SECRET: str
     JWT_LIFETIME_SECONDS: int = 86400
 
+    # Cache de usuarios autenticados (0 desactiva el cache)
+    # El TTL es el máximo tiempo que un is_active/is_superuser puede quedar obsoleto
+    AUTH_CACHE_TTL_SECONDS: int = 30
+    AUTH_CACHE_MAX_ENTRIES: int = 2048
+
+    # Hash de contraseñas (Argon2id) fuera del event loop
+    # Cambiar los parámetros rehashea cada contraseña en el siguiente login
+    PASSWORD_HASH_WORKERS: int = 2
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST_KIB: int = 65536
+    ARGON2_PARALLELISM: int = 4
+
+    # Alta masiva de usuarios (POST /admin/users/bulk, scripts/import_users.py)
+    USER_IMPORT_HASH_WORKERS: int = 4
+    USER_IMPORT_MAX_ROWS: int = 10000
+
     model_config = ConfigDict(
         env_file=".env",
         case_sensitive=True,
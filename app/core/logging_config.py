@@ -1,21 +1,138 @@
+import atexit
+import itertools
+import json
 import logging
+import queue
 import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from uuid import uuid4
+
+# Id del request en curso (lo fija RequestIdMiddleware; "-" fuera de un request)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# Logger de los mensajes de geocodificación (uno por marca: se muestrean)
+GEOCODING_LOGGER = "app.marks.geocoding"
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    """
+    QueueHandler que deja el registro listo para otro hilo: agrega el request id
+    (el contextvar solo existe en el hilo/tarea que loguea), resuelve el mensaje
+    y serializa el traceback, sin formatear el JSON en el event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Deja pasar 1 de cada `every` registros por debajo de ERROR (los errores pasan siempre)."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        return next(self._counter) % self.every == 0
+
+
+class RequestIdMiddleware:
+    """
+    Middleware ASGI: toma X-Request-ID del cliente (o genera uno), lo publica en
+    `request_id_var` para los logs y lo devuelve en la respuesta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((REQUEST_ID_HEADER.encode(), request_id.encode("latin-1")))
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
 
 # Configure logging
-def setup_logging() -> None:
-    # Define a custom formatter
-    formatter = logging.Formatter(
-        fmt='%(asctime)s | %(levelname)-8s | %(name)s:%(lineno)d | %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # Configure console handler
+def setup_logging(level: str = "INFO", geocoding_sample_every: int = 10) -> None:
+    """
+    Logging no bloqueante: los handlers del proceso solo encolan (QueueHandler) y un
+    hilo (QueueListener) formatea en JSON y escribe a stdout.
+    Los loggers de uvicorn se redirigen al mismo flujo.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
+    console_handler.setFormatter(JsonFormatter())
+
+    _listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
     # Configure root logger
     logging.basicConfig(
-        level=logging.INFO,
-        handlers=[console_handler],
+        level=level.upper(),
+        handlers=[RequestQueueHandler(log_queue)],
         force=True
-    )
\ No newline at end of file
+    )
+
+    # uvicorn instala sus propios StreamHandler síncronos: pasar por la cola
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    logging.getLogger(GEOCODING_LOGGER).addFilter(SampleFilter(geocoding_sample_every))
@@ -0,0 +1,239 @@
+"""
+Profiler de requests lentos (opt-in con PROFILER_ENABLED).
+
+Por cada request mide tiempo total, tiempo en la base, número de queries y lag del
+event loop. Los requests que superan PROFILER_SLOW_MS (o una fracción muestreada)
+se guardan con su SQL y, opcionalmente, un perfil de stacks muestreados en un ring
+buffer en memoria que expone GET /admin/profiles.
+
+Con el profiler desactivado ni el middleware ni los eventos de SQLAlchemy se registran.
+"""
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.core.logging_config import request_id_var
+
+# Largo máximo de cada statement guardado
+MAX_STATEMENT_CHARS = 2000
+
+# Frames por stack y stacks distintos que se reportan por captura
+MAX_STACK_DEPTH = 40
+TOP_STACKS = 20
+
+# Cada cuánto mide el lag del event loop
+LOOP_LAG_INTERVAL_SECONDS = 0.05
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, max_statements: int):
+        self.method = method
+        self.path = path
+        self.route = "-"
+        self.status = 500
+        self.request_id = request_id_var.get()
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.wall_ms = 0.0
+        self.db_ms = 0.0
+        self.query_count = 0
+        self.loop_lag_ms = 0.0
+        self.max_statements = max_statements
+        self.statements: list[dict] = []
+        self.stacks: Counter = Counter()
+
+    def record_statement(self, engine: str, statement: str, duration: float) -> None:
+        self.query_count += 1
+        self.db_ms += duration * 1000
+        if len(self.statements) < self.max_statements:
+            self.statements.append({
+                "engine": engine,
+                "sql": statement[:MAX_STATEMENT_CHARS],
+                "ms": round(duration * 1000, 2),
+            })
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "wall_ms": round(self.wall_ms, 2),
+            "db_ms": round(self.db_ms, 2),
+            "query_count": self.query_count,
+            "loop_lag_ms": round(self.loop_lag_ms, 2),
+            "statements": self.statements,
+            "stacks": [
+                {"stack": stack, "samples": count}
+                for stack, count in self.stacks.most_common(TOP_STACKS)
+            ],
+        }
+
+
+# Perfil del request en curso (None fuera de un request perfilado)
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def profile_engine(engine: AsyncEngine, name: str) -> None:
+    """Acumula tiempo y SQL de cada statement en el perfil del request actual."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._profile_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        start = getattr(context, "_profile_start", None)
+        if profile is not None and start is not None:
+            profile.record_statement(name, statement, time.perf_counter() - start)
+
+
+class LoopLagMonitor:
+    """Tarea que mide cuánto se atrasa el event loop en despertar (ventana de pocos segundos)."""
+
+    def __init__(self, window_seconds: float = 120.0):
+        self._samples: deque = deque(maxlen=int(window_seconds / LOOP_LAG_INTERVAL_SECONDS))
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_started(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + LOOP_LAG_INTERVAL_SECONDS
+            await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+            now = time.perf_counter()
+            self._samples.append((now, max(0.0, now - expected)))
+
+    def max_lag_since(self, start: float) -> float:
+        return max((lag for at, lag in reversed(self._samples) if at >= start), default=0.0)
+
+
+class StackSampler:
+    """
+    Hilo que muestrea el stack del hilo del event loop cada `interval` y lo atribuye
+    al request cuya tarea está corriendo en ese momento.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: dict[asyncio.Task, RequestProfile] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def ensure_started(self) -> None:
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def attach(self, profile: RequestProfile) -> None:
+        self._active[asyncio.current_task()] = profile
+
+    def detach(self) -> None:
+        self._active.pop(asyncio.current_task(), None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            profile = self._active.get(asyncio.current_task(self._loop))
+            if profile is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            profile.stacks[";".join(reversed(stack))] += 1
+
+
+class ProfilerMiddleware:
+    """
+    Middleware ASGI: perfila cada request y guarda en `captures` los lentos o muestreados.
+    """
+
+    def __init__(
+        self,
+        app,
+        slow_ms: float,
+        sample_rate: float,
+        buffer_size: int,
+        max_statements: int,
+        stack_interval_ms: Optional[float] = None,
+    ):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_statements = max_statements
+        self.lag_monitor = LoopLagMonitor()
+        self.stack_sampler = StackSampler(stack_interval_ms / 1000) if stack_interval_ms else None
+        profile_buffer.resize(buffer_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.lag_monitor.ensure_started()
+        profile = RequestProfile(scope["method"], scope["path"], self.max_statements)
+        token = current_profile.set(profile)
+        if self.stack_sampler is not None:
+            self.stack_sampler.ensure_started()
+            self.stack_sampler.attach(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self.stack_sampler is not None:
+                self.stack_sampler.detach()
+            current_profile.reset(token)
+            profile.wall_ms = (time.perf_counter() - profile.start) * 1000
+            if profile.wall_ms >= self.slow_ms or random.random() < self.sample_rate:
+                route = scope.get("route")
+                profile.route = getattr(route, "path", "-")
+                profile.loop_lag_ms = self.lag_monitor.max_lag_since(profile.start) * 1000
+                profile_buffer.append(profile)
+
+
+class ProfileBuffer:
+    """Ring buffer de capturas (las más viejas se descartan)."""
+
+    def __init__(self, size: int = 100):
+        self._captures: deque = deque(maxlen=size)
+
+    def resize(self, size: int) -> None:
+        self._captures = deque(self._captures, maxlen=size)
+
+    def append(self, profile: RequestProfile) -> None:
+        self._captures.append(profile)
+
+    def snapshot(self) -> list[dict]:
+        """Capturas, más recientes primero."""
+        return [profile.to_dict() for profile in reversed(self._captures)]
+
+    def clear(self) -> None:
+        self._captures.clear()
+
+
+profile_buffer = ProfileBuffer()
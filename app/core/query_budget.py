@@ -0,0 +1,145 @@
+"""
+Presupuesto de queries por ruta (guarda contra N+1 y round trips nuevos).
+
+Cuenta los statements SQL de cada request con eventos del engine y los compara con el
+presupuesto declarado para su ruta en ROUTE_QUERY_BUDGETS. Las pruebas lo aplican a cada
+request del fixture `client` (tests/conftest.py) y fallan si una ruta se pasa. En la app,
+QUERY_BUDGET_MODE lo activa para depurar contra una base local:
+- "off" (por defecto): ni el middleware ni los eventos se registran.
+- "log": al terminar el request registra un warning con los statements si se pasó.
+- "raise": el statement que excede el presupuesto falla con QueryBudgetExceeded (500).
+
+Los presupuestos cuentan el peor caso de cada ruta, incluida la carga del usuario
+autenticado cuando no está en el cache y el chequeo de lag de la réplica.
+"""
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Callable, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.core.metrics import registry, Counter
+
+logger = logging.getLogger(__name__)
+
+# Statements guardados por request para el mensaje de error (y largo máximo de cada uno)
+MAX_RECORDED_STATEMENTS = 50
+MAX_STATEMENT_CHARS = 500
+
+# (método, plantilla de la ruta) -> statements máximos por request
+ROUTE_QUERY_BUDGETS: dict[tuple[str, str], int] = {
+    # auth + INSERT + versión + NOTIFY + refresh
+    ("POST", "/marks/clock-in"): 5,
+    ("POST", "/marks/clock-out"): 5,
+    # auth + lag de réplica + versión + listado
+    ("GET", "/marks/my-marks"): 4,
+    ("GET", "/marks/all"): 3,
+    # auth + lag + usuario + periodo cerrado + snapshot o marcas
+    ("GET", "/marks/weekly-report/{user_id}"): 5,
+    # auth + lag + usuarios + periodo cerrado + totales o marcas (nunca una query por usuario)
+    ("GET", "/marks/summary-report"): 5,
+    # auth + lag + statement_timeout + heatmap
+    ("GET", "/marks/analytics/heatmap"): 4,
+    # auth + marca + periodos cerrados (lock + 2) + lock de meses archivando + partición
+    # + validación del clock out (4) + UPDATE + versión + NOTIFY + refresh
+    ("PUT", "/marks/{mark_id}"): 15,
+    # auth + usuario + periodo cerrado (lock + 1) + lock de meses archivando + validación (3)
+    # + partición + INSERT + versión + NOTIFY + refresh
+    ("POST", "/marks/create"): 13,
+    # auth + marca + periodo cerrado (lock + 1) + lock de meses archivando + DELETE
+    # + versión + NOTIFY
+    ("DELETE", "/marks/{mark_id}"): 8,
+    # auth + marcas del lote + periodos cerrados (lock + 1) + lock de meses archivando
+    # + particiones + vecindarios + UPDATE + DELETE + versiones + NOTIFY (todo por lote)
+    ("POST", "/marks/bulk"): 11,
+}
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class RequestQueries:
+    """Statements de un request y el presupuesto de su ruta (se resuelve al hacer match)."""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        # Las tareas de fondo que lance el request (geocodificación) heredan el contextvar
+        # pero no cuentan: solo los statements de la tarea del request
+        self.task = asyncio.current_task()
+        self.count = 0
+        self.statements: list[str] = []
+
+    @property
+    def route(self) -> str:
+        return getattr(self.scope.get("route"), "path", "-")
+
+    @property
+    def budget(self) -> Optional[int]:
+        return ROUTE_QUERY_BUDGETS.get((self.scope["method"], self.route))
+
+    def record(self, statement: str) -> None:
+        self.count += 1
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append(" ".join(statement.split())[:MAX_STATEMENT_CHARS])
+
+    def describe(self) -> str:
+        lines = [f"  {index}. {statement}" for index, statement in enumerate(self.statements, start=1)]
+        return (
+            f"{self.scope['method']} {self.route} ran {self.count} SQL statements "
+            f"(budget {self.budget}):\n" + "\n".join(lines)
+        )
+
+
+# Queries del request en curso (None fuera de un request)
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+def watch_engine(engine: AsyncEngine, raise_on_exceed: bool) -> None:
+    """Cuenta cada statement del engine en el request actual."""
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries = current_queries.get()
+        if queries is None or asyncio.current_task() is not queries.task:
+            return
+        queries.record(statement)
+        if raise_on_exceed:
+            budget = queries.budget
+            if budget is not None and queries.count > budget:
+                raise QueryBudgetExceeded(queries.describe())
+
+
+class QueryBudgetMiddleware:
+    """
+    Middleware ASGI: abre el conteo del request y reporta los que exceden su presupuesto
+    (warning, o `on_exceeded` si se pasa: las pruebas juntan los requests para fallar).
+    """
+
+    def __init__(self, app, on_exceeded: Optional[Callable[[RequestQueries], None]] = None):
+        self.app = app
+        self.on_exceeded = on_exceeded
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+        token = current_queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_queries.reset(token)
+            budget = queries.budget
+            if budget is not None and queries.count > budget:
+                query_budget_exceeded.inc(scope["method"], queries.route)
+                if self.on_exceeded is not None:
+                    self.on_exceeded(queries)
+                else:
+                    logger.warning("Query budget exceeded: %s", queries.describe())
+
+
+query_budget_exceeded = registry.register(Counter(
+    "query_budget_exceeded_total", "Requests that ran more SQL statements than their route budget", ("method", "route")
+))
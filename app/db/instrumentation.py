@@ -0,0 +1,96 @@
+import time
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.metrics import registry, Counter, Gauge, Histogram, current_route
+
+pool_checkout_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ("engine",),
+))
+pool_checkouts = registry.register(Counter(
+    "db_pool_checkouts_total",
+    "Connections checked out from the pool",
+    ("engine",),
+))
+pool_connections_opened = registry.register(Counter(
+    "db_pool_connections_opened_total",
+    "New DBAPI connections opened by the pool",
+    ("engine",),
+))
+pool_connections_recycled = registry.register(Counter(
+    "db_pool_connections_recycled_total",
+    "Pool slots that reconnected (pool_recycle, invalidation or failed pre-ping)",
+    ("engine",),
+))
+pool_connections_closed = registry.register(Counter(
+    "db_pool_connections_closed_total",
+    "DBAPI connections closed by the pool",
+    ("engine",),
+))
+pool_size = registry.register(Gauge("db_pool_size", "Configured pool size", ("engine",)))
+pool_in_use = registry.register(Gauge("db_pool_in_use", "Connections currently checked out", ("engine",)))
+pool_idle = registry.register(Gauge("db_pool_idle", "Idle connections in the pool", ("engine",)))
+pool_overflow = registry.register(Gauge("db_pool_overflow", "Current overflow connections", ("engine",)))
+statement_duration = registry.register(Histogram(
+    "db_statement_duration_seconds",
+    "SQL statement latency by route",
+    ("engine", "route", "operation"),
+))
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool que mide cuánto espera cada checkout por una conexión."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - start, self._orig_logging_name or "primary")
+
+
+def _pool_stat(engine: AsyncEngine, method: str) -> float:
+    # engine.dispose() reemplaza el pool, así que se resuelve en cada scrape;
+    # NullPool no lleva estas cuentas
+    fn = getattr(engine.sync_engine.pool, method, None)
+    return fn() if fn is not None else 0
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """Registra eventos de pool y de cursor para exponer métricas del engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        pool_connections_opened.inc(name)
+        # El mismo registro reconectando = conexión reciclada o invalidada
+        if connection_record.info.get("_metrics_connected"):
+            pool_connections_recycled.inc(name)
+        connection_record.info["_metrics_connected"] = True
+
+    @event.listens_for(sync_engine, "close")
+    def _on_close(dbapi_connection, connection_record):
+        pool_connections_closed.inc(name)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_checkouts.inc(name)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "-"
+        statement_duration.observe(time.perf_counter() - start, name, current_route(), operation)
+
+    pool_size.set_function(lambda: _pool_stat(engine, "size"), name)
+    pool_in_use.set_function(lambda: _pool_stat(engine, "checkedout"), name)
+    pool_idle.set_function(lambda: _pool_stat(engine, "checkedin"), name)
+    pool_overflow.set_function(lambda: max(0, _pool_stat(engine, "overflow")), name)
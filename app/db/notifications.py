@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlparse
+import asyncpg
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+from app.db.postgres_connector import clean_postgres_url, direct_database_url
+
+logger = logging.getLogger(__name__)
+
+env = get_env_vars()
+
+NotificationHandler = Callable[[str], Awaitable[None] | None]
+
+
+def asyncpg_dsn(url: str) -> str:
+    """Convierte la URL de SQLAlchemy (postgresql+asyncpg://) en un DSN para asyncpg."""
+    parsed = urlparse(clean_postgres_url(url))
+    return parsed._replace(scheme="postgresql").geturl()
+
+
+# Un NOTIFY por payload, en orden, en un solo statement. Parámetros: channel, payloads
+PUBLISH_MANY = text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload")
+
+
+async def publish(session: AsyncSession, channel: str, payload: str) -> None:
+    """
+    Emite NOTIFY dentro de la transacción de la sesión.
+    Postgres solo lo entrega a los listeners cuando la transacción hace commit.
+    """
+    await session.execute(select(func.pg_notify(channel, payload)))
+
+
+async def publish_many(session: AsyncSession, channel: str, payloads: list[str]) -> None:
+    """Como publish para varios payloads (un round trip en lugar de uno por payload)."""
+    if payloads:
+        await session.execute(PUBLISH_MANY, {"channel": channel, "payloads": payloads})
+
+
+class PgListener:
+    """
+    Una sola conexión asyncpg por worker que hace LISTEN en los canales registrados
+    y reparte cada notificación a sus handlers. Se reconecta sola si se cae.
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 5.0):
+        self._dsn = dsn
+        self._reconnect_delay = reconnect_delay
+        self._handlers: dict[str, list[NotificationHandler]] = {}
+        self._connection: Optional[asyncpg.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+
+    def subscribe(self, channel: str, handler: NotificationHandler) -> None:
+        """Registra un handler para un canal (antes de start())."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closed.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._closed.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_connection()
+
+    def _dispatch(self, _connection, _pid: int, channel: str, payload: str) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                result = handler(payload)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception:
+                logger.exception("Error handling notification on channel %s", channel)
+
+    async def _run(self) -> None:
+        while not self._closed.is_set():
+            try:
+                self._connection = await asyncpg.connect(self._dsn)
+                for channel in self._handlers:
+                    await self._connection.add_listener(channel, self._dispatch)
+                logger.info("Listening on channels: %s", ", ".join(self._handlers))
+
+                # Esperar hasta que la conexión se cierre o se detenga el listener
+                lost = asyncio.Event()
+                self._connection.add_termination_listener(lambda _conn: lost.set())
+                await lost.wait()
+                logger.warning("LISTEN connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("LISTEN connection failed: %s", e)
+            finally:
+                await self._close_connection()
+
+            await asyncio.sleep(self._reconnect_delay)
+
+    async def _close_connection(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            try:
+                await self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+
+
+# Listener compartido del worker (se arranca en el lifespan de la app)
+listener = PgListener(asyncpg_dsn(direct_database_url()))
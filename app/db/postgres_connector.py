@@ -1,7 +1,13 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
-from typing import AsyncGenerator
+from sqlalchemy.pool import NullPool
+from typing import AsyncGenerator, Optional
+from uuid import uuid4
+import asyncio
+import time
 from app.core.dependencies import get_env_vars
+from app.db.instrumentation import InstrumentedAsyncAdaptedQueuePool, instrument_engine
 import logging
 from urllib.parse import urlparse, parse_qs
 
@@ -32,14 +38,128 @@ def clean_postgres_url(url: str) -> str:
     
     return cleaned_url
 
-# Engine async para PostgreSQL con connection pooling optimizado
-engine = create_async_engine(
-    clean_postgres_url(env.POSTGRES_DATABASE_URL),
-    pool_size=10,           # Mantener 10 conexiones abiertas permanentemente
-    max_overflow=20,        # Hasta 20 conexiones adicionales bajo demanda
-    pool_pre_ping=True,     # Verificar que la conexión esté viva antes de usar
-    pool_recycle=3600,      # Reciclar conexiones cada hora (evita conexiones stale)
-    echo=False              # True para ver SQL queries (desarrollo)
+def connection_budget() -> tuple[int, int]:
+    """
+    Calcula (pool_size, max_overflow) para este worker.
+
+    Si DB_CLUSTER_MAX_CONNECTIONS está definido, el presupuesto por worker es
+    límite / (DB_INSTANCE_COUNT * WEB_CONCURRENCY), menos la conexión LISTEN de
+    cada worker. Si la configuración lo excede, se recorta primero el overflow
+    y luego el pool, y se registra un warning.
+    """
+    pool_size, max_overflow = env.DB_POOL_SIZE, env.DB_MAX_OVERFLOW
+    # QueuePool con pool_size=0 o max_overflow=-1 no tiene límite de conexiones:
+    # 0 solo es válido con PgBouncer (NullPool)
+    if pool_size < 0 or (pool_size == 0 and not env.DB_PGBOUNCER_TRANSACTION_MODE):
+        raise RuntimeError(
+            f"DB_POOL_SIZE={pool_size} is invalid: use >= 1 "
+            "(0 = NullPool, only with DB_PGBOUNCER_TRANSACTION_MODE)"
+        )
+    if max_overflow < 0:
+        raise RuntimeError(f"DB_MAX_OVERFLOW={max_overflow} is invalid: use >= 0")
+    if env.DB_CLUSTER_MAX_CONNECTIONS is None:
+        return pool_size, max_overflow
+
+    workers = max(1, env.DB_INSTANCE_COUNT) * max(1, env.WEB_CONCURRENCY)
+    per_worker = env.DB_CLUSTER_MAX_CONNECTIONS // workers - 1  # 1 = conexión LISTEN
+    if per_worker < 1:
+        raise RuntimeError(
+            f"DB_CLUSTER_MAX_CONNECTIONS={env.DB_CLUSTER_MAX_CONNECTIONS} is too low for "
+            f"{workers} workers ({env.DB_INSTANCE_COUNT} instances x {env.WEB_CONCURRENCY} workers)"
+        )
+
+    if pool_size + max_overflow > per_worker:
+        new_pool_size = min(pool_size, per_worker)
+        new_max_overflow = per_worker - new_pool_size
+        logger.warning(
+            "Pool %d+%d exceeds the per-worker budget of %d connections "
+            "(%d cluster-wide / %d workers); using %d+%d",
+            pool_size, max_overflow, per_worker, env.DB_CLUSTER_MAX_CONNECTIONS, workers,
+            new_pool_size, new_max_overflow,
+        )
+        pool_size, max_overflow = new_pool_size, new_max_overflow
+    return pool_size, max_overflow
+
+
+def direct_database_url() -> str:
+    """
+    URL para lo que necesita quedarse en un mismo backend de Postgres (LISTEN y advisory
+    locks de sesión). Detrás de PgBouncer en modo transacción cada statement puede caer
+    en otro backend, así que ahí se exige POSTGRES_DIRECT_URL.
+    """
+    if env.POSTGRES_DIRECT_URL:
+        return env.POSTGRES_DIRECT_URL
+    if env.DB_PGBOUNCER_TRANSACTION_MODE:
+        raise RuntimeError(
+            "POSTGRES_DIRECT_URL is required with DB_PGBOUNCER_TRANSACTION_MODE "
+            "(LISTEN and session advisory locks need a direct connection)"
+        )
+    return env.POSTGRES_DATABASE_URL
+
+
+def _pgbouncer_prepared_statement_name() -> str:
+    # Nombres únicos: en modo transacción cada statement puede caer en otra
+    # conexión del servidor y los nombres fijos de asyncpg chocarían
+    return f"__asyncpg_{uuid4()}__"
+
+
+def _create_engine(url: str, name: str):
+    """Engine async para PostgreSQL con connection pooling configurable (ver EnvVars)."""
+    pool_size, max_overflow = connection_budget()
+    options: dict = {
+        "pool_logging_name": name,  # Etiqueta "engine" de las métricas del pool
+        "pool_pre_ping": env.DB_POOL_PRE_PING,  # Verificar que la conexión esté viva antes de usar
+        "echo": False,                          # True para ver SQL queries (desarrollo)
+    }
+
+    if env.DB_PGBOUNCER_TRANSACTION_MODE:
+        # PgBouncer en modo transacción: sin cache de prepared statements de asyncpg
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _pgbouncer_prepared_statement_name,
+        }
+
+    if env.DB_PGBOUNCER_TRANSACTION_MODE and pool_size == 0:
+        # PgBouncer hace el pooling: cada checkout abre una conexión barata hacia él
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=InstrumentedAsyncAdaptedQueuePool,
+            pool_size=pool_size,                  # Conexiones abiertas permanentemente
+            max_overflow=max_overflow,            # Conexiones adicionales bajo demanda
+            pool_timeout=env.DB_POOL_TIMEOUT,     # Espera máxima por una conexión libre
+            pool_recycle=env.DB_POOL_RECYCLE,     # Reciclar conexiones (evita conexiones stale)
+        )
+
+    engine = create_async_engine(clean_postgres_url(url), **options)
+    if env.METRICS_ENABLED:
+        instrument_engine(engine, name)
+    if env.PROFILER_ENABLED:
+        from app.core.profiler import profile_engine
+        profile_engine(engine, name)
+    if env.QUERY_BUDGET_MODE != "off":
+        from app.core.query_budget import watch_engine
+        watch_engine(engine, raise_on_exceed=env.QUERY_BUDGET_MODE == "raise")
+    return engine
+
+
+# Engine principal (primary): todas las escrituras
+engine = _create_engine(env.POSTGRES_DATABASE_URL, "primary")
+
+# Engine de solo lectura (réplica opcional); sin réplica, las lecturas van al primary
+read_engine = (
+    _create_engine(env.POSTGRES_READ_REPLICA_URL, "replica")
+    if env.POSTGRES_READ_REPLICA_URL
+    else engine
+)
+
+# Engine de conexiones directas (sin PgBouncer) para advisory locks de sesión; se usa
+# poco (jobs de archivo), así que no mantiene pool. Sin POSTGRES_DIRECT_URL es el principal
+direct_engine = (
+    create_async_engine(clean_postgres_url(direct_database_url()), poolclass=NullPool)
+    if env.POSTGRES_DIRECT_URL
+    else engine
 )
 
 # Session factory
@@ -51,6 +171,15 @@ AsyncSessionLocal = sessionmaker(
     autoflush=False,
 )
 
+# Session factory de lectura
+ReadSessionLocal = sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
 # Dependency para FastAPI
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
@@ -59,7 +188,132 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+
+class ReplicaRouter:
+    """
+    Decide si una lectura puede ir a la réplica.
+
+    - Read-your-writes: durante READ_YOUR_WRITES_SECONDS después de que un usuario
+      escribe, sus lecturas van al primary (registro por worker).
+    - Guard de lag: el lag de la réplica se consulta como máximo cada
+      READ_REPLICA_LAG_CHECK_SECONDS; si supera READ_REPLICA_MAX_LAG_SECONDS
+      (o la consulta falla) todas las lecturas van al primary.
+    """
+
+    # Sin WAL pendiente de aplicar el lag es 0 (aunque el primary esté inactivo)
+    LAG_QUERY = text("""
+        SELECT CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+
+    def __init__(self, max_lag_seconds: float, read_your_writes_seconds: float, lag_check_seconds: float):
+        self.max_lag_seconds = max_lag_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.lag_check_seconds = lag_check_seconds
+        self._recent_writers: dict[int, float] = {}
+        self._replica_healthy = True
+        self._lag_checked_at = 0.0
+        self._lag_lock = asyncio.Lock()
+
+    @property
+    def has_replica(self) -> bool:
+        return read_engine is not engine
+
+    def note_write(self, user_id: Optional[int]) -> None:
+        """Registra que `user_id` acaba de escribir (llamar después del commit)."""
+        if user_id is None or not self.has_replica:
+            return
+        now = time.monotonic()
+        self._recent_writers[user_id] = now + self.read_your_writes_seconds
+        # Limpieza perezosa para que el dict no crezca sin límite
+        if len(self._recent_writers) > 1024:
+            self._recent_writers = {uid: t for uid, t in self._recent_writers.items() if t > now}
+
+    async def use_replica(self, user_id: Optional[int]) -> bool:
+        if not self.has_replica:
+            return False
+        if user_id is not None:
+            deadline = self._recent_writers.get(user_id)
+            if deadline is not None:
+                if deadline > time.monotonic():
+                    return False
+                self._recent_writers.pop(user_id, None)
+        return await self._check_lag()
+
+    async def _check_lag(self) -> bool:
+        if time.monotonic() - self._lag_checked_at < self.lag_check_seconds:
+            return self._replica_healthy
+        async with self._lag_lock:
+            # Otro request pudo haber hecho el chequeo mientras esperábamos el lock
+            if time.monotonic() - self._lag_checked_at < self.lag_check_seconds:
+                return self._replica_healthy
+            try:
+                async with read_engine.connect() as conn:
+                    lag = float((await conn.execute(self.LAG_QUERY)).scalar() or 0)
+                self._replica_healthy = lag <= self.max_lag_seconds
+                if not self._replica_healthy:
+                    logger.warning("Read replica lag %.1fs exceeds limit, reading from primary", lag)
+            except Exception as e:
+                logger.warning("Read replica lag check failed, reading from primary: %s", e)
+                self._replica_healthy = False
+            self._lag_checked_at = time.monotonic()
+        return self._replica_healthy
+
+
+replica_router = ReplicaRouter(
+    max_lag_seconds=env.READ_REPLICA_MAX_LAG_SECONDS,
+    read_your_writes_seconds=env.READ_YOUR_WRITES_SECONDS,
+    lag_check_seconds=env.READ_REPLICA_LAG_CHECK_SECONDS,
+)
+
+
+async def get_read_session(user_id: Optional[int] = None) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Sesión para tráfico de solo lectura (reportes y listados) del usuario `user_id`.
+    Usa la réplica si está configurada, sana y el usuario no escribió recientemente.
+    Nunca se debe escribir con esta sesión.
+    """
+    factory = ReadSessionLocal if await replica_router.use_replica(user_id) else AsyncSessionLocal
+    async with factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+# Pre-calentamiento del pool al arrancar la app
+async def prewarm_connections(count: int) -> None:
+    """
+    Abre hasta `count` conexiones por engine en paralelo y las deja en el pool.
+    Se lanza en segundo plano al arrancar: /health responde de inmediato y el primer
+    request autenticado ya no paga el handshake TLS + autenticación con Postgres.
+    """
+    engines = [engine] if read_engine is engine else [engine, read_engine]
+    for target in engines:
+        pool_size = getattr(target.sync_engine.pool, "size", None)
+        if pool_size is None:
+            continue  # NullPool: no hay conexiones que mantener abiertas
+        connections = min(count, pool_size())
+        if connections <= 0:
+            continue
+
+        async def _open():
+            async with target.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_open() for _ in range(connections)), return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning("Could not pre-warm %d connections: %s", len(failed), failed[0])
+        logger.info(
+            "Pre-warmed %d connections in %.0f ms",
+            connections - len(failed), (time.perf_counter() - start) * 1000,
+        )
+
+
 # Función para crear tablas (desarrollo/tests)
 async def create_db_and_tables():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
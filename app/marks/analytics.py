@@ -0,0 +1,145 @@
+"""
+Analítica de horas trabajadas: heatmap día de la semana × hora del día.
+
+Todo se calcula en Postgres en una sola consulta:
+1. LEAD() empareja cada clock in con la marca siguiente del usuario; es una sesión si
+   esa marca es un clock out a menos de ANALYTICS_MAX_SESSION_HOURS (las sesiones
+   abiertas o más largas quedan en el índice de anomalías, no en el heatmap).
+2. Cada sesión se recorta al rango y se pasa a hora local con el offset del cliente.
+3. generate_series() la reparte en las horas que toca y se suma el solape de cada hora.
+Se leen las marcas ANALYTICS_MAX_SESSION_HOURS antes y después del rango para no perder
+las sesiones que cruzan sus bordes. La consulta corre con SET LOCAL statement_timeout
+(ANALYTICS_STATEMENT_TIMEOUT_MS) para que un rango grande no ocupe la base indefinidamente.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+
+env = get_env_vars()
+
+# Días en el orden de la matriz (ISODOW 1..7)
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# Parámetros: fetch_start, fetch_end, start, end, offset_minutes, max_session_hours, user_id
+# (start/end son los límites del reporte; fetch_* se amplían para las sesiones que los cruzan)
+HEATMAP_SQL = """
+WITH ordered AS (
+    SELECT
+        user_id,
+        mark_type,
+        timestamp,
+        po_number,
+        LEAD(mark_type) OVER w AS next_type,
+        LEAD(timestamp) OVER w AS next_timestamp
+    FROM marks
+    WHERE timestamp >= :fetch_start
+      AND timestamp <= :fetch_end
+      AND (CAST(:user_id AS INTEGER) IS NULL OR user_id = :user_id)
+    WINDOW w AS (PARTITION BY user_id ORDER BY timestamp, id)
+),
+sessions AS (
+    SELECT
+        {group_column} AS group_key,
+        GREATEST(timestamp, :start) - make_interval(mins => :offset_minutes) AS start_local,
+        LEAST(next_timestamp, :end) - make_interval(mins => :offset_minutes) AS end_local
+    FROM ordered
+    WHERE mark_type = 'CLOCK_IN'
+      AND next_type = 'CLOCK_OUT'
+      AND next_timestamp - timestamp <= make_interval(hours => :max_session_hours)
+      AND next_timestamp > :start
+      AND timestamp < :end
+),
+slices AS (
+    SELECT
+        s.group_key,
+        hour_start,
+        LEAST(s.end_local, hour_start + INTERVAL '1 hour') - GREATEST(s.start_local, hour_start) AS worked
+    FROM sessions s
+    CROSS JOIN LATERAL generate_series(
+        date_trunc('hour', s.start_local), s.end_local, INTERVAL '1 hour'
+    ) AS hour_start
+)
+SELECT
+    group_key,
+    EXTRACT(ISODOW FROM hour_start)::int AS weekday,
+    EXTRACT(HOUR FROM hour_start)::int AS hour,
+    SUM(EXTRACT(EPOCH FROM worked)) / 3600.0 AS hours
+FROM slices
+WHERE worked > INTERVAL '0'
+GROUP BY group_key, weekday, hour
+"""
+
+HEATMAP_TOTAL = text(HEATMAP_SQL.format(group_column="NULL::text"))
+HEATMAP_BY_PO = text(HEATMAP_SQL.format(group_column="po_number"))
+
+
+def _empty_matrix() -> list[list[float]]:
+    return [[0.0] * 24 for _ in WEEKDAYS]
+
+
+def _round_matrix(matrix: list[list[float]]) -> list[list[float]]:
+    return [[round(hours, 2) for hours in row] for row in matrix]
+
+
+async def labor_heatmap(
+    session: AsyncSession,
+    start: datetime,
+    end: datetime,
+    timezone_offset_minutes: int = 0,
+    by_po: bool = False,
+    max_groups: int = 20,
+    user_id: Optional[int] = None,
+) -> dict:
+    """
+    Horas por día de la semana (filas, lunes primero) y hora local (columnas 0..23).
+    Con `by_po` agrega una matriz por PO para los `max_groups` con más horas; el resto
+    se suma en "other". Lanza DBAPIError (57014) si se excede el statement_timeout.
+    """
+    await session.execute(text(f"SET LOCAL statement_timeout = {int(env.ANALYTICS_STATEMENT_TIMEOUT_MS)}"))
+    max_session_hours = env.ANALYTICS_MAX_SESSION_HOURS
+    result = await session.execute(HEATMAP_BY_PO if by_po else HEATMAP_TOTAL, {
+        "fetch_start": start - timedelta(hours=max_session_hours),
+        "fetch_end": end + timedelta(hours=max_session_hours),
+        "start": start,
+        "end": end,
+        "offset_minutes": timezone_offset_minutes,
+        "max_session_hours": max_session_hours,
+        "user_id": user_id,
+    })
+
+    matrix = _empty_matrix()
+    groups: dict[Optional[str], list[list[float]]] = {}
+    for group_key, weekday, hour, hours in result:
+        hours = float(hours)
+        matrix[weekday - 1][hour] += hours
+        if by_po:
+            groups.setdefault(group_key, _empty_matrix())[weekday - 1][hour] += hours
+
+    report = {
+        "weekdays": list(WEEKDAYS),
+        "matrix": _round_matrix(matrix),
+        "total_hours": round(sum(map(sum, matrix)), 2),
+    }
+    if by_po:
+        ranked = sorted(groups.items(), key=lambda item: sum(map(sum, item[1])), reverse=True)
+        by_group = []
+        other = None
+        for index, (po_number, group_matrix) in enumerate(ranked):
+            if index < max_groups:
+                by_group.append({
+                    "po_number": po_number,
+                    "total_hours": round(sum(map(sum, group_matrix)), 2),
+                    "matrix": _round_matrix(group_matrix),
+                })
+                continue
+            if other is None:
+                other = _empty_matrix()
+            for row, group_row in zip(other, group_matrix):
+                for hour, hours in enumerate(group_row):
+                    row[hour] += hours
+        report["by_po"] = by_group
+        if other is not None:
+            report["other"] = {"total_hours": round(sum(map(sum, other)), 2), "matrix": _round_matrix(other)}
+    return report
@@ -0,0 +1,295 @@
+"""
+Índice de anomalías de marcas (mark_anomalies), mantenido de forma incremental.
+
+Anomalías, evaluadas sobre las marcas de cada usuario en orden cronológico:
+- open_session: clock in cuya sesión dura más de ANOMALY_OPEN_SESSION_HOURS (hasta su
+  clock out; si no lo tiene, hasta la siguiente marca o hasta ahora si es la última).
+- orphan_clock_out: clock out cuya marca anterior no es un clock in.
+- po_mismatch: clock out con un PO distinto al del clock in anterior.
+
+Cada anomalía depende solo de una marca y de sus vecinas, así que un cambio en un
+instante solo afecta a la ventana [marca anterior, marca siguiente] a su alrededor.
+Cada escaneo junta los instantes que cambiaron desde la pasada anterior:
+- marcas nuevas: id > last_mark_id (marca de agua sobre marks.id)
+- ediciones: updated_at > last_updated_at (lo fija el trigger marks_touch_updated_at al
+  cambiar timestamp, tipo, PO o usuario; la dirección del geocoding no cuenta)
+- eliminaciones y marcas movidas: marks_rescan_queue (trigger marks_queue_rescan), que se consume
+- clock ins sin cerrar que cruzaron el umbral de horas desde la pasada anterior
+y recalcula solo esas ventanas, así que cada pasada cuesta O(cambios) y no O(marcas).
+La primera pasada (last_mark_id = 0) recorre todas las marcas una vez.
+Los borrados del archivo en frío (app/marks/archive.py) no se encolan: las anomalías de
+los meses archivados se conservan aunque sus marcas ya no estén en la base.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import bindparam, delete, or_, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+from app.db.postgres_connector import AsyncSessionLocal
+from app.marks.models import AnomalyKind, AnomalyScanState, Mark, MarkAnomaly, MarkRescanQueue, MarkType
+
+logger = logging.getLogger(__name__)
+
+env = get_env_vars()
+
+# Un solo escaneo a la vez entre todos los workers (advisory lock de transacción)
+ANOMALY_SCAN_LOCK_KEY = 43043043
+
+# Las marcas de agua se releen con solapamiento: ids y updated_at se asignan antes del
+# commit, así que una transacción lenta puede hacerse visible con un valor menor que el
+# máximo ya escaneado. Reprocesar una ventana es idempotente.
+ID_OVERLAP = 1000
+UPDATED_AT_OVERLAP = timedelta(minutes=5)
+
+# Instantes cambiados de un usuario a menos de esta distancia se recalculan en una sola ventana
+WINDOW_GAP = timedelta(days=2)
+
+WINDOW_COLUMNS = (Mark.id, Mark.mark_type, Mark.timestamp, Mark.po_number)
+
+# --- Instantes cambiados ---
+
+# Parámetros: after_id
+NEW_MARKS = select(Mark.user_id, Mark.timestamp, Mark.id).where(Mark.id > bindparam("after_id"))
+
+# Parámetros: after
+EDITED_MARKS = select(Mark.user_id, Mark.timestamp, Mark.updated_at).where(
+    Mark.updated_at.is_not(None),
+    Mark.updated_at > bindparam("after"),
+)
+
+# Consume la cola (las filas de transacciones aún sin commit quedan para la próxima pasada)
+CONSUME_RESCAN_QUEUE = delete(MarkRescanQueue).returning(MarkRescanQueue.user_id, MarkRescanQueue.timestamp)
+
+# Clock ins que cumplieron el umbral de horas entre dos pasadas. Parámetros: from_ts, to_ts
+AGED_CLOCK_INS = select(Mark.user_id, Mark.timestamp).where(
+    Mark.mark_type == MarkType.CLOCK_IN,
+    Mark.timestamp > bindparam("from_ts"),
+    Mark.timestamp <= bindparam("to_ts"),
+)
+
+# --- Ventana de un usuario. Parámetros: user_id, lo, hi ---
+
+MARKS_BEFORE = (
+    select(*WINDOW_COLUMNS)
+    .where(Mark.user_id == bindparam("user_id"), Mark.timestamp < bindparam("lo"))
+    .order_by(Mark.timestamp.desc(), Mark.id.desc())
+    .limit(2)
+)
+
+MARKS_BETWEEN = (
+    select(*WINDOW_COLUMNS)
+    .where(
+        Mark.user_id == bindparam("user_id"),
+        Mark.timestamp >= bindparam("lo"),
+        Mark.timestamp <= bindparam("hi"),
+    )
+    .order_by(Mark.timestamp, Mark.id)
+)
+
+MARKS_AFTER = (
+    select(*WINDOW_COLUMNS)
+    .where(Mark.user_id == bindparam("user_id"), Mark.timestamp > bindparam("hi"))
+    .order_by(Mark.timestamp, Mark.id)
+    .limit(2)
+)
+
+
+def _evaluate(marks: list, start: int, end: int, now: datetime, open_hours: float) -> list[dict]:
+    """Anomalías de marks[start:end]; cada marca se evalúa con su anterior y su siguiente."""
+    anomalies = []
+    for index in range(start, end):
+        mark = marks[index]
+        previous = marks[index - 1] if index > 0 else None
+        following = marks[index + 1] if index + 1 < len(marks) else None
+
+        if mark.mark_type == MarkType.CLOCK_IN:
+            closed = following is not None and following.mark_type == MarkType.CLOCK_OUT
+            until = following.timestamp if following is not None else now
+            hours = (until - mark.timestamp).total_seconds() / 3600
+            if hours > open_hours:
+                anomalies.append({
+                    "kind": AnomalyKind.OPEN_SESSION.value,
+                    "mark": mark,
+                    "detail": {"hours": round(hours, 2), "closed": closed},
+                })
+        elif previous is None or previous.mark_type != MarkType.CLOCK_IN:
+            anomalies.append({
+                "kind": AnomalyKind.ORPHAN_CLOCK_OUT.value,
+                "mark": mark,
+                "detail": {"previous_mark_id": previous.id if previous is not None else None},
+            })
+        elif previous.po_number != mark.po_number:
+            anomalies.append({
+                "kind": AnomalyKind.PO_MISMATCH.value,
+                "mark": mark,
+                "detail": {
+                    "clock_in_id": previous.id,
+                    "clock_in_po_number": previous.po_number,
+                    "clock_out_po_number": mark.po_number,
+                },
+            })
+    return anomalies
+
+
+def _windows(points: dict[int, list[datetime]]) -> list[tuple[int, datetime, datetime]]:
+    """Agrupa los instantes cambiados de cada usuario en ventanas (user_id, lo, hi)."""
+    windows = []
+    for user_id, timestamps in points.items():
+        timestamps.sort()
+        lo = hi = timestamps[0]
+        for timestamp in timestamps[1:]:
+            if timestamp - hi > WINDOW_GAP:
+                windows.append((user_id, lo, hi))
+                lo = timestamp
+            hi = timestamp
+        windows.append((user_id, lo, hi))
+    return windows
+
+
+async def _rescan_window(
+    session: AsyncSession, user_id: int, lo: datetime, hi: datetime, now: datetime, open_hours: float
+) -> tuple[set[tuple[str, int]], int]:
+    """
+    Recalcula las anomalías alrededor de [lo, hi].
+    Devuelve ({(kind, mark_id)} vigentes, eliminadas).
+    """
+    params = {"user_id": user_id, "lo": lo, "hi": hi}
+    before = (await session.execute(MARKS_BEFORE, params)).all()
+    between = (await session.execute(MARKS_BETWEEN, params)).all()
+    after = (await session.execute(MARKS_AFTER, params)).all()
+    marks = list(reversed(before)) + between + after
+
+    # La vecina más lejana de cada lado solo se lee como contexto de la más cercana
+    start = 1 if len(before) == 2 else 0
+    end = len(marks) - 1 if len(after) == 2 else len(marks)
+    evaluated = marks[start:end]
+    found = _evaluate(marks, start, end, now, open_hours)
+
+    # Anomalías anteriores del alcance: marcas evaluadas y marcas que ya no están en [lo, hi]
+    scope = or_(
+        MarkAnomaly.mark_id.in_([mark.id for mark in evaluated]),
+        MarkAnomaly.mark_timestamp.between(lo, hi),
+    )
+    existing = (await session.execute(
+        select(MarkAnomaly.id, MarkAnomaly.kind, MarkAnomaly.mark_id)
+        .where(MarkAnomaly.user_id == user_id, scope)
+    )).all()
+    keep = {(anomaly["kind"], anomaly["mark"].id) for anomaly in found}
+    stale = [row.id for row in existing if (row.kind, row.mark_id) not in keep]
+    if stale:
+        await session.execute(delete(MarkAnomaly).where(MarkAnomaly.id.in_(stale)))
+
+    if found:
+        # detected_at se conserva para las anomalías que ya estaban
+        statement = insert(MarkAnomaly).values([
+            {
+                "user_id": user_id,
+                "kind": anomaly["kind"],
+                "mark_id": anomaly["mark"].id,
+                "mark_timestamp": anomaly["mark"].timestamp,
+                "detail": anomaly["detail"],
+                "detected_at": now,
+            }
+            for anomaly in found
+        ])
+        statement = statement.on_conflict_do_update(
+            constraint="mark_anomalies_kind_mark",
+            set_={
+                "user_id": statement.excluded.user_id,
+                "mark_timestamp": statement.excluded.mark_timestamp,
+                "detail": statement.excluded.detail,
+            },
+        )
+        await session.execute(statement)
+    return keep, len(stale)
+
+
+async def scan_anomalies(session: AsyncSession, open_hours: Optional[float] = None) -> Optional[dict]:
+    """
+    Una pasada incremental en la transacción de `session` (hace commit).
+    Devuelve None si otro escaneo está en curso.
+    """
+    open_hours = env.ANOMALY_OPEN_SESSION_HOURS if open_hours is None else open_hours
+    locked = (await session.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ANOMALY_SCAN_LOCK_KEY}
+    )).scalar_one()
+    if not locked:
+        await session.rollback()
+        return None
+
+    state = await session.get(AnomalyScanState, 1, with_for_update=True)
+    if state is None:
+        state = AnomalyScanState(id=1, last_mark_id=0)
+        session.add(state)
+    now = datetime.utcnow()
+    threshold = timedelta(hours=open_hours)
+
+    points: dict[int, list[datetime]] = {}
+    max_id = state.last_mark_id
+    new_rows = await session.execute(NEW_MARKS, {"after_id": max(0, state.last_mark_id - ID_OVERLAP)})
+    for user_id, timestamp, mark_id in new_rows:
+        points.setdefault(user_id, []).append(timestamp)
+        max_id = max(max_id, mark_id)
+
+    max_updated_at = state.last_updated_at
+    edited_after = state.last_updated_at - UPDATED_AT_OVERLAP if state.last_updated_at is not None else datetime.min
+    edited_rows = await session.execute(EDITED_MARKS, {"after": edited_after})
+    for user_id, timestamp, updated_at in edited_rows:
+        points.setdefault(user_id, []).append(timestamp)
+        max_updated_at = updated_at if max_updated_at is None else max(max_updated_at, updated_at)
+
+    for user_id, timestamp in await session.execute(CONSUME_RESCAN_QUEUE):
+        points.setdefault(user_id, []).append(timestamp)
+
+    if state.last_scanned_at is not None:
+        aged_rows = await session.execute(
+            AGED_CLOCK_INS, {"from_ts": state.last_scanned_at - threshold, "to_ts": now - threshold}
+        )
+        for user_id, timestamp in aged_rows:
+            points.setdefault(user_id, []).append(timestamp)
+
+    windows = _windows(points)
+    # Ventanas vecinas pueden evaluar la misma marca de borde: se cuenta una vez
+    current: set[tuple[str, int]] = set()
+    removed = 0
+    for user_id, lo, hi in windows:
+        found, stale = await _rescan_window(session, user_id, lo, hi, now, open_hours)
+        current |= found
+        removed += stale
+
+    state.last_mark_id = max_id
+    state.last_updated_at = max_updated_at
+    state.last_scanned_at = now
+    await session.commit()
+
+    return {
+        "changed_points": sum(len(timestamps) for timestamps in points.values()),
+        "users": len(points),
+        "windows": len(windows),
+        "anomalies": len(current),
+        "resolved": removed,
+        "last_mark_id": max_id,
+    }
+
+
+async def run_anomaly_scan() -> Optional[dict]:
+    async with AsyncSessionLocal() as session:
+        return await scan_anomalies(session)
+
+
+async def anomaly_scan_loop() -> None:
+    """Tarea de fondo del worker: escanea cada ANOMALY_SCAN_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(env.ANOMALY_SCAN_INTERVAL_SECONDS)
+        try:
+            summary = await run_anomaly_scan()
+            if summary and summary["windows"]:
+                logger.info("Anomaly scan: %s", summary)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Anomaly scan failed")
+
@@ -0,0 +1,462 @@
+"""
+Archivo en frío de marcas antiguas en archivos Arrow IPC (columnar, comprimido con zstd).
+
+Se archiva por mes (misma granularidad que las particiones de marks):
+  1. Registrar el mes en manifest.json con status "exporting" bajo el lock exclusivo de
+     meses: desde ahí las ediciones, altas y bajas de marcas del mes se rechazan con 409
+     (ensure_not_archiving, que toma el lock compartido como ensure_not_closed de nómina).
+  2. Exportar las marcas del mes a ARCHIVE_DIR/marks_YYYY_MM.arrow (escritura atómica) y
+     verificar que el archivo tenga las mismas filas que la base.
+  3. Pasar el mes a "deleting": los reportes leen el archivo desde ahora.
+  4. Borrar exactamente los (id, timestamp) del archivo en lotes (transacciones cortas)
+     y marcar "complete". Los meses sin marcas se omiten (no se escribe archivo).
+Los borrados del archivo no pasan por marks_rescan_queue (app.skip_anomaly_rescan): no
+son ediciones, y las anomalías ya detectadas de meses archivados se conservan.
+
+Los reportes que cubren meses archivados leen los archivos vía memory map
+(pa.memory_map + pa.ipc.open_file), sin copiar el archivo completo a memoria.
+pyarrow solo se importa cuando se archiva o se lee un rango archivado.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+from app.db.postgres_connector import AsyncSessionLocal, direct_engine
+from app.marks.models import Mark, MarkType
+from app.marks.versions import bump_mark_version
+
+logger = logging.getLogger(__name__)
+
+env = get_env_vars()
+
+MANIFEST_FILE = "manifest.json"
+
+# Filas por record batch al exportar
+EXPORT_BATCH_SIZE = 10000
+
+# Llave del advisory lock: un solo proceso de archivo a la vez en todo el cluster
+ARCHIVE_LOCK_KEY = 36036036
+
+# Llave del lock de meses: compartido al escribir marks, exclusivo al congelar un mes
+ARCHIVE_MONTHS_LOCK_KEY = 36036037
+
+# Meses en proceso de archivo: no se pueden escribir (ver ensure_not_archiving)
+FROZEN_STATUSES = ("exporting", "deleting")
+
+# Parámetros: ids, timestamps, month_start, month_end (el rango poda a la partición del mes)
+DELETE_ARCHIVED_BATCH = text("""
+    DELETE FROM marks
+    WHERE (id, timestamp) IN (
+        SELECT * FROM unnest(CAST(:ids AS integer[]), CAST(:timestamps AS timestamp[]))
+    )
+      AND timestamp >= :month_start AND timestamp < :month_end
+""")
+
+ARCHIVE_COLUMNS = ("id", "user_id", "mark_type", "timestamp", "latitude", "longitude", "address", "po_number")
+
+
+def _archive_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int32()),
+        ("user_id", pa.int32()),
+        ("mark_type", pa.dictionary(pa.int8(), pa.string())),
+        ("timestamp", pa.timestamp("us")),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("address", pa.string()),
+        ("po_number", pa.string()),
+    ])
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(value: datetime) -> datetime:
+    return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+
+
+def _month_key(month: datetime) -> str:
+    return month.strftime("%Y-%m")
+
+
+def _month_path(month: datetime) -> str:
+    return os.path.join(env.ARCHIVE_DIR, f"marks_{month:%Y_%m}.arrow")
+
+
+# --- Manifest ---
+
+def load_manifest() -> dict:
+    """Meses archivados: {"months": {"YYYY-MM": {"file", "rows", "user_ids", "status", "archived_at"}}}."""
+    path = os.path.join(env.ARCHIVE_DIR, MANIFEST_FILE)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"months": {}}
+
+
+def _save_manifest(manifest: dict) -> None:
+    path = os.path.join(env.ARCHIVE_DIR, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=1)
+def _manifest_months_cached(manifest_mtime_ns: int) -> tuple[frozenset[str], frozenset[str]]:
+    months = load_manifest()["months"]
+    readable = frozenset(key for key, entry in months.items() if entry["status"] != "exporting")
+    frozen = frozenset(key for key, entry in months.items() if entry["status"] in FROZEN_STATUSES)
+    return readable, frozen
+
+
+def _manifest_months() -> tuple[frozenset[str], frozenset[str]]:
+    """(meses con archivo legible, meses congelados); se relee el manifest solo si cambió en disco."""
+    try:
+        mtime_ns = os.stat(os.path.join(env.ARCHIVE_DIR, MANIFEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return frozenset(), frozenset()
+    return _manifest_months_cached(mtime_ns)
+
+
+def archived_months() -> frozenset[str]:
+    """Meses cuyo archivo ya está completo (los que se siguen exportando no cuentan)."""
+    return _manifest_months()[0]
+
+
+# --- Congelamiento de meses ---
+
+def archiving_detail(timestamp: datetime) -> str:
+    return f"Marks for {_month_key(timestamp)} are being archived and cannot be modified"
+
+
+async def lock_archive_months_shared(session: AsyncSession) -> frozenset[str]:
+    """
+    Toma el lock compartido de meses (hasta el fin de la transacción) y devuelve los meses
+    congelados. Mientras se tiene, ningún mes puede pasar a "exporting".
+    """
+    await session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": ARCHIVE_MONTHS_LOCK_KEY})
+    return _manifest_months()[1]
+
+
+def first_frozen(frozen_months: frozenset[str], timestamps) -> Optional[datetime]:
+    """Primer instante de `timestamps` que cae en un mes congelado (None si ninguno)."""
+    return next((timestamp for timestamp in timestamps if _month_key(timestamp) in frozen_months), None)
+
+
+async def ensure_not_archiving(session: AsyncSession, *timestamps: datetime) -> None:
+    """409 si algún instante cae en un mes que se está archivando (toma el lock compartido)."""
+    frozen = first_frozen(await lock_archive_months_shared(session), timestamps)
+    if frozen is not None:
+        raise HTTPException(status_code=409, detail=archiving_detail(frozen))
+
+
+async def _set_month_status(manifest: dict, key: str, entry: Optional[dict]) -> None:
+    """
+    Cambia la entrada del mes con el lock exclusivo de meses: espera a que terminen las
+    escrituras en curso, así las siguientes ya ven el estado nuevo (None la elimina).
+    """
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ARCHIVE_MONTHS_LOCK_KEY})
+        if entry is None:
+            manifest["months"].pop(key, None)
+        else:
+            manifest["months"][key] = entry
+        _save_manifest(manifest)
+        await session.commit()
+
+
+# --- Exportación ---
+
+async def _export_month(session, month: datetime) -> tuple[int, set[int]]:
+    """Escribe el mes en su archivo .arrow. Devuelve (filas, user_ids)."""
+    import pyarrow as pa
+
+    schema = _archive_schema()
+    path = _month_path(month)
+    tmp_path = path + ".tmp"
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+
+    rows = 0
+    user_ids: set[int] = set()
+    query = (
+        select(*(getattr(Mark, c) for c in ARCHIVE_COLUMNS))
+        .where(Mark.timestamp >= month, Mark.timestamp < _next_month(month))
+        .order_by(Mark.timestamp)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    writer = await asyncio.to_thread(pa.ipc.new_file, tmp_path, schema, options=options)
+    try:
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            columns = {c: [] for c in ARCHIVE_COLUMNS}
+            for row in partition:
+                for c in ARCHIVE_COLUMNS:
+                    value = getattr(row, c)
+                    columns[c].append(value.name if c == "mark_type" else value)
+                user_ids.add(row.user_id)
+            batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+            await asyncio.to_thread(writer.write_batch, batch)
+            rows += batch.num_rows
+    finally:
+        await asyncio.to_thread(writer.close)
+
+    os.replace(tmp_path, path)
+    return rows, user_ids
+
+
+def _count_file_rows(path: str) -> int:
+    import pyarrow as pa
+
+    with pa.memory_map(path, "r") as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def _read_file_keys(path: str) -> list[tuple[list[int], list[datetime]]]:
+    """(ids, timestamps) del archivo en lotes de ARCHIVE_DELETE_BATCH_SIZE."""
+    import pyarrow as pa
+
+    batches = []
+    with pa.memory_map(path, "r") as source:
+        reader = pa.ipc.open_file(source)
+        table = reader.read_all().select(["id", "timestamp"])
+    for offset in range(0, table.num_rows, env.ARCHIVE_DELETE_BATCH_SIZE):
+        chunk = table.slice(offset, env.ARCHIVE_DELETE_BATCH_SIZE)
+        batches.append((chunk["id"].to_pylist(), chunk["timestamp"].to_pylist()))
+    return batches
+
+
+async def _delete_month(month: datetime, path: str) -> int:
+    """
+    Borra de la base exactamente las marcas que están en el archivo del mes, en lotes de
+    ARCHIVE_DELETE_BATCH_SIZE (una transacción por lote). Una marca que no está en el
+    archivo nunca se borra. El trigger de marks_rescan_queue se omite en estos lotes.
+    """
+    deleted = 0
+    for ids, timestamps in await asyncio.to_thread(_read_file_keys, path):
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("SET LOCAL app.skip_anomaly_rescan = 'on'"))
+            result = await session.execute(DELETE_ARCHIVED_BATCH, {
+                "ids": ids,
+                "timestamps": timestamps,
+                "month_start": month,
+                "month_end": _next_month(month),
+            })
+            await session.commit()
+        deleted += result.rowcount
+    return deleted
+
+
+async def archive_marks_before(cutoff: datetime) -> dict:
+    """
+    Archiva los meses completos anteriores al mes de `cutoff`.
+    Devuelve un resumen por mes archivado. Los meses ya archivados y los que no tienen
+    marcas se omiten; los que quedaron a medias se retoman.
+    """
+    cutoff_month = _month_start(cutoff)
+    if cutoff_month > _month_start(datetime.utcnow()):
+        raise ValueError("Cutoff cannot be in a future month")
+
+    os.makedirs(env.ARCHIVE_DIR, exist_ok=True)
+    summary = {"cutoff": _month_key(cutoff_month), "months": []}
+
+    # Advisory lock de sesión en una conexión directa dedicada (se mantiene durante todo el
+    # proceso; con PgBouncer en modo transacción no sobreviviría): evita dos archivados
+    # simultáneos entre el CLI, el endpoint y los workers
+    async with direct_engine.connect() as lock_conn:
+        locked = (await lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": ARCHIVE_LOCK_KEY}
+        )).scalar_one()
+        await lock_conn.commit()
+        if not locked:
+            raise RuntimeError("Another archive run is in progress")
+        try:
+            async with AsyncSessionLocal() as session:
+                first = (await session.execute(
+                    select(func.min(Mark.timestamp)).where(Mark.timestamp < cutoff_month)
+                )).scalar_one_or_none()
+
+            manifest = load_manifest()
+            pending = [
+                datetime.strptime(key, "%Y-%m") for key, entry in manifest["months"].items()
+                if entry["status"] != "complete"
+            ]
+            month = _month_start(first) if first is not None else cutoff_month
+            while month < cutoff_month:
+                if _month_key(month) not in manifest["months"]:
+                    pending.append(month)
+                month = _next_month(month)
+
+            for month in sorted(set(pending)):
+                result = await _archive_month(month, manifest)
+                if result is not None:
+                    summary["months"].append(result)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+            await lock_conn.commit()
+
+    return summary
+
+
+async def _month_has_marks(month: datetime) -> bool:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(
+            select(Mark.id).where(Mark.timestamp >= month, Mark.timestamp < _next_month(month)).limit(1)
+        )).first() is not None
+
+
+async def _archive_month(month: datetime, manifest: dict) -> Optional[dict]:
+    """Archiva un mes (o retoma uno a medias). None si el mes no tiene marcas."""
+    key = _month_key(month)
+    path = _month_path(month)
+    entry = manifest["months"].get(key)
+
+    # Sin entrada o con una exportación interrumpida: exportar desde cero
+    if entry is None or entry["status"] == "exporting":
+        if not await _month_has_marks(month):
+            if entry is not None:
+                await _set_month_status(manifest, key, None)
+            return None
+
+        # Congelar el mes: las escrituras en curso terminan antes y las siguientes reciben 409
+        entry = {
+            "file": os.path.basename(path),
+            "rows": 0,
+            "user_ids": [],
+            "status": "exporting",
+            "archived_at": None,
+        }
+        await _set_month_status(manifest, key, entry)
+        try:
+            async with AsyncSessionLocal() as session:
+                # REPEATABLE READ: el conteo y la exportación ven el mismo snapshot
+                await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+                db_rows = (await session.execute(
+                    select(func.count()).where(Mark.timestamp >= month, Mark.timestamp < _next_month(month))
+                )).scalar_one()
+                exported, user_ids = await _export_month(session, month)
+                await session.commit()
+
+            file_rows = await asyncio.to_thread(_count_file_rows, path)
+            if not (db_rows == exported == file_rows):
+                raise RuntimeError(
+                    f"Row count mismatch archiving {key}: db={db_rows} exported={exported} file={file_rows}"
+                )
+        except BaseException:
+            # Descongelar: el mes sigue completo en la base
+            if os.path.exists(path):
+                os.remove(path)
+            await _set_month_status(manifest, key, None)
+            raise
+
+        if file_rows == 0:
+            os.remove(path)
+            await _set_month_status(manifest, key, None)
+            return None
+
+        # Desde aquí los reportes leen el archivo (y descartan por id las filas que sigan en
+        # la base); si el borrado falla, se retoma en la siguiente corrida
+        entry.update(
+            rows=file_rows,
+            user_ids=sorted(user_ids),
+            status="deleting",
+            archived_at=datetime.utcnow().isoformat(),
+        )
+        _save_manifest(manifest)
+
+    deleted = await _delete_month(month, path)
+
+    # Los listados de los usuarios afectados cambian: invalidar sus ETags
+    async with AsyncSessionLocal() as session:
+        for user_id in entry["user_ids"]:
+            await bump_mark_version(session, user_id)
+        await session.commit()
+
+    entry["status"] = "complete"
+    _save_manifest(manifest)
+
+    logger.info("Archived %s: %d rows in file, %d deleted", key, entry["rows"], deleted)
+    return {"month": key, "rows": entry["rows"], "deleted": deleted}
+
+
+# --- Lectura ---
+
+@lru_cache(maxsize=None)
+def _archived_row_type(fields: tuple[str, ...]):
+    return namedtuple("ArchivedMark", fields)
+
+
+def _read_archived(start: datetime, end: datetime, user_id, fields: tuple[str, ...]) -> list:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    months = archived_months()
+    row_type = _archived_row_type(fields)
+    start_scalar = pa.scalar(start, pa.timestamp("us"))
+    end_scalar = pa.scalar(end, pa.timestamp("us"))
+    rows = []
+    month = _month_start(start)
+    while month <= end:
+        if _month_key(month) in months:
+            # Memory map: el SO pagina el archivo; se descomprime batch por batch
+            with pa.memory_map(_month_path(month), "r") as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    mask = pc.and_(
+                        pc.greater_equal(batch["timestamp"], start_scalar),
+                        pc.less_equal(batch["timestamp"], end_scalar),
+                    )
+                    if user_id is not None:
+                        mask = pc.and_(mask, pc.equal(batch["user_id"], user_id))
+                    selected = batch.filter(mask).select(list(fields))
+                    for record in selected.to_pylist():
+                        if "mark_type" in record:
+                            record["mark_type"] = MarkType[record["mark_type"]]
+                        rows.append(row_type(**record))
+        month = _next_month(month)
+    return rows
+
+
+async def read_archived_marks(
+    start: datetime,
+    end: datetime,
+    fields: tuple[str, ...],
+    user_id=None,
+) -> list:
+    """
+    Marcas archivadas en [start, end] (opcionalmente de un usuario), en orden de archivo
+    (cronológico dentro de cada mes). Devuelve lista vacía sin tocar disco si el rango
+    no incluye meses archivados.
+    """
+    months = archived_months()
+    if not months or _month_key(_month_start(start)) > max(months):
+        return []
+    return await asyncio.to_thread(_read_archived, start, end, user_id, fields)
+
+
+def merge_with_archived(archived: list, rows: list, sort_key) -> list:
+    """
+    Combina marcas archivadas con las de la base ordenadas por `sort_key`.
+    Descarta por id las filas de la base que ya están en el archivo (borrado aún en curso).
+    """
+    if not archived:
+        return rows
+    archived_ids = {row.id for row in archived}
+    merged = archived + [row for row in rows if row.id not in archived_ids]
+    merged.sort(key=sort_key)
+    return merged
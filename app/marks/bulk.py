@@ -0,0 +1,285 @@
+"""
+Ediciones de marcas en lote (POST /marks/bulk).
+
+El lote se aplica completo en una transacción o no se aplica: si alguna operación
+falla, la respuesta trae el resultado de cada una y no se escribe nada.
+1. Una consulta carga las marcas del lote y otra el vecindario de cada usuario afectado
+   (del clock in anterior a su primer cambio hasta el clock in posterior al último).
+2. Las ediciones se aplican en memoria y los clock outs movidos se revalidan contra el
+   estado final con las mismas reglas que validate_clock_out_timestamp.
+3. Se escribe con un solo UPDATE ... FROM (VALUES ...) y un solo DELETE.
+El número de statements no depende del tamaño del lote ni de los usuarios afectados
+(presupuesto de POST /marks/bulk en app/core/query_budget.py).
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Float, Integer, String, column, delete, tuple_, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.marks import payroll
+from app.marks import queries
+from app.marks.archive import archiving_detail, first_frozen, lock_archive_months_shared
+from app.marks.events import MarkEventType, publish_mark_events
+from app.marks.models import Mark, MarkType
+from app.marks.partitions import missing_partition_detail, missing_partitions
+from app.marks.schemas import MarkBulkOperation, MarkRead
+from app.marks.versions import bump_mark_versions
+
+marks_table = Mark.__table__
+
+
+class BulkItemError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _validate_clock_out(marks: list, clock_out) -> SimpleNamespace:
+    """
+    Mismas reglas que validate_clock_out_timestamp sobre las marcas en memoria del
+    usuario (orden cronológico). Devuelve el clock in de referencia.
+    """
+    base_clock_in = None
+    for mark in marks:
+        if mark.timestamp > clock_out.timestamp:
+            break
+        if mark.mark_type == MarkType.CLOCK_IN:
+            base_clock_in = mark
+    if base_clock_in is None:
+        raise BulkItemError(400, "Clock out requires an earlier clock in.")
+    if clock_out.timestamp <= base_clock_in.timestamp:
+        raise BulkItemError(400, "Clock out must occur after its reference clock in.")
+
+    next_clock_in = next(
+        (mark for mark in marks if mark.mark_type == MarkType.CLOCK_IN and mark.timestamp > base_clock_in.timestamp),
+        None
+    )
+    if next_clock_in is not None and clock_out.timestamp >= next_clock_in.timestamp:
+        raise BulkItemError(
+            400, f"Clock out overlaps with the next clock in at {next_clock_in.timestamp.isoformat()}."
+        )
+
+    for mark in marks:
+        if (
+            mark.mark_type == MarkType.CLOCK_OUT
+            and mark.id != clock_out.id
+            and mark.timestamp > base_clock_in.timestamp
+            and (next_clock_in is None or mark.timestamp < next_clock_in.timestamp)
+        ):
+            raise BulkItemError(400, "There is already a clock out registered for that interval.")
+    return base_clock_in
+
+
+def _touched_timestamps(original, mark: Optional[SimpleNamespace]) -> tuple[datetime, ...]:
+    """Instantes que toca una operación: la posición original y, si se edita, la nueva."""
+    return (original.timestamp,) if mark is None else (original.timestamp, mark.timestamp)
+
+
+def _apply_update(original, operation: MarkBulkOperation) -> tuple[SimpleNamespace, bool]:
+    """Estado nuevo de la marca en memoria y si hay que geocodificarla."""
+    mark = SimpleNamespace(**original._mapping)
+    if operation.timestamp is not None:
+        # Guardar como NAIVE LOCAL: si viene con tz, quitar tz sin convertir
+        mark.timestamp = operation.timestamp.replace(tzinfo=None)
+    if operation.latitude is not None:
+        mark.latitude = operation.latitude
+    if operation.longitude is not None:
+        mark.longitude = operation.longitude
+    if operation.address is not None:
+        mark.address = operation.address
+    if operation.po_number is not None:
+        if mark.mark_type == MarkType.CLOCK_OUT and operation.po_number != original.po_number:
+            raise BulkItemError(400, "Clock out PO number must match its clock in and cannot be modified.")
+        mark.po_number = operation.po_number
+
+    needs_geocoding = (
+        (operation.latitude is not None or operation.longitude is not None) and operation.address is None
+    )
+    if needs_geocoding:
+        # Dirección temporal mientras se geocodifica en background
+        mark.address = f"Lat: {mark.latitude:.6f}, Lon: {mark.longitude:.6f}"
+    return mark, needs_geocoding
+
+
+async def apply_bulk_operations(
+    session: AsyncSession, operations: list[MarkBulkOperation]
+) -> tuple[list[dict], list[tuple[int, float, float]]]:
+    """
+    Valida y escribe el lote en la transacción de `session` (sin commit).
+    Devuelve los resultados por operación y las marcas a geocodificar (id, lat, lon).
+    Si alguna operación falla lanza 400 con los resultados y no escribe nada.
+    """
+    results = [
+        {"index": index, "op": operation.op, "mark_id": operation.mark_id,
+         "status": "ok", "status_code": 200, "detail": None, "mark": None}
+        for index, operation in enumerate(operations)
+    ]
+    failed = False
+
+    def fail(result: dict, error: BulkItemError) -> None:
+        nonlocal failed
+        failed = True
+        result.update(status="error", status_code=error.status_code, detail=error.detail)
+
+    result_rows = await session.execute(
+        queries.MARKS_BY_IDS, {"mark_ids": list({operation.mark_id for operation in operations})}
+    )
+    originals = {row.id: row for row in result_rows}
+
+    # mark_id -> (resultado, original, estado nuevo o None si se elimina)
+    edits: dict[int, tuple[dict, object, Optional[SimpleNamespace]]] = {}
+    geocode: list[tuple[int, float, float]] = []
+    seen: set[int] = set()
+    for result, operation in zip(results, operations):
+        original = originals.get(operation.mark_id)
+        if operation.mark_id in seen:
+            fail(result, BulkItemError(400, "Mark appears more than once in the batch."))
+            continue
+        seen.add(operation.mark_id)
+        if original is None:
+            fail(result, BulkItemError(404, "Mark not found"))
+            continue
+        if operation.op == "delete":
+            edits[original.id] = (result, original, None)
+            continue
+        try:
+            mark, needs_geocoding = _apply_update(original, operation)
+        except BulkItemError as error:
+            fail(result, error)
+            continue
+        edits[original.id] = (result, original, mark)
+        if needs_geocoding:
+            geocode.append((mark.id, mark.latitude, mark.longitude))
+
+    # Periodos de nómina cerrados: una consulta para todo el lote (ni desde ni hacia uno)
+    touched = [
+        timestamp for _, original, mark in edits.values() for timestamp in _touched_timestamps(original, mark)
+    ]
+    if touched:
+        closed_periods = await payroll.closed_periods_between(session, min(touched), max(touched))
+        for mark_id, (result, original, mark) in list(edits.items()):
+            period = next((
+                period for period in closed_periods
+                if any(
+                    period.range_start <= timestamp <= period.range_end
+                    for timestamp in _touched_timestamps(original, mark)
+                )
+            ), None)
+            if period is not None:
+                fail(result, BulkItemError(409, payroll.closed_period_detail(period)))
+                del edits[mark_id]
+
+        # Meses que se están archivando (ni desde ni hacia uno)
+        frozen_months = await lock_archive_months_shared(session)
+        for mark_id, (result, original, mark) in list(edits.items()):
+            frozen = first_frozen(frozen_months, _touched_timestamps(original, mark))
+            if frozen is not None:
+                fail(result, BulkItemError(409, archiving_detail(frozen)))
+                del edits[mark_id]
+
+    # Marcas movidas a un mes sin partición (el request no las crea, ver app/marks/partitions.py)
+    moved = {
+        mark_id: mark.timestamp for mark_id, (_, original, mark) in edits.items()
+        if mark is not None and mark.timestamp != original.timestamp
+    }
+    missing_months = await missing_partitions(session, moved.values())
+    for mark_id, timestamp in moved.items():
+        if (timestamp.year, timestamp.month) in missing_months:
+            fail(edits[mark_id][0], BulkItemError(400, missing_partition_detail(timestamp)))
+            del edits[mark_id]
+
+    # Vecindario de todos los usuarios en una consulta, con el lote aplicado en memoria
+    by_user: dict[int, list[int]] = {}
+    for mark_id, (_, original, _) in edits.items():
+        by_user.setdefault(original.user_id, []).append(mark_id)
+    windows = {
+        user_id: [timestamp for mark_id in mark_ids for timestamp in _touched_timestamps(*edits[mark_id][1:])]
+        for user_id, mark_ids in by_user.items()
+    }
+    neighbourhoods: dict[int, dict] = {user_id: {} for user_id in by_user}
+    if by_user:
+        rows = await session.execute(queries.USERS_NEIGHBOURHOODS, {
+            "user_ids": list(windows),
+            "los": [min(timestamps) for timestamps in windows.values()],
+            "his": [max(timestamps) for timestamps in windows.values()],
+            "exclude_ids": list(edits),
+        })
+        for row in rows:
+            neighbourhoods[row.user_id][row.id] = row
+    for user_id, mark_ids in by_user.items():
+        state = neighbourhoods[user_id]
+        for mark_id in mark_ids:
+            state.pop(mark_id, None)
+            if edits[mark_id][2] is not None:
+                state[mark_id] = edits[mark_id][2]
+        marks = sorted(state.values(), key=lambda mark: (mark.timestamp, mark.id))
+
+        for mark_id in mark_ids:
+            result, original, mark = edits[mark_id]
+            moved_clock_out = (
+                mark is not None and mark.mark_type == MarkType.CLOCK_OUT
+                and mark.timestamp != original.timestamp
+            )
+            if not moved_clock_out:
+                continue
+            try:
+                base_clock_in = _validate_clock_out(marks, mark)
+            except BulkItemError as error:
+                fail(result, error)
+                continue
+            mark.po_number = base_clock_in.po_number
+
+    if failed:
+        raise HTTPException(status_code=400, detail={"message": "No changes were applied", "results": results})
+
+    updated = [(original, mark) for _, original, mark in edits.values() if mark is not None]
+    deleted = [original for _, original, mark in edits.values() if mark is None]
+
+    if updated:
+        rows = values(
+            column("id", Integer),
+            column("old_timestamp", DateTime),
+            column("timestamp", DateTime),
+            column("latitude", Float),
+            column("longitude", Float),
+            column("address", String),
+            column("po_number", String),
+            name="edits",
+        ).data([
+            (mark.id, original.timestamp, mark.timestamp, mark.latitude, mark.longitude, mark.address, mark.po_number)
+            for original, mark in updated
+        ])
+        await session.execute(
+            update(marks_table)
+            .where(marks_table.c.id == rows.c.id, marks_table.c.timestamp == rows.c.old_timestamp)
+            .values(
+                timestamp=rows.c.timestamp,
+                latitude=rows.c.latitude,
+                longitude=rows.c.longitude,
+                address=rows.c.address,
+                po_number=rows.c.po_number,
+            )
+        )
+
+    if deleted:
+        await session.execute(
+            delete(marks_table).where(
+                tuple_(marks_table.c.id, marks_table.c.timestamp).in_(
+                    [(original.id, original.timestamp) for original in deleted]
+                )
+            )
+        )
+
+    if by_user:
+        await bump_mark_versions(session, by_user)
+    for original, mark in updated:
+        edits[mark.id][0]["mark"] = MarkRead.model_validate(mark)
+    await publish_mark_events(
+        session,
+        [(MarkEventType.UPDATED, mark) for _, mark in updated]
+        + [(MarkEventType.DELETED, original) for original in deleted],
+    )
+
+    return results, geocode
@@ -0,0 +1,267 @@
+"""
+Digest semanal por email: el reporte semanal de cada empleado, enviado por SMTP.
+
+1. Los reportes de todos los usuarios se calculan en una sola pasada sobre las marcas
+   del rango (weekly_reports_for_all_users), o se leen de los snapshots si el rango es un
+   periodo de nómina cerrado: lo mismo que devolvería GET /marks/weekly-report.
+2. Cada reporte se renderiza a un email (texto y HTML) y pasa por una cola acotada.
+3. DIGEST_SMTP_CONNECTIONS senders toman los emails de la cola; cada uno reutiliza una
+   sola conexión SMTP para todos sus envíos (la reabre si el servidor la corta) y
+   reintenta los errores transitorios con backoff. Los rechazos permanentes (5xx) no se
+   reintentan.
+Con DIGEST_ADMIN_EMAILS los admins reciben además el resumen de horas de todos.
+
+Se corre con scripts/send_weekly_digests.py (cron o máquina programada de Fly).
+"""
+import asyncio
+import html
+import logging
+import time
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Callable, Optional
+import aiosmtplib
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+from app.marks import payroll, queries
+from app.marks.reports import SESSION_MARK_FIELDS, user_display_name, weekly_reports_for_all_users
+from app.marks.timezones import day_key_function, local_time_function
+
+env = get_env_vars()
+logger = logging.getLogger(__name__)
+
+# Espera antes de cada reintento (se duplica en cada intento)
+RETRY_BASE_SECONDS = 1.0
+
+
+def _local_time(value: Optional[str], to_local: Callable[[datetime], datetime]) -> str:
+    """Hora local (HH:MM) de un timestamp ISO del reporte."""
+    if not value:
+        return "--:--"
+    return to_local(datetime.fromisoformat(value)).strftime("%H:%M")
+
+
+def _session_rows(report: dict, to_local: Callable[[datetime], datetime]) -> list[tuple[str, str, str, str, str]]:
+    """(fecha, entrada, salida, PO, horas) por sesión, en el orden del reporte."""
+    rows = []
+    for day in report["daily_reports"]:
+        for session_obj in day["sessions"]:
+            clock_in = session_obj["clock_in"] or {}
+            clock_out = session_obj["clock_out"] or {}
+            rows.append((
+                day["date"],
+                _local_time(clock_in.get("timestamp"), to_local),
+                _local_time(clock_out.get("timestamp"), to_local),
+                clock_in.get("po_number") or "",
+                f"{session_obj['hours_worked']:.2f}" if session_obj["clock_out"] else "open",
+            ))
+    return rows
+
+
+def _html_table(headers: tuple[str, ...], rows: list[tuple]) -> str:
+    head = "".join(f"<th align=\"left\">{html.escape(h)}</th>" for h in headers)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>"
+        for row in rows
+    )
+    return f"<table cellpadding=\"4\" cellspacing=\"0\" border=\"1\"><tr>{head}</tr>{body}</table>"
+
+
+def render_user_digest(
+    report: dict,
+    to_address: str,
+    to_local: Optional[Callable[[datetime], datetime]] = None
+) -> EmailMessage:
+    """Email con el reporte semanal de un empleado (horas en local con `to_local`)."""
+    period = f"{report['start_date']} to {report['end_date']}"
+    rows = _session_rows(report, to_local or (lambda timestamp: timestamp))
+    headers = ("Date", "Clock in", "Clock out", "PO", "Hours")
+
+    lines = [f"Hi {report['user_name']},", "", f"Your hours for {period}: {report['total_hours']:.2f}", ""]
+    lines += [" | ".join(row) for row in rows] or ["No sessions recorded."]
+
+    message = EmailMessage()
+    message["From"] = env.DIGEST_FROM_EMAIL
+    message["To"] = to_address
+    message["Subject"] = f"Weekly hours {period}: {report['total_hours']:.2f} h"
+    message.set_content("\n".join(lines))
+    message.add_alternative(
+        f"<p>Hi {html.escape(report['user_name'])},</p>"
+        f"<p>Your hours for {html.escape(period)}: <b>{report['total_hours']:.2f}</b></p>"
+        + (_html_table(headers, rows) if rows else "<p>No sessions recorded.</p>"),
+        subtype="html",
+    )
+    return message
+
+
+def render_admin_digest(users, reports: dict[int, dict], start: str, end: str, to_addresses: list[str]) -> EmailMessage:
+    """Email con las horas de todos los empleados (el mismo contenido que el reporte sumario)."""
+    rows = [
+        (user_display_name(user), user.email, f"{reports[user.id]['total_hours']:.2f}")
+        for user in users if user.id in reports
+    ]
+    total = sum(report["total_hours"] for report in reports.values())
+    headers = ("Employee", "Email", "Hours")
+
+    message = EmailMessage()
+    message["From"] = env.DIGEST_FROM_EMAIL
+    message["To"] = ", ".join(to_addresses)
+    message["Subject"] = f"Weekly hours summary {start} to {end}: {total:.2f} h"
+    message.set_content("\n".join(" | ".join(row) for row in rows) or "No employees.")
+    message.add_alternative(
+        f"<p>Hours from {html.escape(start)} to {html.escape(end)}: <b>{total:.2f}</b></p>"
+        + _html_table(headers, rows),
+        subtype="html",
+    )
+    return message
+
+
+def _smtp_client() -> aiosmtplib.SMTP:
+    return aiosmtplib.SMTP(
+        hostname=env.SMTP_HOST,
+        port=env.SMTP_PORT,
+        username=env.SMTP_USERNAME,
+        password=env.SMTP_PASSWORD,
+        use_tls=env.SMTP_USE_TLS,
+        # None: STARTTLS si el servidor lo anuncia (un stand-in local no lo hace)
+        start_tls=False if env.SMTP_USE_TLS else None,
+        timeout=env.SMTP_TIMEOUT_SECONDS,
+    )
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Rechazos 5xx (destinatario o remitente inválido): reintentar no sirve."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(recipient.code >= 500 for recipient in error.recipients)
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+async def _sender(queue: asyncio.Queue, stats: dict) -> None:
+    """Envía los emails de la cola por una sola conexión SMTP reutilizada."""
+    smtp = _smtp_client()
+    try:
+        while True:
+            message = await queue.get()
+            if message is None:
+                return
+            for attempt in range(env.DIGEST_MAX_RETRIES + 1):
+                try:
+                    if not smtp.is_connected:
+                        await smtp.connect()
+                    await smtp.send_message(message)
+                    stats["sent"] += 1
+                    break
+                except (aiosmtplib.SMTPException, OSError) as e:
+                    if _is_permanent(e) or attempt == env.DIGEST_MAX_RETRIES:
+                        stats["failed"].append({"to": message["To"], "error": str(e)})
+                        logger.warning("Digest to %s failed: %s", message["To"], e)
+                        break
+                    stats["retries"] += 1
+                    # Conexión en estado desconocido: se reabre en el siguiente intento
+                    if smtp.is_connected and not isinstance(e, aiosmtplib.SMTPResponseException):
+                        smtp.close()
+                    await asyncio.sleep(RETRY_BASE_SECONDS * 2 ** attempt)
+                except Exception as e:
+                    # Un email que no se puede serializar no debe detener al sender
+                    stats["failed"].append({"to": message["To"], "error": str(e)})
+                    logger.exception("Digest to %s failed", message["To"])
+                    break
+    finally:
+        if smtp.is_connected:
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+
+async def send_messages(messages: list[EmailMessage], connections: Optional[int] = None) -> dict:
+    """Envía los emails con `connections` conexiones SMTP en paralelo. Devuelve el resumen."""
+    connections = max(1, min(connections or env.DIGEST_SMTP_CONNECTIONS, len(messages) or 1))
+    stats = {"sent": 0, "retries": 0, "failed": []}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=connections * 2)
+    senders = [asyncio.create_task(_sender(queue, stats)) for _ in range(connections)]
+    try:
+        for message in messages:
+            await queue.put(message)
+        for _ in senders:
+            await queue.put(None)
+        await asyncio.gather(*senders)
+    finally:
+        for task in senders:
+            task.cancel()
+    return stats
+
+
+async def send_weekly_digests(
+    session: AsyncSession,
+    start_date_obj: datetime,
+    end_date_obj: datetime,
+    timezone_offset_minutes: Optional[int] = None,
+    tz: Optional[str] = None,
+    redirect_to: Optional[str] = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Calcula, renderiza y envía los digests del rango. `redirect_to` manda todos los emails
+    a esa dirección (pruebas); `dry_run` renderiza sin enviar. Días y horas se muestran
+    en `tz` (IANA) o con el offset fijo. Devuelve el resumen y el
+    throughput de cada etapa.
+    """
+    started = time.perf_counter()
+    period = await payroll.find_closed_period(session, start_date_obj, end_date_obj)
+    if period is not None:
+        users = (await session.execute(queries.SUMMARY_USERS)).all()
+        reports = await payroll.load_snapshots(session, period)
+    else:
+        day_key = day_key_function(start_date_obj, end_date_obj, timezone_offset_minutes, tz)
+        users, reports = await weekly_reports_for_all_users(
+            session, start_date_obj, end_date_obj, SESSION_MARK_FIELDS, day_key
+        )
+    computed = time.perf_counter()
+
+    recipients = [
+        user for user in users
+        if user.is_active and user.id in reports
+        and not (env.DIGEST_SKIP_EMPTY and not reports[user.id]["daily_reports"])
+    ]
+    to_local = local_time_function(start_date_obj, end_date_obj, timezone_offset_minutes, tz)
+    messages = [
+        render_user_digest(reports[user.id], redirect_to or user.email, to_local)
+        for user in recipients
+    ]
+    admin_emails = [e.strip() for e in env.DIGEST_ADMIN_EMAILS.split(",") if e.strip()]
+    if admin_emails:
+        messages.append(render_admin_digest(
+            [user for user in users if user.is_active], reports,
+            start_date_obj.date().isoformat(), end_date_obj.date().isoformat(),
+            [redirect_to] if redirect_to else admin_emails,
+        ))
+    rendered = time.perf_counter()
+
+    stats = {"sent": 0, "retries": 0, "failed": []}
+    if not dry_run and messages:
+        stats = await send_messages(messages)
+    finished = time.perf_counter()
+
+    send_seconds = finished - rendered
+    summary = {
+        "start_date": start_date_obj.date().isoformat(),
+        "end_date": end_date_obj.date().isoformat(),
+        "from_snapshot": period is not None,
+        "users": len(users),
+        "messages": len(messages),
+        "sent": stats["sent"],
+        "retries": stats["retries"],
+        "failed": stats["failed"],
+        "compute_seconds": round(computed - started, 3),
+        "render_seconds": round(rendered - computed, 3),
+        "send_seconds": round(send_seconds, 3),
+        "messages_per_second": round(stats["sent"] / send_seconds, 1) if stats["sent"] and send_seconds > 0 else 0.0,
+    }
+    logger.info(
+        "Weekly digests %s..%s: %d/%d sent, %d failed, %d retries (compute %.2fs, render %.2fs, send %.2fs, %.1f msg/s)",
+        summary["start_date"], summary["end_date"], summary["sent"], summary["messages"], len(summary["failed"]),
+        summary["retries"], summary["compute_seconds"], summary["render_seconds"], summary["send_seconds"],
+        summary["messages_per_second"],
+    )
+    return summary
@@ -0,0 +1,129 @@
+"""
+Eventos en vivo de marcas (creada / actualizada / eliminada).
+
+Las rutas que escriben emiten NOTIFY en el canal MARK_EVENTS_CHANNEL dentro de su
+transacción (Postgres lo entrega solo si hace commit). Cada worker recibe los eventos
+por su única conexión LISTEN (app.db.notifications.listener) y `mark_event_hub` los
+reparte a los clientes SSE conectados, cada uno con un buffer acotado.
+"""
+import asyncio
+import enum
+import json
+import logging
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+from app.core.metrics import registry, Counter, Gauge
+from app.db.notifications import publish, publish_many
+from app.marks.models import Mark
+from app.marks.schemas import MarkRead
+
+logger = logging.getLogger(__name__)
+
+env = get_env_vars()
+
+MARK_EVENTS_CHANNEL = "mark_events"
+
+
+class MarkEventType(str, enum.Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+
+def _event_payload(event_type: MarkEventType, mark: Mark) -> str:
+    if event_type == MarkEventType.DELETED:
+        data = {"id": mark.id, "user_id": mark.user_id}
+    else:
+        data = MarkRead.model_validate(mark).model_dump(mode="json")
+    return json.dumps({"event": event_type.value, "mark": data})
+
+
+async def publish_mark_event(session: AsyncSession, event_type: MarkEventType, mark: Mark) -> None:
+    """
+    Emite el evento de `mark` dentro de la transacción de la sesión.
+    Llamar antes del commit; hace flush para que la marca nueva tenga id.
+    """
+    if event_type != MarkEventType.DELETED:
+        await session.flush()
+    await publish(session, MARK_EVENTS_CHANNEL, _event_payload(event_type, mark))
+
+
+async def publish_mark_events(session: AsyncSession, events: list[tuple[MarkEventType, Mark]]) -> None:
+    """Emite varios eventos, en orden, con un solo statement (ediciones en lote)."""
+    if any(event_type != MarkEventType.DELETED for event_type, _ in events):
+        await session.flush()
+    await publish_many(session, MARK_EVENTS_CHANNEL, [_event_payload(event_type, mark) for event_type, mark in events])
+
+
+class LiveSubscriber:
+    """Un cliente conectado: cola acotada de frames SSE ya serializados."""
+
+    def __init__(self, buffer_size: int):
+        # None = fin del stream (cliente descartado o worker apagándose)
+        self.queue: asyncio.Queue[Optional[bytes]] = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+
+class MarkEventHub:
+    """
+    Reparte cada evento a todos los clientes del worker. El frame SSE se arma una sola vez;
+    si un cliente no consume y su buffer se llena, se descarta (recibe "reset" y debe
+    reconectarse y recargar el listado) en lugar de retrasar a los demás.
+    """
+
+    def __init__(self, buffer_size: int, max_subscribers: int):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: set[LiveSubscriber] = set()
+        self.dropped_total = 0
+
+    def subscribe(self) -> Optional[LiveSubscriber]:
+        """Registra un cliente; None si se alcanzó LIVE_MAX_SUBSCRIBERS."""
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        subscriber = LiveSubscriber(self.buffer_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LiveSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def dispatch(self, payload: str) -> None:
+        """Handler del canal MARK_EVENTS_CHANNEL."""
+        frame = f"event: mark\ndata: {payload}\n\n".encode()
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: LiveSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+        subscriber.dropped = True
+        self.dropped_total += 1
+        live_dropped.inc()
+        self._close(subscriber)
+
+    @staticmethod
+    def _close(subscriber: LiveSubscriber) -> None:
+        # Vaciar para que el fin de stream quepa y llegue sin esperar al resto del buffer
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def close_all(self) -> None:
+        """Termina todos los streams (apagado del worker)."""
+        for subscriber in list(self._subscribers):
+            self._subscribers.discard(subscriber)
+            self._close(subscriber)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+mark_event_hub = MarkEventHub(env.LIVE_CLIENT_BUFFER_SIZE, env.LIVE_MAX_SUBSCRIBERS)
+
+live_subscribers = registry.register(Gauge("marks_live_subscribers", "Connected live mark feed clients"))
+live_subscribers.set_function(lambda: len(mark_event_hub))
+live_dropped = registry.register(Counter("marks_live_dropped_total", "Live feed clients dropped for a full buffer"))
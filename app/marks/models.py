@@ -1,6 +1,8 @@
-from sqlalchemy import Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum, Index
+from sqlalchemy import text, Integer, BigInteger, String, Float, Date, DateTime, LargeBinary, ForeignKey, Enum as SQLEnum, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 from app.db.postgres_connector import Base
 import enum
 
@@ -13,23 +15,133 @@ class MarkType(str, enum.Enum):
 class Mark(Base):
     __tablename__ = "marks"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False, index=True)
+    # PK (id, timestamp): la tabla está particionada por mes y la PK debe incluir la llave de partición
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False)
     mark_type: Mapped[MarkType] = mapped_column(SQLEnum(MarkType), nullable=False)
-    timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, primary_key=True)
     latitude: Mapped[float] = mapped_column(Float, nullable=False)
     longitude: Mapped[float] = mapped_column(Float, nullable=False)
     address: Mapped[str] = mapped_column(String(500), nullable=True)
     po_number: Mapped[str] = mapped_column(String(100), nullable=True)  # Purchase Order number
+    # Lo fija el trigger marks_touch_updated_at en cada UPDATE (escaneo de anomalías)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     
     # Relationship
     user: Mapped["User"] = relationship("User", back_populates="marks")
     
-    # Índices compuestos para optimizar consultas comunes
+    # Índices (ver migraciones marksindexes004 y markstimestamp007)
     __table_args__ = (
-        # Índice para consultas por usuario y fecha (usado en reportes y filtros)
-        Index('idx_marks_user_timestamp', 'user_id', 'timestamp'),
-        # Índice para consultas por usuario, tipo y fecha
-        Index('idx_marks_user_type_timestamp', 'user_id', 'mark_type', 'timestamp'),
+        # Listados y reportes por usuario, más recientes primero, con columnas de proyección incluidas
+        Index(
+            'idx_marks_user_timestamp_covering', 'user_id', text('timestamp DESC'),
+            postgresql_include=['id', 'mark_type', 'po_number'],
+        ),
+        # Búsquedas del clock in de referencia
+        Index(
+            'idx_marks_clock_in_user_timestamp', 'user_id', 'timestamp',
+            postgresql_include=['id', 'po_number'],
+            postgresql_where=text("mark_type = 'CLOCK_IN'"),
+        ),
+        # Listado de todos los usuarios, más recientes primero, y rangos de tiempo
+        Index('idx_marks_timestamp_desc', text('timestamp DESC')),
+        # Ediciones desde la última pasada del escaneo de anomalías (migración anomalies006)
+        Index('idx_marks_updated_at', 'updated_at', postgresql_where=text("updated_at IS NOT NULL")),
+        # Particiones mensuales (creadas por ensure_marks_partitions, ver app/marks/partitions.py)
+        {"postgresql_partition_by": "RANGE (timestamp)"},
     )
 
+
+class MarkVersion(Base):
+    """
+    Versión de cambios de las marcas de un usuario.
+    Se incrementa en cada mutación de sus marcas y se expone como ETag en los listados.
+    """
+    __tablename__ = "mark_versions"
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class PayrollPeriod(Base):
+    """
+    Periodo de nómina. Al cerrarse se guardan snapshots de sus reportes (versión actual)
+    y las marcas dentro de [range_start, range_end] dejan de poder editarse.
+    """
+    __tablename__ = "payroll_periods"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    start_date: Mapped[date] = mapped_column(Date, nullable=False)
+    end_date: Mapped[date] = mapped_column(Date, nullable=False)
+    timezone_offset_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Zona IANA con la que se cerró (None: offset fijo)
+    timezone: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # Límites del periodo en timestamps de marks (mismos que calcula el reporte)
+    range_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    range_end: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    closed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    closed_by_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("user.id", ondelete="SET NULL"), nullable=True)
+
+
+class PayrollSnapshot(Base):
+    """Reporte semanal de un usuario en una versión de un periodo cerrado (JSON comprimido con zlib)."""
+    __tablename__ = "payroll_snapshots"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    period_id: Mapped[int] = mapped_column(Integer, ForeignKey("payroll_periods.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_hours: Mapped[float] = mapped_column(Float, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('period_id', 'version', 'user_id', name='payroll_snapshots_period_user_version'),
+    )
+
+
+class AnomalyKind(str, enum.Enum):
+    OPEN_SESSION = "open_session"
+    ORPHAN_CLOCK_OUT = "orphan_clock_out"
+    PO_MISMATCH = "po_mismatch"
+
+
+class MarkAnomaly(Base):
+    """
+    Anomalía detectada en una marca (ver app/marks/anomalies.py).
+    Se recalcula en cada escaneo para las marcas cercanas a los cambios.
+    """
+    __tablename__ = "mark_anomalies"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    mark_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    mark_timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    detail: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
+    detected_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('kind', 'mark_id', name='mark_anomalies_kind_mark'),
+        Index('idx_mark_anomalies_user_timestamp', 'user_id', 'mark_timestamp'),
+    )
+
+
+class AnomalyScanState(Base):
+    """Marcas de agua del último escaneo de anomalías (una sola fila, id = 1)."""
+    __tablename__ = "anomaly_scan_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, default=1)
+    last_mark_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_scanned_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class MarkRescanQueue(Base):
+    """Posición anterior de marcas eliminadas o movidas (la llena el trigger marks_queue_rescan)."""
+    __tablename__ = "marks_rescan_queue"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False)
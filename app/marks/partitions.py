@@ -0,0 +1,109 @@
+"""
+Mantenimiento de las particiones mensuales de marks.
+
+La tabla está particionada por rango mensual de timestamp (ver migración
+partitionmarks003) y no tiene partición DEFAULT, así que cada mes debe existir
+antes de insertar en él. Cada worker crea los meses futuros al arrancar y luego
+una vez al día (partition_maintenance_loop). Los requests nunca crean particiones:
+el DDL toma ACCESS EXCLUSIVE sobre marks y bloquearía todas las lecturas y escrituras
+mientras dure la transacción del request. Las marcas manuales del admin (fechas
+arbitrarias) solo verifican que su mes exista y fallan con 400 si no.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import DateTime, bindparam, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.postgres_connector import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Meses futuros que se mantienen creados
+MONTHS_AHEAD = 3
+
+# Cada cuánto se repite el mantenimiento en segundo plano
+MAINTENANCE_INTERVAL_SECONDS = 24 * 60 * 60
+
+# Parámetros: from_ts, to_ts
+ENSURE_PARTITIONS = select(func.ensure_marks_partitions(
+    bindparam("from_ts", type_=DateTime),
+    bindparam("to_ts", type_=DateTime),
+))
+
+# Parámetro: names. Las particiones que no existen; solo lee el catálogo (no toma locks sobre marks)
+MISSING_PARTITIONS = text("SELECT name FROM unnest(CAST(:names AS text[])) AS name WHERE to_regclass(name) IS NULL")
+
+# Meses (año, mes) que ya se sabe que existen en este proceso (nunca se eliminan)
+_known_months: set[tuple[int, int]] = set()
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month_index = value.month - 1 + months
+    return value.replace(
+        year=value.year + month_index // 12, month=month_index % 12 + 1, day=1,
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def missing_partition_detail(timestamp: datetime) -> str:
+    return f"Marks for {timestamp:%Y-%m} cannot be stored: that month has no partition"
+
+
+async def missing_partitions(session: AsyncSession, timestamps) -> set[tuple[int, int]]:
+    """
+    Meses (año, mes) de `timestamps` sin partición. Consulta el catálogo una sola vez por
+    los meses que este proceso todavía no vio (y solo recuerda los que existen).
+    """
+    unknown = {(timestamp.year, timestamp.month) for timestamp in timestamps} - _known_months
+    if not unknown:
+        return set()
+    names = {f"marks_{year:04d}_{month:02d}": (year, month) for year, month in unknown}
+    result = await session.execute(MISSING_PARTITIONS, {"names": list(names)})
+    missing = {names[name] for name in result.scalars()}
+    _known_months.update(unknown - missing)
+    return missing
+
+
+async def partition_exists(session: AsyncSession, timestamp: datetime) -> bool:
+    """Si existe la partición del mes de `timestamp` (ver missing_partitions)."""
+    return not await missing_partitions(session, (timestamp,))
+
+
+async def require_partition_for(session: AsyncSession, timestamp: datetime) -> None:
+    """Falla con 400 si el mes de `timestamp` no tiene partición (no la crea)."""
+    if not await partition_exists(session, timestamp):
+        raise HTTPException(status_code=400, detail=missing_partition_detail(timestamp))
+
+
+async def ensure_future_partitions(months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Crea las particiones del mes actual y los `months_ahead` siguientes en su propia
+    transacción corta. Devuelve cuántas creó. Los meses se recuerdan después del commit.
+    """
+    now = datetime.utcnow()
+    until = _add_months(now, months_ahead)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(ENSURE_PARTITIONS, {"from_ts": now, "to_ts": until})
+        created = result.scalar_one()
+        await session.commit()
+
+    month = _add_months(now, 0)
+    while month <= until:
+        _known_months.add((month.year, month.month))
+        month = _add_months(month, 1)
+    return created
+
+
+async def partition_maintenance_loop() -> None:
+    """Tarea de fondo del worker: mantiene creados los meses futuros."""
+    while True:
+        try:
+            created = await ensure_future_partitions()
+            if created:
+                logger.info("Created %d marks partitions", created)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Marks partition maintenance failed")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
@@ -0,0 +1,175 @@
+"""
+Periodos de nómina cerrados: snapshots inmutables de los reportes semanales.
+
+Al cerrar un periodo se calcula el reporte semanal de cada usuario y se guarda como
+JSON versionado comprimido con zlib (payroll_snapshots). El periodo guarda la zona del
+cierre (?tz= o offset fijo): los reportes de las mismas fechas en esa zona tienen el mismo
+rango UTC y se sirven desde los snapshots en lugar de recalcularse, y las
+ediciones de admin sobre marcas de un periodo cerrado se rechazan con 409: para
+corregirlo hay que reabrirlo y volver a cerrarlo, lo que genera una versión nueva.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select, bindparam, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.marks.models import PayrollPeriod, PayrollSnapshot
+
+# Versión del formato del JSON guardado
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Advisory lock de transacción: compartido en las ediciones, exclusivo al cerrar/reabrir,
+# para que ninguna edición se cuele entre el cálculo del snapshot y el cierre
+PAYROLL_LOCK_KEY = 42042042
+
+# Periodo cerrado que contiene un instante. Parámetros: timestamp
+CLOSED_PERIOD_AT = (
+    select(PayrollPeriod.id, PayrollPeriod.start_date, PayrollPeriod.end_date)
+    .where(
+        PayrollPeriod.closed_at.is_not(None),
+        PayrollPeriod.range_start <= bindparam("timestamp"),
+        PayrollPeriod.range_end >= bindparam("timestamp"),
+    )
+    .limit(1)
+)
+
+# Periodos cerrados que se solapan con un rango. Parámetros: start, end
+CLOSED_PERIODS_OVERLAPPING = select(
+    PayrollPeriod.start_date, PayrollPeriod.end_date, PayrollPeriod.range_start, PayrollPeriod.range_end
+).where(
+    PayrollPeriod.closed_at.is_not(None),
+    PayrollPeriod.range_start <= bindparam("end"),
+    PayrollPeriod.range_end >= bindparam("start"),
+)
+
+# Periodo cerrado con exactamente ese rango. Parámetros: range_start, range_end
+CLOSED_PERIOD_BY_RANGE = select(PayrollPeriod).where(
+    PayrollPeriod.closed_at.is_not(None),
+    PayrollPeriod.range_start == bindparam("range_start"),
+    PayrollPeriod.range_end == bindparam("range_end"),
+)
+
+# Snapshot de un usuario en una versión. Parámetros: period_id, version, user_id
+USER_SNAPSHOT = select(PayrollSnapshot.data).where(
+    PayrollSnapshot.period_id == bindparam("period_id"),
+    PayrollSnapshot.version == bindparam("version"),
+    PayrollSnapshot.user_id == bindparam("user_id"),
+)
+
+# Snapshots de todos los usuarios en una versión. Parámetros: period_id, version
+SNAPSHOTS = select(PayrollSnapshot.user_id, PayrollSnapshot.data).where(
+    PayrollSnapshot.period_id == bindparam("period_id"),
+    PayrollSnapshot.version == bindparam("version"),
+)
+
+# Totales de todos los usuarios en una versión. Parámetros: period_id, version
+SNAPSHOT_TOTALS = select(PayrollSnapshot.user_id, PayrollSnapshot.total_hours).where(
+    PayrollSnapshot.period_id == bindparam("period_id"),
+    PayrollSnapshot.version == bindparam("version"),
+)
+
+
+async def lock_payroll_shared(session: AsyncSession) -> None:
+    await session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": PAYROLL_LOCK_KEY})
+
+
+async def lock_payroll_exclusive(session: AsyncSession) -> None:
+    await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PAYROLL_LOCK_KEY})
+
+
+async def ensure_not_closed(session: AsyncSession, *timestamps: datetime) -> None:
+    """409 si algún instante cae en un periodo cerrado (toma el lock compartido)."""
+    await lock_payroll_shared(session)
+    for timestamp in timestamps:
+        period = (await session.execute(CLOSED_PERIOD_AT, {"timestamp": timestamp})).first()
+        if period is not None:
+            raise HTTPException(status_code=409, detail=closed_period_detail(period))
+
+
+async def closed_periods_between(session: AsyncSession, start: datetime, end: datetime) -> list:
+    """
+    Periodos cerrados que se solapan con [start, end] (toma el lock compartido), para
+    comprobar muchos instantes en memoria en lugar de una consulta por instante.
+    """
+    await lock_payroll_shared(session)
+    result = await session.execute(CLOSED_PERIODS_OVERLAPPING, {"start": start, "end": end})
+    return result.all()
+
+
+def closed_period_detail(period) -> str:
+    return (
+        f"Payroll period {period.start_date.isoformat()} to {period.end_date.isoformat()} "
+        "is closed. Reopen it to modify its marks."
+    )
+
+
+def compress_report(report: dict, version: int) -> bytes:
+    document = {"format": SNAPSHOT_FORMAT_VERSION, "version": version, "report": report}
+    return zlib.compress(json.dumps(document, separators=(",", ":")).encode(), 6)
+
+
+def decompress_report(data: bytes) -> dict:
+    document = json.loads(zlib.decompress(data))
+    return document["report"]
+
+
+async def find_closed_period(session: AsyncSession, range_start: datetime, range_end: datetime) -> Optional[PayrollPeriod]:
+    result = await session.execute(CLOSED_PERIOD_BY_RANGE, {"range_start": range_start, "range_end": range_end})
+    return result.scalar_one_or_none()
+
+
+async def load_user_snapshot(session: AsyncSession, period: PayrollPeriod, user_id: int) -> Optional[dict]:
+    """Reporte guardado de un usuario (None si no tenía snapshot en esa versión)."""
+    data = (await session.execute(
+        USER_SNAPSHOT, {"period_id": period.id, "version": period.version, "user_id": user_id}
+    )).scalar_one_or_none()
+    return decompress_report(data) if data is not None else None
+
+
+async def load_snapshots(session: AsyncSession, period: PayrollPeriod) -> dict[int, dict]:
+    """Reportes guardados de todos los usuarios en la versión vigente del periodo."""
+    result = await session.execute(SNAPSHOTS, {"period_id": period.id, "version": period.version})
+    return {user_id: decompress_report(data) for user_id, data in result}
+
+
+async def load_snapshot_totals(session: AsyncSession, period: PayrollPeriod) -> dict[int, float]:
+    result = await session.execute(SNAPSHOT_TOTALS, {"period_id": period.id, "version": period.version})
+    return dict(result.all())
+
+
+async def get_period_for_close(
+    session: AsyncSession, range_start: datetime, range_end: datetime
+) -> Optional[PayrollPeriod]:
+    """Periodo (abierto o cerrado) con exactamente ese rango."""
+    result = await session.execute(
+        select(PayrollPeriod)
+        .where(PayrollPeriod.range_start == range_start, PayrollPeriod.range_end == range_end)
+        .with_for_update()
+    )
+    return result.scalar_one_or_none()
+
+
+async def store_snapshots(session: AsyncSession, period: PayrollPeriod, reports: dict[int, dict]) -> None:
+    """Guarda los reportes por usuario como la versión `period.version`."""
+    session.add_all([
+        PayrollSnapshot(
+            period_id=period.id,
+            user_id=user_id,
+            version=period.version,
+            total_hours=report["total_hours"],
+            data=compress_report(report, period.version),
+        )
+        for user_id, report in reports.items()
+    ])
+    await session.flush()
+
+
+async def snapshot_sizes(session: AsyncSession, period: PayrollPeriod) -> tuple[int, int]:
+    """(snapshots, bytes comprimidos) de la versión actual."""
+    result = await session.execute(
+        select(func.count(), func.coalesce(func.sum(func.length(PayrollSnapshot.data)), 0))
+        .where(PayrollSnapshot.period_id == period.id, PayrollSnapshot.version == period.version)
+    )
+    return tuple(result.one())
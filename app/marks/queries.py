@@ -0,0 +1,239 @@
+"""
+Statements pre-construidos y parametrizados para las consultas frecuentes de marcas.
+
+Cada statement se construye una sola vez (o una vez por combinación de columnas) con
+bindparam() para los valores del request. Así no se reconstruye ni se recalcula la
+cache key en cada request, SQLAlchemy reutiliza la compilación cacheada y asyncpg
+reutiliza el prepared statement del servidor (mismo SQL en cada ejecución).
+"""
+from functools import lru_cache
+from sqlalchemy import DateTime, Integer, and_, column, func, literal_column, select, bindparam, true
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import aliased
+from app.marks.models import Mark, MarkType
+from app.users.models import User
+
+# Columnas que expone MarkRead: las rutas de listado seleccionan solo estas
+# columnas como filas en lugar de hidratar entidades Mark completas
+MARK_READ_COLUMNS = (
+    Mark.id,
+    Mark.user_id,
+    Mark.mark_type,
+    Mark.timestamp,
+    Mark.latitude,
+    Mark.longitude,
+    Mark.address,
+    Mark.po_number,
+)
+
+# Campos seleccionables con ?fields= en los listados
+MARK_FIELD_COLUMNS = {column.key: column for column in MARK_READ_COLUMNS}
+MARK_WITH_USER_FIELD_COLUMNS = {
+    **MARK_FIELD_COLUMNS,
+    "user_email": User.email.label("user_email"),
+    "user_first_name": User.first_name.label("user_first_name"),
+    "user_last_name": User.last_name.label("user_last_name"),
+}
+
+# Columnas que el emparejamiento de sesiones necesita siempre
+SESSION_BASE_COLUMNS = (Mark.id, Mark.mark_type, Mark.timestamp)
+
+
+# --- Lookups por id ---
+
+# Parámetros: mark_id
+MARK_BY_ID = select(Mark).where(Mark.id == bindparam("mark_id"))
+
+# Parámetros: user_id
+USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+
+
+# --- Clock in de referencia (validate_clock_out_timestamp / update_mark) ---
+
+# Parámetros: clock_in_id, user_id
+CLOCK_IN_BY_ID = select(Mark).where(
+    Mark.id == bindparam("clock_in_id"),
+    Mark.user_id == bindparam("user_id"),
+    Mark.mark_type == MarkType.CLOCK_IN,
+)
+
+# Último clock in en o antes de un instante. Parámetros: user_id, timestamp
+LATEST_CLOCK_IN_AT_OR_BEFORE = (
+    select(Mark)
+    .where(
+        Mark.user_id == bindparam("user_id"),
+        Mark.mark_type == MarkType.CLOCK_IN,
+        Mark.timestamp <= bindparam("timestamp"),
+    )
+    .order_by(Mark.timestamp.desc())
+    .limit(1)
+)
+
+# Siguiente clock in estrictamente después de un instante. Parámetros: user_id, timestamp
+NEXT_CLOCK_IN_AFTER = (
+    select(Mark)
+    .where(
+        Mark.user_id == bindparam("user_id"),
+        Mark.mark_type == MarkType.CLOCK_IN,
+        Mark.timestamp > bindparam("timestamp"),
+    )
+    .order_by(Mark.timestamp)
+    .limit(1)
+)
+
+
+@lru_cache(maxsize=None)
+def clock_out_overlap_query(exclude_mark: bool, bounded: bool):
+    """
+    Primer clock out después de un clock in (y antes del siguiente, si `bounded`).
+    Parámetros: user_id, after, [exclude_mark_id], [before]
+    """
+    query = select(Mark).where(
+        Mark.user_id == bindparam("user_id"),
+        Mark.mark_type == MarkType.CLOCK_OUT,
+        Mark.timestamp > bindparam("after"),
+    )
+    if exclude_mark:
+        query = query.where(Mark.id != bindparam("exclude_mark_id"))
+    if bounded:
+        query = query.where(Mark.timestamp < bindparam("before"))
+    return query.order_by(Mark.timestamp).limit(1)
+
+
+
+# --- Ediciones en lote (POST /marks/bulk) ---
+
+# Una ventana [lo, hi] por usuario afectado. Parámetros: user_ids, los, his (mismo largo)
+_NEIGHBOURHOOD_WINDOWS = func.unnest(
+    bindparam("user_ids", type_=ARRAY(Integer)),
+    bindparam("los", type_=ARRAY(DateTime)),
+    bindparam("his", type_=ARRAY(DateTime)),
+).table_valued(column("user_id", Integer), column("lo", DateTime), column("hi", DateTime)).render_derived(name="windows")
+
+_BoundingMark = aliased(Mark, name="bounding")
+
+
+def _bounding_clock_in(aggregate, comparison):
+    return (
+        select(aggregate(_BoundingMark.timestamp))
+        .where(
+            _BoundingMark.user_id == _NEIGHBOURHOOD_WINDOWS.c.user_id,
+            _BoundingMark.mark_type == MarkType.CLOCK_IN,
+            comparison,
+            _BoundingMark.id.not_in(bindparam("exclude_ids", expanding=True)),
+        )
+        .correlate(_NEIGHBOURHOOD_WINDOWS)
+        .scalar_subquery()
+    )
+
+
+# Límites de cada ventana, calculados una vez por usuario (LATERAL)
+_NEIGHBOURHOOD_BOUNDS = select(
+    func.coalesce(
+        _bounding_clock_in(func.max, _BoundingMark.timestamp <= _NEIGHBOURHOOD_WINDOWS.c.lo),
+        literal_column("'-infinity'::timestamp"),
+    ).label("lo"),
+    func.coalesce(
+        _bounding_clock_in(func.min, _BoundingMark.timestamp > _NEIGHBOURHOOD_WINDOWS.c.hi),
+        literal_column("'infinity'::timestamp"),
+    ).label("hi"),
+).lateral("bounds")
+
+# Marcas de cada usuario desde el último clock in en o antes de su `lo` hasta el primero
+# después de su `hi`, sin contar las marcas que el lote modifica como límites: todo lo que
+# necesita la validación de clock outs de validate_clock_out_timestamp, en una sola consulta
+# para todo el lote. Parámetros: user_ids, los, his, exclude_ids
+USERS_NEIGHBOURHOODS = (
+    select(*MARK_READ_COLUMNS)
+    .select_from(_NEIGHBOURHOOD_WINDOWS)
+    .join(_NEIGHBOURHOOD_BOUNDS, true())
+    .join(Mark, and_(
+        Mark.user_id == _NEIGHBOURHOOD_WINDOWS.c.user_id,
+        Mark.timestamp >= _NEIGHBOURHOOD_BOUNDS.c.lo,
+        Mark.timestamp <= _NEIGHBOURHOOD_BOUNDS.c.hi,
+    ))
+    .order_by(Mark.user_id, Mark.timestamp, Mark.id)
+)
+
+# Parámetros: mark_ids
+MARKS_BY_IDS = select(*MARK_READ_COLUMNS).where(Mark.id.in_(bindparam("mark_ids", expanding=True)))
+
+# --- Listados ---
+# marks está particionada por mes: con ORDER BY timestamp DESC LIMIT n el planner usa un
+# Append ordenado sobre las particiones y se detiene en las más recientes. Los rangos de
+# los reportes (start/end como bindparam) se podan al iniciar la ejecución.
+
+@lru_cache(maxsize=256)
+def user_marks_query(fields: tuple[str, ...]):
+    """Marcas de un usuario, más recientes primero. Parámetros: user_id, limit"""
+    return (
+        select(*(MARK_FIELD_COLUMNS[f] for f in fields))
+        .where(Mark.user_id == bindparam("user_id"))
+        .order_by(Mark.timestamp.desc())
+        .limit(bindparam("limit", type_=Integer))
+    )
+
+
+@lru_cache(maxsize=256)
+def all_marks_query(fields: tuple[str, ...]):
+    """Marcas de todos los usuarios, más recientes primero. Parámetros: limit"""
+    query = select(*(MARK_WITH_USER_FIELD_COLUMNS[f] for f in fields)).select_from(Mark)
+    # Solo hacer JOIN con User si se pidió algún campo del usuario
+    if any(f.startswith("user_") and f != "user_id" for f in fields):
+        query = query.join(User, Mark.user_id == User.id)
+    return query.order_by(Mark.timestamp.desc()).limit(bindparam("limit", type_=Integer))
+
+
+# --- Reportes ---
+
+def user_range_fields(session_fields: tuple[str, ...]) -> tuple[str, ...]:
+    """Nombres de las columnas que devuelve user_range_query (mismo orden)."""
+    return ("id", "mark_type", "timestamp") + tuple(f for f in session_fields if f not in ("id", "timestamp"))
+
+
+@lru_cache(maxsize=64)
+def user_range_query(session_fields: tuple[str, ...]):
+    """
+    Marcas de un usuario en un rango, en orden cronológico, con las columnas
+    base de las sesiones más los campos pedidos. Parámetros: user_id, start, end
+    """
+    return (
+        select(*(MARK_FIELD_COLUMNS[f] for f in user_range_fields(session_fields)))
+        .where(
+            Mark.user_id == bindparam("user_id"),
+            Mark.timestamp >= bindparam("start"),
+            Mark.timestamp <= bindparam("end"),
+        )
+        .order_by(Mark.timestamp.asc())
+    )
+
+
+@lru_cache(maxsize=8)
+def all_users_range_query(session_fields: tuple[str, ...]):
+    """
+    Marcas de todos los usuarios en un rango con las columnas de las sesiones
+    (cierre de periodos de nómina). Parámetros: start, end
+    """
+    return (
+        select(Mark.user_id, *(MARK_FIELD_COLUMNS[f] for f in user_range_fields(session_fields)))
+        .where(
+            Mark.timestamp >= bindparam("start"),
+            Mark.timestamp <= bindparam("end"),
+        )
+        .order_by(Mark.user_id, Mark.timestamp.asc())
+    )
+
+
+# Marcas de todos los usuarios en un rango (solo columnas para totales). Parámetros: start, end
+ALL_USERS_RANGE = (
+    select(Mark.user_id, *SESSION_BASE_COLUMNS)
+    .where(
+        Mark.timestamp >= bindparam("start"),
+        Mark.timestamp <= bindparam("end"),
+    )
+    .order_by(Mark.user_id, Mark.timestamp.asc())
+)
+ALL_USERS_RANGE_FIELDS = ("user_id", "id", "mark_type", "timestamp")
+
+# Usuarios del reporte sumario, del cierre de nómina y del digest semanal
+SUMMARY_USERS = select(User.id, User.email, User.first_name, User.last_name, User.is_active).order_by(User.email)
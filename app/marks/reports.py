@@ -0,0 +1,187 @@
+"""
+Reporte semanal: emparejamiento de clock in/out en sesiones diarias y totales.
+
+Lo usan las rutas de reportes, el cierre de periodos de nómina y el digest semanal por
+email, para que todos calculen las horas con las mismas reglas.
+"""
+from datetime import datetime, timedelta, date
+from typing import Callable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.marks import queries
+from app.marks.archive import read_archived_marks, merge_with_archived
+from app.marks.models import Mark, MarkType
+from app.marks.timezones import get_zone, local_range_to_utc, utc_day_key
+
+# Campos de cada clock in/out dentro de las sesiones del reporte semanal
+SESSION_MARK_FIELDS = ("id", "timestamp", "address", "po_number", "latitude", "longitude")
+
+
+def _session_mark(mark, fields: tuple[str, ...]) -> dict:
+    """Construye el dict de una marca dentro de una sesión con los campos pedidos."""
+    data = {}
+    for field in fields:
+        value = getattr(mark, field)
+        data[field] = value.isoformat() if field == "timestamp" else value
+    return data
+
+
+def calculate_daily_sessions(
+    marks: List[Mark],
+    session_fields: tuple[str, ...] = SESSION_MARK_FIELDS,
+    day_key: Callable[[datetime], str] = utc_day_key
+) -> tuple[List[dict], float]:
+    """
+    Calcula las sesiones diarias y el total de horas a partir de una lista de marcas.
+    Reutilizable para reporte individual y sumario.
+    Acepta entidades Mark o filas de columnas; solo requiere mark_type y timestamp
+    más los campos de `session_fields` que se incluyen en cada clock in/out.
+    `day_key` da el día local de cada marca (ver app/marks/timezones.py).
+    """
+    # Agrupar y emparejar clock in/out permitiendo cruces de medianoche
+    daily_sessions: dict[str, dict] = {}
+    # Pila de sesiones abiertas (clock_in sin clock_out) durante el recorrido cronológico
+    # (day_key_del_clock_in, session_ref, timestamp_del_clock_in)
+    open_sessions_stack: list[tuple[str, dict, datetime]] = []
+
+    for mark in marks:
+        # Calcular la llave del día para la vista (se agrupa por fecha local del evento)
+        mark_day = day_key(mark.timestamp)
+
+        if mark_day not in daily_sessions:
+            daily_sessions[mark_day] = {
+                "date": mark_day,
+                "sessions": [],
+                "total_hours": 0,
+            }
+
+        if mark.mark_type == MarkType.CLOCK_IN:
+            # Crear la sesión y guardar referencia en la pila para un futuro CLOCK_OUT
+            session_obj = {
+                "clock_in": _session_mark(mark, session_fields),
+                "clock_out": None,
+                "hours_worked": 0,
+            }
+            daily_sessions[mark_day]["sessions"].append(session_obj)
+            open_sessions_stack.append((mark_day, session_obj, mark.timestamp))
+        elif mark.mark_type == MarkType.CLOCK_OUT:
+            # Emparejar con el último clock_in abierto, aunque sea de otro día
+            while open_sessions_stack:
+                in_day_key, session_ref, clock_in_time = open_sessions_stack.pop()
+                if session_ref.get("clock_out") is None:
+                    session_ref["clock_out"] = _session_mark(mark, session_fields)
+
+                    # Calcular horas trabajadas y sumar al día del clock_in
+                    hours_worked = (mark.timestamp - clock_in_time).total_seconds() / 3600
+                    session_ref["hours_worked"] = round(hours_worked, 2)
+                    daily_sessions[in_day_key]["total_hours"] += hours_worked
+                    break
+            # Si no hay clock_in abierto, ignoramos este clock_out "huérfano"
+    
+    # Calcular total de horas de la semana
+    total_week_hours = sum(day["total_hours"] for day in daily_sessions.values())
+    
+    # Convertir a lista ordenada por fecha
+    daily_list = sorted(daily_sessions.values(), key=lambda x: x["date"])
+
+    return daily_list, round(total_week_hours, 2)
+
+
+def resolve_report_range(
+    start_date: Optional[str],
+    end_date: Optional[str],
+    timezone_offset_minutes: Optional[int],
+    tz: Optional[str] = None
+) -> tuple[datetime, datetime]:
+    """
+    Calcula el rango [inicio, fin] de un reporte en UTC naive (lo que usan los índices).
+    Por defecto: sábado a viernes de la semana actual, ajustado al huso del cliente.
+    Con `tz` (nombre IANA) los días son locales de la zona, con su horario de verano;
+    tiene prioridad sobre timezone_offset_minutes. ValueError si una fecha no es YYYY-MM-DD
+    (UnknownTimeZone si la zona no existe).
+    """
+    # Calcular fechas por defecto (sábado a viernes)
+    if not start_date or not end_date:
+        today = datetime.now(get_zone(tz)).date() if tz else date.today()
+        # Encontrar el sábado más reciente
+        days_since_saturday = (today.weekday() + 2) % 7
+        last_saturday = today - timedelta(days=days_since_saturday)
+        next_friday = last_saturday + timedelta(days=6)
+        
+        start_date_obj = datetime.combine(last_saturday, datetime.min.time())
+        end_date_obj = datetime.combine(next_friday, datetime.max.time())
+    else:
+        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    # Zona IANA: cada límite con el offset vigente en esa fecha
+    if tz:
+        return local_range_to_utc(tz, start_date_obj.date(), end_date_obj.date())
+
+    # Ajustar el rango al huso horario del cliente si se proporciona
+    if timezone_offset_minutes is not None:
+        offset_delta = timedelta(minutes=timezone_offset_minutes)
+        start_date_obj = start_date_obj + offset_delta
+        end_date_obj = end_date_obj + offset_delta
+
+    return start_date_obj, end_date_obj
+
+
+def user_display_name(user) -> str:
+    return f"{user.first_name or ''} {user.last_name or ''}".strip() or user.email
+
+
+def weekly_report_payload(
+    user,
+    start_date_obj: datetime,
+    end_date_obj: datetime,
+    marks,
+    session_fields: tuple[str, ...],
+    day_key: Callable[[datetime], str] = utc_day_key
+) -> dict:
+    """Cuerpo del reporte semanal de un usuario (también es lo que guarda un snapshot de nómina)."""
+    daily_list, total_week_hours = calculate_daily_sessions(marks, session_fields, day_key)
+    return {
+        "user_id": user.id,
+        "user_email": user.email,
+        "user_name": user_display_name(user),
+        "start_date": start_date_obj.date().isoformat(),
+        "end_date": end_date_obj.date().isoformat(),
+        "daily_reports": daily_list,
+        "total_hours": total_week_hours
+    }
+
+
+async def weekly_reports_for_all_users(
+    session: AsyncSession,
+    start_date_obj: datetime,
+    end_date_obj: datetime,
+    session_fields: tuple[str, ...] = SESSION_MARK_FIELDS,
+    day_key: Callable[[datetime], str] = utc_day_key
+) -> tuple[list, dict[int, dict]]:
+    """
+    Reportes semanales de todos los usuarios en una sola pasada sobre las marcas del
+    rango (dos consultas, más los meses archivados). Devuelve (usuarios, {user_id: reporte}).
+    """
+    users = (await session.execute(queries.SUMMARY_USERS)).all()
+    marks_result = await session.execute(
+        queries.all_users_range_query(session_fields),
+        {"start": start_date_obj, "end": end_date_obj}
+    )
+    all_marks = marks_result.all()
+    archived = await read_archived_marks(
+        start_date_obj, end_date_obj,
+        fields=("user_id",) + queries.user_range_fields(session_fields),
+    )
+    all_marks = merge_with_archived(archived, all_marks, sort_key=lambda m: (m.user_id, m.timestamp))
+
+    marks_by_user = {}
+    for mark in all_marks:
+        marks_by_user.setdefault(mark.user_id, []).append(mark)
+
+    reports = {
+        user.id: weekly_report_payload(
+            user, start_date_obj, end_date_obj, marks_by_user.get(user.id, []), session_fields, day_key
+        )
+        for user in users
+    }
+    return users, reports
@@ -1,25 +1,126 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, func
-from datetime import datetime, timedelta, date, timezone
-from typing import List, Optional
-from app.db.postgres_connector import get_async_session, AsyncSessionLocal
-from app.marks.models import Mark, MarkType
-from app.marks.schemas import MarkCreate, MarkRead, MarkWithUser, MarkUpdate, MarkCreateAdmin, EmployeesSummaryReport, EmployeeSummary
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, List, Optional
+from app.core.dependencies import get_env_vars
+from app.core.logging_config import GEOCODING_LOGGER
+from app.db.postgres_connector import get_async_session, get_read_session, AsyncSessionLocal, replica_router
+from app.marks.models import AnomalyKind, Mark, MarkAnomaly, MarkType, PayrollPeriod
+from app.marks import payroll
+from app.marks import queries
+from app.marks.events import MarkEventType, publish_mark_event, mark_event_hub
+from app.marks.analytics import labor_heatmap
+from app.marks.anomalies import run_anomaly_scan
+from app.marks.bulk import apply_bulk_operations
+from app.marks.archive import (
+    read_archived_marks, merge_with_archived, archive_marks_before, load_manifest, archived_months,
+    ensure_not_archiving
+)
+from app.marks.partitions import require_partition_for
+from app.marks.queries import MARK_FIELD_COLUMNS, MARK_WITH_USER_FIELD_COLUMNS
+from app.marks.reports import (
+    SESSION_MARK_FIELDS, calculate_daily_sessions, resolve_report_range, user_display_name,
+    weekly_report_payload, weekly_reports_for_all_users
+)
+from app.marks.timezones import UnknownTimeZone, day_key_function
+from app.marks.schemas import (
+    MarkCreate, MarkRead, MarkWithUser, MarkUpdate, MarkCreateAdmin, EmployeesSummaryReport, EmployeeSummary,
+    PayrollPeriodClose, PayrollPeriodRead, MarkAnomalyRead, MarkBulkRequest, MarkBulkResult, LaborHeatmap,
+    mark_read_list_adapter, mark_with_user_list_adapter, sparse_row_list_adapter
+)
+from app.marks.versions import (
+    bump_mark_version, get_mark_version, mark_list_etag, etag_matches, not_modified_response, set_etag_headers
+)
 from app.users.models import User
-from app.users.routes import get_current_user, get_current_superuser
-import httpx  # type: ignore
+from app.users.routes import get_current_user, get_current_superuser, authenticate_token
 import asyncio
 import logging
 
+env = get_env_vars()
+
 router = APIRouter(prefix="/marks", tags=["marks"])
 logger = logging.getLogger(__name__)
+# Mensajes por marca de la geocodificación (muestreados, ver app/core/logging_config.py)
+geocoding_logger = logging.getLogger(GEOCODING_LOGGER)
+
+FIELDS_QUERY_DESCRIPTION = "Comma-separated list of fields to include (e.g. timestamp,mark_type,po_number)"
+
+
+def _sparse_list_responses(model) -> dict:
+    """
+    Documenta en OpenAPI un listado que se devuelve como Response ya serializada:
+    sin ?fields= son objetos completos de `model`, con ?fields= solo las columnas pedidas.
+    """
+    return {
+        200: {
+            "model": List[model],
+            "description": "Full objects, or only the requested columns when ?fields= is given",
+        }
+    }
+
+
+def _parse_fields(fields: Optional[str], allowed) -> Optional[tuple[str, ...]]:
+    """
+    Parsea el parámetro ?fields= contra los campos permitidos.
+    Devuelve None si no se pidió un subconjunto (respuesta completa).
+    """
+    if fields is None:
+        return None
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not requested:
+        return None
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    return requested
+
+
+def _json_list_response(adapter, rows) -> Response:
+    """
+    Valida filas de columnas con un TypeAdapter precompilado y las serializa a JSON
+    con pydantic-core, evitando la validación y el encoder genéricos de FastAPI.
+    """
+    items = adapter.validate_python(rows, from_attributes=True)
+    return Response(content=adapter.dump_json(items), media_type="application/json")
+
+
+def _sparse_list_response(rows) -> Response:
+    """Serializa filas proyectadas con ?fields= (solo las columnas pedidas)."""
+    return Response(
+        content=sparse_row_list_adapter.dump_json([row._asdict() for row in rows]),
+        media_type="application/json"
+    )
+
+
+async def get_user_read_session(
+    current_user: User = Depends(get_current_user)
+) -> AsyncGenerator[AsyncSession, None]:
+    """Sesión de lectura (réplica si aplica) para rutas del empleado autenticado."""
+    async for session in get_read_session(current_user.id):
+        yield session
+
+
+async def get_admin_read_session(
+    current_user: User = Depends(get_current_superuser)
+) -> AsyncGenerator[AsyncSession, None]:
+    """Sesión de lectura (réplica si aplica) para reportes y listados de admin."""
+    async for session in get_read_session(current_user.id):
+        yield session
 
 
 async def get_address_from_coords(latitude: float, longitude: float) -> str:
     """
     Obtiene la dirección usando reverse geocoding de Nominatim (OpenStreetMap)
     """
+    # Import diferido: httpx solo se necesita al geocodificar, no en el arranque
+    import httpx  # type: ignore
+
     try:
         async with httpx.AsyncClient() as client:
             response = await client.get(
@@ -36,7 +137,7 @@ async def get_address_from_coords(latitude: float, longitude: float) -> str:
                 data = response.json()
                 return data.get("display_name", "Unknown location")
     except Exception as e:
-        logger.warning(f"Error getting address: {e}")
+        geocoding_logger.warning("Error getting address: %s", e)
     
     return f"Lat: {latitude:.6f}, Lon: {longitude:.6f}"
 
@@ -51,17 +152,23 @@ async def update_mark_address_background(mark_id: int, latitude: float, longitud
         
         # Actualizar la marca en la base de datos
         async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Mark).where(Mark.id == mark_id)
-            )
+            result = await session.execute(queries.MARK_BY_ID, {"mark_id": mark_id})
             mark = result.scalar_one_or_none()
             
             if mark:
                 mark.address = address
+                await bump_mark_version(session, mark.user_id)
+                await publish_mark_event(session, MarkEventType.UPDATED, mark)
                 await session.commit()
-                logger.info(f"Address updated for mark {mark_id}: {address}")
+                geocoding_logger.info("Address updated for mark %s: %s", mark_id, address)
     except Exception as e:
-        logger.error(f"Error updating address for mark {mark_id}: {e}")
+        geocoding_logger.error("Error updating address for mark %s: %s", mark_id, e)
+
+
+async def geocode_marks_background(marks: list[tuple[int, float, float]]):
+    """Geocodifica varias marcas en una sola tarea, una a la vez (ediciones en lote)."""
+    for mark_id, latitude, longitude in marks:
+        await update_mark_address_background(mark_id, latitude, longitude)
 
 
 async def validate_clock_out_timestamp(
@@ -79,11 +186,8 @@ async def validate_clock_out_timestamp(
     # Obtener el clock in de referencia
     if clock_in_id is not None:
         clock_in_result = await session.execute(
-            select(Mark).where(
-                Mark.id == clock_in_id,
-                Mark.user_id == user_id,
-                Mark.mark_type == MarkType.CLOCK_IN
-            )
+            queries.CLOCK_IN_BY_ID,
+            {"clock_in_id": clock_in_id, "user_id": user_id}
         )
         base_clock_in = clock_in_result.scalar_one_or_none()
         if not base_clock_in:
@@ -93,14 +197,8 @@ async def validate_clock_out_timestamp(
             )
     else:
         clock_in_result = await session.execute(
-            select(Mark)
-            .where(
-                Mark.user_id == user_id,
-                Mark.mark_type == MarkType.CLOCK_IN,
-                Mark.timestamp <= timestamp
-            )
-            .order_by(Mark.timestamp.desc())
-            .limit(1)
+            queries.LATEST_CLOCK_IN_AT_OR_BEFORE,
+            {"user_id": user_id, "timestamp": timestamp}
         )
         base_clock_in = clock_in_result.scalar_one_or_none()
         if not base_clock_in:
@@ -117,14 +215,8 @@ async def validate_clock_out_timestamp(
 
     # Encontrar el siguiente clock in después del clock in de referencia
     next_clock_in_result = await session.execute(
-        select(Mark)
-        .where(
-            Mark.user_id == user_id,
-            Mark.mark_type == MarkType.CLOCK_IN,
-            Mark.timestamp > base_clock_in.timestamp
-        )
-        .order_by(Mark.timestamp)
-        .limit(1)
+        queries.NEXT_CLOCK_IN_AFTER,
+        {"user_id": user_id, "timestamp": base_clock_in.timestamp}
     )
     next_clock_in = next_clock_in_result.scalar_one_or_none()
 
@@ -138,21 +230,15 @@ async def validate_clock_out_timestamp(
         )
 
     # Validar que no exista ya un clock out en el intervalo
-    overlap_query = (
-        select(Mark)
-        .where(
-            Mark.user_id == user_id,
-            Mark.mark_type == MarkType.CLOCK_OUT,
-            Mark.timestamp > base_clock_in.timestamp
-        )
-    )
+    overlap_params = {"user_id": user_id, "after": base_clock_in.timestamp}
     if exclude_mark_id is not None:
-        overlap_query = overlap_query.where(Mark.id != exclude_mark_id)
+        overlap_params["exclude_mark_id"] = exclude_mark_id
     if next_clock_in:
-        overlap_query = overlap_query.where(Mark.timestamp < next_clock_in.timestamp)
+        overlap_params["before"] = next_clock_in.timestamp
 
     overlap_result = await session.execute(
-        overlap_query.order_by(Mark.timestamp).limit(1)
+        queries.clock_out_overlap_query(exclude_mark_id is not None, next_clock_in is not None),
+        overlap_params
     )
     overlap_mark = overlap_result.scalar_one_or_none()
 
@@ -165,73 +251,60 @@ async def validate_clock_out_timestamp(
     return base_clock_in, next_clock_in
 
 
-def _calculate_daily_sessions(marks: List[Mark]) -> tuple[List[dict], float]:
-    """
-    Calcula las sesiones diarias y el total de horas a partir de una lista de marcas.
-    Reutilizable para reporte individual y sumario.
-    """
-    # Agrupar y emparejar clock in/out permitiendo cruces de medianoche
-    daily_sessions: dict[str, dict] = {}
-    # Pila de sesiones abiertas (clock_in sin clock_out) durante el recorrido cronológico
-    open_sessions_stack: list[tuple[str, dict]] = []  # (day_key_del_clock_in, session_ref)
-
-    for mark in marks:
-        # Calcular la llave del día para la vista (se agrupa por fecha del evento)
-        day_key = mark.timestamp.date().isoformat()
-
-        if day_key not in daily_sessions:
-            daily_sessions[day_key] = {
-                "date": day_key,
-                "sessions": [],
-                "total_hours": 0,
-            }
-
-        if mark.mark_type == MarkType.CLOCK_IN:
-            # Crear la sesión y guardar referencia en la pila para un futuro CLOCK_OUT
-            session_obj = {
-                "clock_in": {
-                    "id": mark.id,
-                    "timestamp": mark.timestamp.isoformat(),
-                    "address": mark.address,
-                    "po_number": mark.po_number,
-                    "latitude": mark.latitude,
-                    "longitude": mark.longitude,
-                },
-                "clock_out": None,
-                "hours_worked": 0,
-            }
-            daily_sessions[day_key]["sessions"].append(session_obj)
-            open_sessions_stack.append((day_key, session_obj))
-        elif mark.mark_type == MarkType.CLOCK_OUT:
-            # Emparejar con el último clock_in abierto, aunque sea de otro día
-            while open_sessions_stack:
-                in_day_key, session_ref = open_sessions_stack.pop()
-                if session_ref.get("clock_out") is None:
-                    session_ref["clock_out"] = {
-                        "id": mark.id,
-                        "timestamp": mark.timestamp.isoformat(),
-                        "address": mark.address,
-                        "po_number": mark.po_number,
-                        "latitude": mark.latitude,
-                        "longitude": mark.longitude,
-                    }
-
-                    # Calcular horas trabajadas y sumar al día del clock_in
-                    clock_in_time = datetime.fromisoformat(session_ref["clock_in"]["timestamp"])
-                    clock_out_time = mark.timestamp
-                    hours_worked = (clock_out_time - clock_in_time).total_seconds() / 3600
-                    session_ref["hours_worked"] = round(hours_worked, 2)
-                    daily_sessions[in_day_key]["total_hours"] += hours_worked
-                    break
-            # Si no hay clock_in abierto, ignoramos este clock_out "huérfano"
-    
-    # Calcular total de horas de la semana
-    total_week_hours = sum(day["total_hours"] for day in daily_sessions.values())
-    
-    # Convertir a lista ordenada por fecha
-    daily_list = sorted(daily_sessions.values(), key=lambda x: x["date"])
+def _report_range(
+    start_date: Optional[str],
+    end_date: Optional[str],
+    timezone_offset_minutes: Optional[int],
+    tz: Optional[str] = None
+) -> tuple[datetime, datetime]:
+    """resolve_report_range con 400 para una fecha o una zona inválida."""
+    try:
+        return resolve_report_range(start_date, end_date, timezone_offset_minutes, tz)
+    except UnknownTimeZone as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+
+def _project_snapshot_fields(report: dict, session_fields: tuple[str, ...]) -> dict:
+    """Deja en cada clock in/out del snapshot solo los campos pedidos con ?fields=."""
+    if session_fields == SESSION_MARK_FIELDS:
+        return report
+    for day in report["daily_reports"]:
+        for session_obj in day["sessions"]:
+            for key in ("clock_in", "clock_out"):
+                if session_obj[key] is not None:
+                    session_obj[key] = {f: session_obj[key].get(f) for f in session_fields}
+    return report
 
-    return daily_list, round(total_week_hours, 2)
+
+async def _user_marks_response(
+    request: Request,
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    fields: Optional[str]
+) -> Response:
+    """
+    Listado de marcas de un usuario con ETag por versión de cambios.
+    La versión se lee antes que las marcas para que un ETag nunca describa datos más viejos.
+    """
+    selected = _parse_fields(fields, MARK_FIELD_COLUMNS)
+
+    version = await get_mark_version(session, user_id)
+    etag = mark_list_etag(request, user_id, version)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+
+    result = await session.execute(
+        queries.user_marks_query(selected or tuple(MARK_FIELD_COLUMNS)),
+        {"user_id": user_id, "limit": limit}
+    )
+    if selected is not None:
+        response = _sparse_list_response(result.all())
+    else:
+        response = _json_list_response(mark_read_list_adapter, result.all())
+    return set_etag_headers(response, etag)
 
 
 @router.post("/clock-in", response_model=MarkRead)
@@ -260,7 +333,10 @@ async def clock_in(
     )
     
     session.add(new_mark)
+    await bump_mark_version(session, new_mark.user_id)
+    await publish_mark_event(session, MarkEventType.CREATED, new_mark)
     await session.commit()
+    replica_router.note_write(current_user.id)
     await session.refresh(new_mark)
     
     # Actualizar dirección en background (no bloquea la respuesta)
@@ -297,7 +373,10 @@ async def clock_out(
     )
     
     session.add(new_mark)
+    await bump_mark_version(session, new_mark.user_id)
+    await publish_mark_event(session, MarkEventType.CREATED, new_mark)
     await session.commit()
+    replica_router.note_write(current_user.id)
     await session.refresh(new_mark)
     
     # Actualizar dirección en background (no bloquea la respuesta)
@@ -308,73 +387,50 @@ async def clock_out(
     return new_mark
 
 
-@router.get("/my-marks", response_model=List[MarkRead])
+@router.get("/my-marks", response_class=Response, responses=_sparse_list_responses(MarkRead))
 async def get_my_marks(
+    request: Request,
     current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_async_session),
-    limit: int = 100
+    session: AsyncSession = Depends(get_user_read_session),
+    limit: int = 100,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION)
 ):
-    """Obtener las marcas del usuario actual"""
-    result = await session.execute(
-        select(Mark)
-        .where(Mark.user_id == current_user.id)
-        .order_by(Mark.timestamp.desc())
-        .limit(limit)
-    )
-    marks = result.scalars().all()
-    return marks
+    """
+    Obtener las marcas del usuario actual.
+    Soporta GET condicional: con If-None-Match igual al ETag responde 304 sin consultar marks.
+    """
+    return await _user_marks_response(request, session, current_user.id, limit, fields)
 
 
-@router.get("/all", response_model=List[MarkWithUser])
+@router.get("/all", response_class=Response, responses=_sparse_list_responses(MarkWithUser))
 async def get_all_marks(
     _: User = Depends(get_current_superuser),
-    session: AsyncSession = Depends(get_async_session),
-    limit: int = 100
+    session: AsyncSession = Depends(get_admin_read_session),
+    limit: int = 100,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION)
 ):
     """Obtener todas las marcas de todos los usuarios (solo admin)"""
+    selected = _parse_fields(fields, MARK_WITH_USER_FIELD_COLUMNS)
     result = await session.execute(
-        select(Mark, User)
-        .join(User, Mark.user_id == User.id)
-        .order_by(Mark.timestamp.desc())
-        .limit(limit)
+        queries.all_marks_query(selected or tuple(MARK_WITH_USER_FIELD_COLUMNS)),
+        {"limit": limit}
     )
-    
-    marks_with_users = []
-    for mark, user in result.all():
-        mark_dict = {
-            "id": mark.id,
-            "user_id": mark.user_id,
-            "mark_type": mark.mark_type,
-            "timestamp": mark.timestamp,
-            "latitude": mark.latitude,
-            "longitude": mark.longitude,
-            "address": mark.address,
-            "po_number": mark.po_number,
-            "user_email": user.email,
-            "user_first_name": user.first_name,
-            "user_last_name": user.last_name,
-        }
-        marks_with_users.append(mark_dict)
-    
-    return marks_with_users
+    if selected is not None:
+        return _sparse_list_response(result.all())
+    return _json_list_response(mark_with_user_list_adapter, result.all())
 
 
-@router.get("/user/{user_id}", response_model=List[MarkRead])
+@router.get("/user/{user_id}", response_class=Response, responses=_sparse_list_responses(MarkRead))
 async def get_user_marks(
+    request: Request,
     user_id: int,
     _: User = Depends(get_current_superuser),
-    session: AsyncSession = Depends(get_async_session),
-    limit: int = 100
+    session: AsyncSession = Depends(get_admin_read_session),
+    limit: int = 100,
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION)
 ):
     """Obtener las marcas de un usuario específico (solo admin)"""
-    result = await session.execute(
-        select(Mark)
-        .where(Mark.user_id == user_id)
-        .order_by(Mark.timestamp.desc())
-        .limit(limit)
-    )
-    marks = result.scalars().all()
-    return marks
+    return await _user_marks_response(request, session, user_id, limit, fields)
 
 
 @router.get("/weekly-report/{user_id}")
@@ -383,65 +439,51 @@ async def get_weekly_report(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     timezone_offset_minutes: Optional[int] = Query(None, description="Client timezone offset in minutes (UTC - local)"),
+    tz: Optional[str] = Query(None, description="IANA time zone (e.g. America/Mexico_City); overrides timezone_offset_minutes"),
+    fields: Optional[str] = Query(None, description="Comma-separated clock in/out fields to include in each session (e.g. timestamp,po_number)"),
     _: User = Depends(get_current_superuser),
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(get_admin_read_session)
 ):
     """
     Obtener reporte semanal de un usuario con horas trabajadas.
     Por defecto: sábado a viernes de la semana actual.
     """
-    # Calcular fechas por defecto (sábado a viernes)
-    if not start_date or not end_date:
-        today = date.today()
-        # Encontrar el sábado más reciente
-        days_since_saturday = (today.weekday() + 2) % 7
-        last_saturday = today - timedelta(days=days_since_saturday)
-        next_friday = last_saturday + timedelta(days=6)
-        
-        start_date_obj = datetime.combine(last_saturday, datetime.min.time())
-        end_date_obj = datetime.combine(next_friday, datetime.max.time())
-    else:
-        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Ajustar el rango al huso horario del cliente si se proporciona
-    if timezone_offset_minutes is not None:
-        offset_delta = timedelta(minutes=timezone_offset_minutes)
-        start_date_obj = start_date_obj + offset_delta
-        end_date_obj = end_date_obj + offset_delta
+    session_fields = _parse_fields(fields, SESSION_MARK_FIELDS) or SESSION_MARK_FIELDS
+    start_date_obj, end_date_obj = _report_range(start_date, end_date, timezone_offset_minutes, tz)
     
     # Obtener usuario
-    user_result = await session.execute(select(User).where(User.id == user_id))
+    user_result = await session.execute(queries.USER_BY_ID, {"user_id": user_id})
     user = user_result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+
+    # Periodo de nómina cerrado: servir el snapshot guardado sin recalcular
+    period = await payroll.find_closed_period(session, start_date_obj, end_date_obj)
+    if period is not None:
+        report = await payroll.load_user_snapshot(session, period, user_id)
+        if report is not None:
+            report = _project_snapshot_fields(report, session_fields)
+            report["snapshot_version"] = period.version
+            return report
     
-    # Obtener todas las marcas en el rango de fechas
+    # Obtener todas las marcas en el rango de fechas (solo las columnas necesarias)
     result = await session.execute(
-        select(Mark)
-        .where(
-            and_(
-                Mark.user_id == user_id,
-                Mark.timestamp >= start_date_obj,
-                Mark.timestamp <= end_date_obj
-            )
-        )
-        .order_by(Mark.timestamp.asc())
+        queries.user_range_query(session_fields),
+        {"user_id": user_id, "start": start_date_obj, "end": end_date_obj}
+    )
+    marks = result.all()
+
+    # Meses archivados del rango (si los hay) se leen de los archivos Arrow
+    archived = await read_archived_marks(
+        start_date_obj, end_date_obj,
+        fields=queries.user_range_fields(session_fields),
+        user_id=user_id,
     )
-    marks = result.scalars().all()
+    marks = merge_with_archived(archived, marks, sort_key=lambda m: m.timestamp)
     
     # Usar función helper para calcular sesiones
-    daily_list, total_week_hours = _calculate_daily_sessions(marks)
-    
-    return {
-        "user_id": user_id,
-        "user_email": user.email,
-        "user_name": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.email,
-        "start_date": start_date_obj.date().isoformat(),
-        "end_date": end_date_obj.date().isoformat(),
-        "daily_reports": daily_list,
-        "total_hours": total_week_hours
-    }
+    day_key = day_key_function(start_date_obj, end_date_obj, timezone_offset_minutes, tz)
+    return weekly_report_payload(user, start_date_obj, end_date_obj, marks, session_fields, day_key)
 
 
 @router.get("/summary-report", response_model=EmployeesSummaryReport)
@@ -449,51 +491,50 @@ async def get_employees_summary_report(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     timezone_offset_minutes: Optional[int] = Query(None, description="Client timezone offset in minutes (UTC - local)"),
+    tz: Optional[str] = Query(None, description="IANA time zone (e.g. America/Mexico_City); overrides timezone_offset_minutes"),
     _: User = Depends(get_current_superuser),
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(get_admin_read_session)
 ):
     """
     Obtener un reporte sumario de horas de todos los empleados para un rango de fechas.
     """
-    # Calcular fechas por defecto (sábado a viernes)
-    if not start_date or not end_date:
-        today = date.today()
-        # Encontrar el sábado más reciente
-        days_since_saturday = (today.weekday() + 2) % 7
-        last_saturday = today - timedelta(days=days_since_saturday)
-        next_friday = last_saturday + timedelta(days=6)
-        
-        start_date_obj = datetime.combine(last_saturday, datetime.min.time())
-        end_date_obj = datetime.combine(next_friday, datetime.max.time())
-    else:
-        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Ajustar el rango al huso horario del cliente si se proporciona
-    if timezone_offset_minutes is not None:
-        offset_delta = timedelta(minutes=timezone_offset_minutes)
-        start_date_obj = start_date_obj + offset_delta
-        end_date_obj = end_date_obj + offset_delta
+    start_date_obj, end_date_obj = _report_range(start_date, end_date, timezone_offset_minutes, tz)
     
-    # Obtener todos los usuarios
-    users_result = await session.execute(select(User).order_by(User.email))
-    users = users_result.scalars().all()
+    # Obtener todos los usuarios (solo las columnas del resumen)
+    users_result = await session.execute(queries.SUMMARY_USERS)
+    users = users_result.all()
 
     employees_summary = []
 
+    # Periodo de nómina cerrado: totales guardados en los snapshots (sin descomprimir)
+    period = await payroll.find_closed_period(session, start_date_obj, end_date_obj)
+    if period is not None:
+        totals = await payroll.load_snapshot_totals(session, period)
+        return EmployeesSummaryReport(
+            start_date=start_date_obj.date().isoformat(),
+            end_date=end_date_obj.date().isoformat(),
+            employees=[
+                EmployeeSummary(
+                    user_id=user.id,
+                    user_email=user.email,
+                    user_name=user_display_name(user),
+                    total_hours=totals.get(user.id, 0.0)
+                )
+                for user in users
+            ],
+            snapshot_version=period.version
+        )
+
     # Obtener todas las marcas en el rango para todos los usuarios
     # Optimizacion: Obtener todas las marcas de una sola vez en lugar de N queries
+    # El resumen solo necesita los totales: no se leen direcciones ni coordenadas
     marks_result = await session.execute(
-        select(Mark)
-        .where(
-            and_(
-                Mark.timestamp >= start_date_obj,
-                Mark.timestamp <= end_date_obj
-            )
-        )
-        .order_by(Mark.user_id, Mark.timestamp.asc())
+        queries.ALL_USERS_RANGE,
+        {"start": start_date_obj, "end": end_date_obj}
     )
-    all_marks = marks_result.scalars().all()
+    all_marks = marks_result.all()
+    archived = await read_archived_marks(start_date_obj, end_date_obj, fields=queries.ALL_USERS_RANGE_FIELDS)
+    all_marks = merge_with_archived(archived, all_marks, sort_key=lambda m: (m.user_id, m.timestamp))
 
     # Agrupar marcas por usuario
     marks_by_user = {}
@@ -505,12 +546,12 @@ async def get_employees_summary_report(
     # Calcular horas para cada usuario
     for user in users:
         user_marks = marks_by_user.get(user.id, [])
-        _, total_hours = _calculate_daily_sessions(user_marks)
+        _, total_hours = calculate_daily_sessions(user_marks, session_fields=())
         
         employees_summary.append(EmployeeSummary(
             user_id=user.id,
             user_email=user.email,
-            user_name=f"{user.first_name or ''} {user.last_name or ''}".strip() or user.email,
+            user_name=user_display_name(user),
             total_hours=total_hours
         ))
     
@@ -525,7 +566,7 @@ async def get_employees_summary_report(
 async def update_mark(
     mark_id: int,
     mark_update: MarkUpdate,
-    _: User = Depends(get_current_superuser),
+    admin: User = Depends(get_current_superuser),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -533,13 +574,19 @@ async def update_mark(
     Permite actualizar timestamp, coordenadas, dirección y PO number.
     """
     # Obtener la marca
-    result = await session.execute(
-        select(Mark).where(Mark.id == mark_id)
-    )
+    result = await session.execute(queries.MARK_BY_ID, {"mark_id": mark_id})
     mark = result.scalar_one_or_none()
     
     if not mark:
         raise HTTPException(status_code=404, detail="Mark not found")
+
+    # No se modifican marcas de periodos de nómina cerrados (ni se mueven hacia uno)
+    closed_check = [mark.timestamp]
+    if mark_update.timestamp is not None:
+        closed_check.append(mark_update.timestamp.replace(tzinfo=None))
+    await payroll.ensure_not_closed(session, *closed_check)
+    # Ni de meses que se están archivando
+    await ensure_not_archiving(session, *closed_check)
     
     # Actualizar campos si se proporcionan
     new_timestamp = mark.timestamp
@@ -567,14 +614,8 @@ async def update_mark(
     # Validar que el clock out no se sobreponga con otros registros
     if mark.mark_type == MarkType.CLOCK_OUT and mark_update.timestamp is not None:
         clock_in_ref_result = await session.execute(
-            select(Mark)
-            .where(
-                Mark.user_id == mark.user_id,
-                Mark.mark_type == MarkType.CLOCK_IN,
-                Mark.timestamp <= new_timestamp
-            )
-            .order_by(Mark.timestamp.desc())
-            .limit(1)
+            queries.LATEST_CLOCK_IN_AT_OR_BEFORE,
+            {"user_id": mark.user_id, "timestamp": new_timestamp}
         )
         clock_in_ref = clock_in_ref_result.scalar_one_or_none()
         clock_in_id = clock_in_ref.id if clock_in_ref else None
@@ -589,6 +630,10 @@ async def update_mark(
         if base_clock_in:
             mark.po_number = base_clock_in.po_number
 
+    # Si cambia de mes, la fila se mueve a otra partición: debe existir
+    if mark_update.timestamp is not None:
+        await require_partition_for(session, new_timestamp)
+
     # Si se actualizaron coordenadas pero no la dirección, actualizar la dirección
     if (mark_update.latitude is not None or mark_update.longitude is not None) and mark_update.address is None:
         asyncio.create_task(
@@ -597,7 +642,10 @@ async def update_mark(
         # Usar dirección temporal mientras se actualiza
         mark.address = f"Lat: {mark.latitude:.6f}, Lon: {mark.longitude:.6f}"
     
+    await bump_mark_version(session, mark.user_id)
+    await publish_mark_event(session, MarkEventType.UPDATED, mark)
     await session.commit()
+    replica_router.note_write(admin.id)
     await session.refresh(mark)
     
     return mark
@@ -606,7 +654,7 @@ async def update_mark(
 @router.post("/create", response_model=MarkRead)
 async def create_mark_admin(
     mark_data: MarkCreateAdmin,
-    _: User = Depends(get_current_superuser),
+    admin: User = Depends(get_current_superuser),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
@@ -614,7 +662,7 @@ async def create_mark_admin(
     Útil para agregar clock out faltantes o corregir registros.
     """
     # Verificar que el usuario existe
-    user_result = await session.execute(select(User).where(User.id == mark_data.user_id))
+    user_result = await session.execute(queries.USER_BY_ID, {"user_id": mark_data.user_id})
     user = user_result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -624,6 +672,10 @@ async def create_mark_admin(
     if timestamp.tzinfo is not None:
         # Guardar como NAIVE LOCAL: quitar tz sin convertir
         timestamp = timestamp.replace(tzinfo=None)
+
+    # No se agregan marcas a periodos de nómina cerrados ni a meses que se están archivando
+    await payroll.ensure_not_closed(session, timestamp)
+    await ensure_not_archiving(session, timestamp)
     
     # Validaciones específicas para clock out
     po_number = mark_data.po_number
@@ -650,8 +702,12 @@ async def create_mark_admin(
         po_number=po_number
     )
     
+    await require_partition_for(session, timestamp)
     session.add(new_mark)
+    await bump_mark_version(session, new_mark.user_id)
+    await publish_mark_event(session, MarkEventType.CREATED, new_mark)
     await session.commit()
+    replica_router.note_write(admin.id)
     await session.refresh(new_mark)
     
     # Actualizar dirección en background
@@ -665,22 +721,352 @@ async def create_mark_admin(
 @router.delete("/{mark_id}")
 async def delete_mark(
     mark_id: int,
-    _: User = Depends(get_current_superuser),
+    admin: User = Depends(get_current_superuser),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
     Eliminar una marca (solo admin).
     """
-    result = await session.execute(
-        select(Mark).where(Mark.id == mark_id)
-    )
+    result = await session.execute(queries.MARK_BY_ID, {"mark_id": mark_id})
     mark = result.scalar_one_or_none()
     
     if not mark:
         raise HTTPException(status_code=404, detail="Mark not found")
+
+    # No se eliminan marcas de periodos de nómina cerrados ni de meses que se están archivando
+    await payroll.ensure_not_closed(session, mark.timestamp)
+    await ensure_not_archiving(session, mark.timestamp)
     
     await session.delete(mark)
+    await bump_mark_version(session, mark.user_id)
+    await publish_mark_event(session, MarkEventType.DELETED, mark)
     await session.commit()
+    replica_router.note_write(admin.id)
     
     return {"message": "Mark deleted successfully"}
 
+
+@router.post("/bulk", response_model=MarkBulkResult)
+async def bulk_edit_marks(
+    batch: MarkBulkRequest,
+    admin: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Aplicar varias ediciones y eliminaciones de marcas en una transacción (solo admin).
+    Mismas reglas que PUT y DELETE /marks/{mark_id}; si alguna operación falla no se
+    aplica ninguna y la respuesta 400 trae el resultado de cada una.
+    """
+    results, geocode = await apply_bulk_operations(session, batch.operations)
+    await session.commit()
+    replica_router.note_write(admin.id)
+
+    # Una sola tarea de geocodificación para todo el lote
+    if geocode:
+        asyncio.create_task(geocode_marks_background(geocode))
+
+    return MarkBulkResult(applied=len(results), results=results)
+
+
+@router.post("/payroll-periods/close", response_model=PayrollPeriodRead)
+async def close_payroll_period(
+    period_data: PayrollPeriodClose,
+    admin: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Cerrar un periodo de nómina (solo admin).
+    Calcula y guarda el reporte semanal de cada usuario como snapshot inmutable; desde
+    entonces los reportes de ese rango se sirven del snapshot y sus marcas no se pueden
+    editar. Cerrar de nuevo un periodo reabierto genera una versión nueva.
+    """
+    if period_data.end_date < period_data.start_date:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+    start_date_obj, end_date_obj = _report_range(
+        period_data.start_date.isoformat(), period_data.end_date.isoformat(),
+        period_data.timezone_offset_minutes, period_data.tz
+    )
+    if end_date_obj > datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Cannot close a period that has not ended")
+
+    # Exclusivo: ninguna edición de marcas corre mientras se calcula el snapshot
+    await payroll.lock_payroll_exclusive(session)
+
+    period = await payroll.get_period_for_close(session, start_date_obj, end_date_obj)
+    if period is not None and period.closed_at is not None:
+        raise HTTPException(status_code=409, detail="Payroll period is already closed")
+    if period is None:
+        period = PayrollPeriod(
+            start_date=period_data.start_date,
+            end_date=period_data.end_date,
+            range_start=start_date_obj,
+            range_end=end_date_obj,
+            version=0,
+        )
+        session.add(period)
+    # Zona del cierre: los reportes con la misma zona y fechas caen en este rango exacto
+    period.timezone_offset_minutes = period_data.timezone_offset_minutes or 0
+    period.timezone = period_data.tz
+    period.version += 1
+    period.closed_at = datetime.utcnow()
+    period.closed_by_id = admin.id
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Payroll period overlaps an existing period")
+
+    # Reportes de todos los usuarios con las mismas reglas que el reporte semanal
+    day_key = day_key_function(start_date_obj, end_date_obj, period_data.timezone_offset_minutes, period_data.tz)
+    _, reports = await weekly_reports_for_all_users(
+        session, start_date_obj, end_date_obj, SESSION_MARK_FIELDS, day_key
+    )
+    await payroll.store_snapshots(session, period, reports)
+    await session.commit()
+    replica_router.note_write(admin.id)
+
+    snapshots, compressed_bytes = await payroll.snapshot_sizes(session, period)
+    logger.info(
+        "Closed payroll period %s..%s v%d: %d snapshots, %d bytes",
+        period.start_date, period.end_date, period.version, snapshots, compressed_bytes,
+    )
+    return period
+
+
+@router.post("/payroll-periods/{period_id}/reopen", response_model=PayrollPeriodRead)
+async def reopen_payroll_period(
+    period_id: int,
+    admin: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Reabrir un periodo de nómina (solo admin).
+    Los reportes vuelven a calcularse de las marcas y se permiten ediciones; los snapshots
+    existentes se conservan y el siguiente cierre crea una versión nueva.
+    """
+    await payroll.lock_payroll_exclusive(session)
+    period = await session.get(PayrollPeriod, period_id, with_for_update=True)
+    if period is None:
+        raise HTTPException(status_code=404, detail="Payroll period not found")
+    if period.closed_at is None:
+        raise HTTPException(status_code=409, detail="Payroll period is not closed")
+
+    period.closed_at = None
+    period.closed_by_id = admin.id
+    await session.commit()
+    replica_router.note_write(admin.id)
+    logger.info("Reopened payroll period %s..%s (v%d)", period.start_date, period.end_date, period.version)
+    return period
+
+
+@router.get("/payroll-periods", response_model=List[PayrollPeriodRead])
+async def get_payroll_periods(
+    _: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_admin_read_session)
+):
+    """Periodos de nómina, más recientes primero (solo admin)."""
+    result = await session.execute(select(PayrollPeriod).order_by(PayrollPeriod.start_date.desc()))
+    return result.scalars().all()
+
+
+@router.get("/live")
+async def live_marks(
+    request: Request,
+    access_token: Optional[str] = Query(None, description="JWT for clients that cannot send headers (EventSource)")
+):
+    """
+    Feed en vivo de marcas creadas, actualizadas y eliminadas (Server-Sent Events, solo admin).
+    Reemplaza el polling de /marks/all: el cliente carga el listado una vez y aplica los eventos.
+    Un evento "reset" indica que el cliente se atrasó y debe reconectarse y recargar el listado.
+    """
+    # Autenticación con sesión corta: el stream no debe retener una conexión del pool
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else access_token
+    user = await authenticate_token(token)
+    if user is None or not user.is_active:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    subscriber = mark_event_hub.subscribe()
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many live clients", headers={"Retry-After": "30"})
+
+    async def event_stream():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=env.LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield b": ping\n\n"
+                    continue
+                if frame is None:
+                    if subscriber.dropped:
+                        yield b"event: reset\ndata: {}\n\n"
+                    return
+                yield frame
+        finally:
+            mark_event_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Tarea de archivado en curso en este worker (el advisory lock cubre a los demás)
+_archive_task: Optional[asyncio.Task] = None
+
+
+async def _run_archive(cutoff: datetime) -> None:
+    try:
+        summary = await archive_marks_before(cutoff)
+        logger.info("Archive run finished: %s", summary)
+    except Exception:
+        logger.exception("Archive run failed")
+
+
+@router.post("/archive", status_code=202)
+async def archive_marks(
+    before: str = Query(..., description="Archive whole months before this date's month (YYYY-MM-DD)"),
+    _: User = Depends(get_current_superuser)
+):
+    """
+    Archivar marcas de meses cerrados en archivos Arrow (solo admin).
+    Corre en segundo plano; el estado queda en GET /marks/archive.
+    """
+    global _archive_task
+    try:
+        cutoff = datetime.strptime(before, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if cutoff.replace(day=1) > datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Cutoff cannot be in a future month")
+    if _archive_task is not None and not _archive_task.done():
+        raise HTTPException(status_code=409, detail="An archive run is already in progress")
+
+    _archive_task = asyncio.create_task(_run_archive(cutoff))
+    return {"message": "Archive started", "before": before}
+
+
+@router.get("/archive")
+async def get_archive_status(_: User = Depends(get_current_superuser)):
+    """Meses archivados y si hay un archivado en curso en este worker (solo admin)."""
+    return {
+        "running": _archive_task is not None and not _archive_task.done(),
+        "months": load_manifest()["months"],
+    }
+
+
+@router.get("/anomalies", response_model=List[MarkAnomalyRead])
+async def get_mark_anomalies(
+    user_id: Optional[int] = Query(None, description="Filter by user"),
+    kind: Optional[AnomalyKind] = Query(None, description="Filter by anomaly kind"),
+    start_date: Optional[str] = Query(None, description="Marks on or after this date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Marks on or before this date (YYYY-MM-DD)"),
+    limit: int = Query(200, ge=1, le=1000),
+    _: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_admin_read_session)
+):
+    """
+    Anomalías de marcas del índice, más recientes primero (solo admin).
+    El índice se mantiene con el escaneo incremental (ver app/marks/anomalies.py).
+    """
+    query = (
+        select(MarkAnomaly, User.email.label("user_email"))
+        .join(User, User.id == MarkAnomaly.user_id)
+        .order_by(MarkAnomaly.mark_timestamp.desc())
+        .limit(limit)
+    )
+    if user_id is not None:
+        query = query.where(MarkAnomaly.user_id == user_id)
+    if kind is not None:
+        query = query.where(MarkAnomaly.kind == kind.value)
+    try:
+        if start_date:
+            query = query.where(MarkAnomaly.mark_timestamp >= datetime.strptime(start_date, "%Y-%m-%d"))
+        if end_date:
+            end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+            query = query.where(MarkAnomaly.mark_timestamp < end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+    result = await session.execute(query)
+    return [
+        MarkAnomalyRead(
+            id=anomaly.id,
+            user_id=anomaly.user_id,
+            user_email=user_email,
+            kind=anomaly.kind,
+            mark_id=anomaly.mark_id,
+            mark_timestamp=anomaly.mark_timestamp,
+            detail=anomaly.detail,
+            detected_at=anomaly.detected_at,
+        )
+        for anomaly, user_email in result.all()
+    ]
+
+
+@router.post("/anomalies/scan")
+async def scan_mark_anomalies(_: User = Depends(get_current_superuser)):
+    """
+    Actualizar el índice de anomalías ahora (solo admin).
+    Solo recorre los cambios desde la pasada anterior.
+    """
+    summary = await run_anomaly_scan()
+    if summary is None:
+        raise HTTPException(status_code=409, detail="An anomaly scan is already in progress")
+    return summary
+
+
+@router.get("/analytics/heatmap", response_model=LaborHeatmap)
+async def get_labor_heatmap(
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    timezone_offset_minutes: Optional[int] = Query(None, description="Client timezone offset in minutes (UTC - local)"),
+    by_po: bool = Query(False, description="Also break the hours down by PO number"),
+    max_groups: int = Query(20, ge=1, le=200, description="POs returned in by_po (the rest are summed in other)"),
+    user_id: Optional[int] = Query(None, description="Only this user's sessions"),
+    _: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_admin_read_session)
+):
+    """
+    Horas trabajadas por día de la semana × hora local, calculadas en la base (solo admin).
+    matrix[0] es el lunes y matrix[d][h] las horas de sesiones cerradas dentro de esa hora;
+    las sesiones que cruzan horas o días se reparten entre ellas.
+    """
+    start_date_obj, end_date_obj = _report_range(start_date, end_date, timezone_offset_minutes)
+    if end_date_obj < start_date_obj:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    offset_minutes = timezone_offset_minutes or 0
+    try:
+        heatmap = await labor_heatmap(
+            session, start_date_obj, end_date_obj, offset_minutes,
+            by_po=by_po, max_groups=max_groups, user_id=user_id
+        )
+    except DBAPIError as e:
+        # 57014 = query_canceled (statement_timeout)
+        if getattr(e.orig, "sqlstate", None) == "57014":
+            raise HTTPException(status_code=503, detail="Heatmap query timed out, narrow the date range or filter by user")
+        raise
+
+    # Las marcas archivadas en archivos Arrow IPC no están en la tabla: se informan los meses faltantes
+    archived = archived_months()
+    missing_months = []
+    month = start_date_obj.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end_date_obj:
+        if month.strftime("%Y-%m") in archived:
+            missing_months.append(month.strftime("%Y-%m"))
+        month = (month + timedelta(days=32)).replace(day=1)
+
+    return LaborHeatmap(
+        start_date=start_date_obj.date().isoformat(),
+        end_date=end_date_obj.date().isoformat(),
+        timezone_offset_minutes=offset_minutes,
+        archived_months=missing_months,
+        **heatmap
+    )
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, Field, TypeAdapter
+from datetime import date, datetime
+from typing import Any, Dict, Literal, Optional, List
 from app.marks.models import MarkType
 
 
@@ -70,3 +70,109 @@ class EmployeesSummaryReport(BaseModel):
     start_date: str
     end_date: str
     employees: List[EmployeeSummary]
+    # Versión del snapshot si el rango es un periodo de nómina cerrado
+    snapshot_version: Optional[int] = None
+
+
+class PayrollPeriodClose(BaseModel):
+    """Schema para cerrar un periodo de nómina"""
+    start_date: date
+    end_date: date
+    timezone_offset_minutes: Optional[int] = Field(None, description="Client timezone offset in minutes (UTC - local)")
+    tz: Optional[str] = Field(None, description="IANA time zone (e.g. America/Mexico_City); overrides timezone_offset_minutes")
+
+
+class PayrollPeriodRead(BaseModel):
+    """Schema para leer un periodo de nómina"""
+    id: int
+    start_date: date
+    end_date: date
+    timezone_offset_minutes: int
+    timezone: Optional[str] = None
+    version: int
+    closed_at: Optional[datetime] = None
+    closed_by_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MarkAnomalyRead(BaseModel):
+    """Schema para leer una anomalía del índice de marcas"""
+    id: int
+    user_id: int
+    user_email: str
+    kind: str
+    mark_id: int
+    mark_timestamp: datetime
+    detail: Optional[Dict[str, Any]] = None
+    detected_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# Operaciones máximas por request de POST /marks/bulk
+MARK_BULK_MAX_OPERATIONS = 500
+
+
+class MarkBulkOperation(MarkUpdate):
+    """Schema para una operación de POST /marks/bulk (mismos campos que MarkUpdate)"""
+    op: Literal["update", "delete"]
+    mark_id: int
+
+
+class MarkBulkRequest(BaseModel):
+    """Schema para aplicar varias ediciones de marcas en una transacción"""
+    operations: List[MarkBulkOperation] = Field(..., min_length=1, max_length=MARK_BULK_MAX_OPERATIONS)
+
+
+class MarkBulkItemResult(BaseModel):
+    """Resultado de una operación (en el mismo orden que la request)"""
+    index: int
+    op: str
+    mark_id: int
+    status: Literal["ok", "error"]
+    status_code: int
+    detail: Optional[str] = None
+    mark: Optional[MarkRead] = None
+
+
+class MarkBulkResult(BaseModel):
+    """Schema de respuesta de POST /marks/bulk"""
+    applied: int
+    results: List[MarkBulkItemResult]
+
+
+class LaborHeatmapGroup(BaseModel):
+    """Horas de un PO por día de la semana × hora"""
+    po_number: Optional[str] = None
+    total_hours: float
+    matrix: List[List[float]]
+
+
+class LaborHeatmapOther(BaseModel):
+    """Suma de los POs que no entran en by_po"""
+    total_hours: float
+    matrix: List[List[float]]
+
+
+class LaborHeatmap(BaseModel):
+    """Schema del heatmap de horas: matrix[día][hora], lunes primero y hora local 0..23"""
+    start_date: str
+    end_date: str
+    timezone_offset_minutes: int
+    weekdays: List[str]
+    matrix: List[List[float]]
+    total_hours: float
+    by_po: Optional[List[LaborHeatmapGroup]] = None
+    other: Optional[LaborHeatmapOther] = None
+    # Meses del rango que están archivados en Arrow IPC (no se incluyen en el heatmap)
+    archived_months: List[str] = []
+
+
+# Adaptadores precompilados para las rutas de listado: validan filas de columnas
+# (sin hidratar entidades ORM) y serializan directamente a JSON con pydantic-core
+mark_read_list_adapter = TypeAdapter(List[MarkRead])
+mark_with_user_list_adapter = TypeAdapter(List[MarkWithUser])
+# Filas proyectadas con ?fields= (solo las columnas pedidas por el cliente)
+sparse_row_list_adapter = TypeAdapter(List[Dict[str, Any]])
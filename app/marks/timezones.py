@@ -0,0 +1,132 @@
+"""
+Husos horarios IANA (?tz=America/Mexico_City) para los reportes.
+
+Las marcas se guardan en UTC naive. Convertir cada marca con zoneinfo cuesta una
+consulta a la base de reglas por fila; en su lugar, por zona y año se precalcula la
+tabla de intervalos con offset constante (inicio UTC, local − UTC) y se cachea. La hora
+local de una marca es entonces una búsqueda binaria en la tabla del rango del reporte,
+o una resta fija si el rango no cruza ningún cambio de horario (casi todas las semanas).
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Paso con el que se buscan cambios de offset en el año (luego se refina al segundo)
+SCAN_STEP = timedelta(days=1)
+
+
+class UnknownTimeZone(ValueError):
+    """Nombre IANA que no existe (las rutas lo convierten en 400)."""
+
+
+@lru_cache(maxsize=256)
+def get_zone(name: str) -> ZoneInfo:
+    """ZoneInfo de un nombre IANA; UnknownTimeZone si no existe."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise UnknownTimeZone(f"Unknown time zone: {name}")
+
+
+def _utcoffset(zone: ZoneInfo, utc: datetime) -> timedelta:
+    return utc.replace(tzinfo=timezone.utc).astimezone(zone).utcoffset()
+
+
+@lru_cache(maxsize=512)
+def _year_intervals(zone_name: str, year: int) -> tuple[tuple[datetime, timedelta], ...]:
+    """Intervalos (inicio UTC naive, local − UTC) del año UTC; el primero empieza el 1 de enero."""
+    zone = get_zone(zone_name)
+    current = datetime(year, 1, 1)
+    year_end = datetime(year + 1, 1, 1)
+    offset = _utcoffset(zone, current)
+    intervals = [(current, offset)]
+    while current < year_end:
+        step_end = min(current + SCAN_STEP, year_end)
+        step_offset = _utcoffset(zone, step_end)
+        if step_offset != offset:
+            # Búsqueda binaria del segundo en que cambia el offset
+            low, high = 0, int((step_end - current).total_seconds())
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _utcoffset(zone, current + timedelta(seconds=middle)) == offset:
+                    low = middle
+                else:
+                    high = middle
+            intervals.append((current + timedelta(seconds=high), step_offset))
+            offset = step_offset
+        current = step_end
+    return tuple(intervals)
+
+
+def offset_table(zone_name: str, start: datetime, end: datetime) -> tuple[list[datetime], list[timedelta]]:
+    """
+    (inicios, offsets) de los intervalos que cubren [start, end] (UTC naive), con un día
+    de margen. El primer inicio es anterior a start.
+    """
+    starts: list[datetime] = []
+    offsets: list[timedelta] = []
+    for year in range((start - timedelta(days=1)).year, (end + timedelta(days=1)).year + 1):
+        for interval_start, offset in _year_intervals(zone_name, year):
+            if offsets and offsets[-1] == offset:
+                continue
+            if starts and interval_start <= start - timedelta(days=1):
+                starts[-1], offsets[-1] = interval_start, offset
+                continue
+            if interval_start > end + timedelta(days=1):
+                break
+            starts.append(interval_start)
+            offsets.append(offset)
+    return starts, offsets
+
+
+def local_range_to_utc(zone_name: str, start_day: date, end_day: date) -> tuple[datetime, datetime]:
+    """Límites UTC naive de [start_day 00:00, end_day 23:59:59.999999] en hora local de la zona."""
+    zone = get_zone(zone_name)
+    start = datetime.combine(start_day, time.min, tzinfo=zone).astimezone(timezone.utc)
+    end = datetime.combine(end_day, time.max, tzinfo=zone).astimezone(timezone.utc)
+    return start.replace(tzinfo=None), end.replace(tzinfo=None)
+
+
+def local_time_function(
+    start: datetime,
+    end: datetime,
+    timezone_offset_minutes: Optional[int] = None,
+    tz: Optional[str] = None,
+) -> Optional[Callable[[datetime], datetime]]:
+    """
+    Función UTC naive -> hora local naive para las marcas de [start, end]: con `tz` usa la
+    tabla de offsets de la zona, si no el offset fijo (UTC − local). None si no hay ninguno.
+    """
+    if tz is not None:
+        starts, offsets = offset_table(tz, start, end)
+        if len(offsets) == 1:
+            fixed = offsets[0]
+            return lambda timestamp: timestamp + fixed
+
+        def to_local(timestamp: datetime) -> datetime:
+            return timestamp + offsets[max(bisect_right(starts, timestamp) - 1, 0)]
+        return to_local
+
+    if timezone_offset_minutes is not None:
+        delta = timedelta(minutes=timezone_offset_minutes)
+        return lambda timestamp: timestamp - delta
+    return None
+
+
+def utc_day_key(timestamp: datetime) -> str:
+    return timestamp.date().isoformat()
+
+
+def day_key_function(
+    start: datetime,
+    end: datetime,
+    timezone_offset_minutes: Optional[int] = None,
+    tz: Optional[str] = None,
+) -> Callable[[datetime], str]:
+    """Llave del día local (YYYY-MM-DD) de una marca UTC naive, para agrupar las sesiones."""
+    to_local = local_time_function(start, end, timezone_offset_minutes, tz)
+    if to_local is None:
+        return utc_day_key
+    return lambda timestamp: to_local(timestamp).date().isoformat()
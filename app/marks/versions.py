@@ -0,0 +1,66 @@
+from fastapi import Request, Response
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.marks.models import MarkVersion
+import zlib
+
+# Parámetros: user_id
+MARK_VERSION_BY_USER = select(MarkVersion.version).where(MarkVersion.user_id == bindparam("user_id"))
+
+
+async def bump_mark_version(session: AsyncSession, user_id: int) -> None:
+    """
+    Incrementa la versión de cambios de las marcas de un usuario.
+    Debe llamarse dentro de la misma transacción que la mutación (antes del commit).
+    """
+    await bump_mark_versions(session, (user_id,))
+
+
+async def bump_mark_versions(session: AsyncSession, user_ids) -> None:
+    """Como bump_mark_version para varios usuarios, en un solo statement."""
+    # Orden fijo: dos lotes concurrentes toman los locks de las filas en el mismo orden
+    stmt = insert(MarkVersion).values([{"user_id": user_id, "version": 1} for user_id in sorted(user_ids)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MarkVersion.user_id],
+        set_={"version": MarkVersion.version + 1},
+    )
+    await session.execute(stmt)
+
+
+async def get_mark_version(session: AsyncSession, user_id: int) -> int:
+    """Versión actual de las marcas de un usuario (lookup por PK, 0 si nunca cambió)."""
+    result = await session.execute(MARK_VERSION_BY_USER, {"user_id": user_id})
+    return result.scalar_one_or_none() or 0
+
+
+def mark_list_etag(request: Request, user_id: int, version: int) -> str:
+    """
+    ETag fuerte de un listado: usuario + versión + query string
+    (limit y fields cambian la representación, así que forman parte del tag).
+    """
+    query_hash = zlib.crc32(request.url.query.encode())
+    return f'"m{user_id}-{version}-{query_hash:x}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Evalúa If-None-Match contra el ETag actual (comparación débil, RFC 9110)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in header.split(","))
+    return etag in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo para un listado sin cambios."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def set_etag_headers(response: Response, etag: str) -> Response:
+    """Agrega ETag y Cache-Control (revalidar siempre) a un listado."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,164 @@
+"""
+Alta masiva de usuarios desde CSV o JSON (POST /admin/users/bulk y scripts/import_users.py).
+
+1. Cada fila se valida con UserCreate; los emails repetidos dentro del archivo y los que
+   ya existen en la base se reportan por fila sin hashear su contraseña.
+2. Las contraseñas se hashean en paralelo en un pool de procesos (hash_passwords_parallel).
+3. Los usuarios se insertan con INSERT multi-fila ON CONFLICT (email) DO NOTHING RETURNING:
+   las filas que no vuelven las insertó otro request entre medio y también son duplicados.
+"""
+import csv
+import io
+import json
+from typing import Optional
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_env_vars
+from app.users.models import User
+from app.users.password import hash_passwords_parallel
+from app.users.schemas import UserCreate
+
+env = get_env_vars()
+
+# Filas por INSERT (7 parámetros por fila, lejos del límite de 32767 de asyncpg)
+INSERT_BATCH_SIZE = 1000
+
+# Emails (en minúsculas) que ya existen. Parámetros: emails
+EXISTING_EMAILS = select(func.lower(User.email)).where(
+    func.lower(User.email).in_(bindparam("emails", expanding=True))
+)
+
+
+def parse_users_file(content: bytes, file_format: str) -> list[dict]:
+    """
+    Filas de un archivo "csv" (con encabezado; email y password obligatorios) o "json"
+    (lista de objetos, o {"users": [...]}). ValueError si el archivo no se puede leer.
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("File must be UTF-8 encoded")
+
+    if file_format == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        if reader.fieldnames is None:
+            raise ValueError("CSV file is empty")
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        missing = {"email", "password"} - set(reader.fieldnames)
+        if missing:
+            raise ValueError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+        return [dict(row) for row in reader]
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("users")
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ValueError('JSON must be a list of user objects or {"users": [...]}')
+    return data
+
+
+def _clean_row(row: dict) -> dict:
+    """Quita celdas vacías (columnas opcionales sin valor en el CSV) y espacios."""
+    cleaned = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "":
+                continue
+        if value is None:
+            continue
+        cleaned[key] = value
+    return cleaned
+
+
+async def import_users(session: AsyncSession, rows: list[dict], hash_workers: Optional[int] = None) -> dict:
+    """Valida, hashea e inserta las filas (hace commit). Devuelve el resumen por fila."""
+    hash_workers = hash_workers or env.USER_IMPORT_HASH_WORKERS
+    results = [{"row": index + 1, "email": None, "status": "created", "detail": None, "id": None}
+               for index in range(len(rows))]
+
+    # 1. Validación y duplicados dentro del archivo
+    candidates: list[tuple[dict, UserCreate]] = []
+    first_row_by_email: dict[str, int] = {}
+    for result, row in zip(results, rows):
+        row = _clean_row(row)
+        result["email"] = row.get("email")
+        try:
+            user_create = UserCreate.model_validate(row)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            result.update(status="invalid", detail=f"{field}: {error['msg']}")
+            continue
+        if not user_create.password:
+            result.update(status="invalid", detail="password: Password cannot be empty")
+            continue
+
+        email_key = user_create.email.lower()
+        if email_key in first_row_by_email:
+            result.update(status="duplicate", detail=f"Duplicate email in file (row {first_row_by_email[email_key]})")
+            continue
+        first_row_by_email[email_key] = result["row"]
+        result["email"] = user_create.email
+        candidates.append((result, user_create))
+
+    # 2. Emails que ya existen (antes de hashear: el hash es lo caro)
+    if candidates:
+        existing = set((await session.execute(
+            EXISTING_EMAILS, {"emails": [user_create.email.lower() for _, user_create in candidates]}
+        )).scalars())
+        pending = []
+        for result, user_create in candidates:
+            if user_create.email.lower() in existing:
+                result.update(status="duplicate", detail="A user with this email already exists")
+            else:
+                pending.append((result, user_create))
+        candidates = pending
+
+    # 3. Hash en paralelo e INSERT multi-fila
+    hashed_passwords = await hash_passwords_parallel(
+        [user_create.password for _, user_create in candidates], hash_workers
+    )
+    for start in range(0, len(candidates), INSERT_BATCH_SIZE):
+        batch = candidates[start:start + INSERT_BATCH_SIZE]
+        values = []
+        for (_, user_create), hashed_password in zip(batch, hashed_passwords[start:start + INSERT_BATCH_SIZE]):
+            # Mismas columnas en todas las filas del VALUES
+            values.append({
+                "email": user_create.email,
+                "hashed_password": hashed_password,
+                "first_name": user_create.first_name,
+                "last_name": user_create.last_name,
+                "is_active": user_create.is_active if user_create.is_active is not None else True,
+                "is_superuser": bool(user_create.is_superuser),
+                "is_verified": bool(user_create.is_verified),
+            })
+        statement = (
+            insert(User)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User.id, User.email)
+        )
+        inserted = {email: user_id for user_id, email in await session.execute(statement)}
+        for result, user_create in batch:
+            user_id = inserted.get(user_create.email)
+            if user_id is None:
+                result.update(status="duplicate", detail="A user with this email already exists")
+            else:
+                result["id"] = user_id
+    await session.commit()
+
+    return {
+        "total": len(results),
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "duplicates": sum(1 for result in results if result["status"] == "duplicate"),
+        "invalid": sum(1 for result in results if result["status"] == "invalid"),
+        "results": results,
+    }
@@ -0,0 +1,125 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from app.core.dependencies import get_env_vars
+from app.db.notifications import publish
+from app.users.models import User
+
+logger = logging.getLogger(__name__)
+
+env = get_env_vars()
+
+# Canal de Postgres por el que los workers se avisan invalidaciones de usuarios
+AUTH_INVALIDATION_CHANNEL = "auth_invalidations"
+
+_USER_COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+
+class AuthCache:
+    """
+    Cache acotado (LRU + TTL) de tokens JWT ya decodificados y de los usuarios
+    autenticados, para no consultar la tabla user en cada request.
+
+    - token -> (user_id, expira): nunca más allá del `exp` del propio token.
+    - user_id -> (snapshot de columnas, expira): se invalida al actualizar,
+      desactivar o resetear la contraseña del usuario. El TTL acota cuánto puede
+      durar un `is_active`/`is_superuser` obsoleto si se pierde una invalidación.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._tokens: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._principals: OrderedDict[int, tuple[dict[str, Any], float]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, token: str) -> Optional[User]:
+        """Devuelve una instancia User separada (detached) si el token está en cache."""
+        token_entry = self._tokens.get(token)
+        if token_entry is None:
+            return None
+        user_id, token_expires = token_entry
+        now = time.monotonic()
+        if token_expires <= now:
+            self._tokens.pop(token, None)
+            return None
+
+        principal_entry = self._principals.get(user_id)
+        if principal_entry is None:
+            return None
+        snapshot, principal_expires = principal_entry
+        if principal_expires <= now:
+            self._principals.pop(user_id, None)
+            return None
+
+        self._tokens.move_to_end(token)
+        self._principals.move_to_end(user_id)
+        # Cada request recibe su propia instancia: nunca se comparte un objeto ORM
+        # entre sesiones, y make_transient_to_detached permite hacer UPDATE sobre él
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return user
+
+    def user_id(self, token: str) -> Optional[int]:
+        """Id del usuario de un token ya verificado y vigente, sin tocar el orden LRU."""
+        token_entry = self._tokens.get(token)
+        if token_entry is None or token_entry[1] <= time.monotonic():
+            return None
+        return token_entry[0]
+
+    def put(self, token: str, user: User, token_exp: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        expires = now + self.ttl_seconds
+        if token_exp is not None:
+            expires = min(expires, now + (token_exp - time.time()))
+        if expires <= now:
+            return
+
+        self._tokens[token] = (user.id, expires)
+        self._tokens.move_to_end(token)
+        self._principals[user.id] = (
+            {key: getattr(user, key) for key in _USER_COLUMNS},
+            now + self.ttl_seconds,
+        )
+        self._principals.move_to_end(user.id)
+
+        while len(self._tokens) > self.max_entries:
+            self._tokens.popitem(last=False)
+        while len(self._principals) > self.max_entries:
+            self._principals.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Descarta el usuario; sus tokens vuelven a consultar la DB en el próximo request."""
+        self._principals.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._principals.clear()
+
+
+auth_cache = AuthCache(env.AUTH_CACHE_TTL_SECONDS, env.AUTH_CACHE_MAX_ENTRIES)
+
+
+def handle_invalidation_notification(payload: str) -> None:
+    """Handler del canal AUTH_INVALIDATION_CHANNEL (payload = user_id)."""
+    try:
+        auth_cache.invalidate_user(int(payload))
+    except ValueError:
+        logger.warning("Invalid auth invalidation payload: %r", payload)
+
+
+async def publish_user_invalidation(session: AsyncSession, user_id: int) -> None:
+    """
+    Invalida el usuario en este worker y avisa al resto por NOTIFY.
+    El aviso se entrega cuando la transacción de `session` hace commit.
+    """
+    auth_cache.invalidate_user(user_id)
+    await publish(session, AUTH_INVALIDATION_CHANNEL, str(user_id))
@@ -1,10 +1,14 @@
-from fastapi_users import BaseUserManager
+from fastapi_users import BaseUserManager, exceptions, schemas
+from fastapi.security import OAuth2PasswordRequestForm
 from app.users.models import User
 from app.db.postgres_connector import get_async_session
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends
+from fastapi import Depends, Request
+from typing import Any, Optional
 from app.core.dependencies import get_env_vars
+from app.users.cache import publish_user_invalidation
+from app.users.password import password_helper, password_pool
 
 env = get_env_vars()
 SECRET = env.JWT_SECRET
@@ -17,8 +21,79 @@ class UserManager(BaseUserManager[User, int]):
     def parse_id(user_id: str) -> int:
         return int(user_id)
 
+    # Las operaciones con contraseñas de BaseUserManager llaman a PasswordHelper de forma
+    # síncrona en el event loop; estas versiones usan password_pool (ver app.users.password)
+
+    async def create(
+        self,
+        user_create: schemas.BaseUserCreate,
+        safe: bool = False,
+        request: Optional[Request] = None,
+    ) -> User:
+        await self.validate_password(user_create.password, user_create)
+
+        existing_user = await self.user_db.get_by_email(user_create.email)
+        if existing_user is not None:
+            raise exceptions.UserAlreadyExists()
+
+        user_dict = (
+            user_create.create_update_dict()
+            if safe
+            else user_create.create_update_dict_superuser()
+        )
+        password = user_dict.pop("password")
+        user_dict["hashed_password"] = await password_pool.hash(password)
+
+        created_user = await self.user_db.create(user_dict)
+
+        await self.on_after_register(created_user, request)
+
+        return created_user
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[User]:
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Calcular un hash igualmente para mitigar timing attacks
+            await password_pool.hash(credentials.password)
+            return None
+
+        verified, updated_password_hash = await password_pool.verify_and_update(
+            credentials.password, user.hashed_password
+        )
+        if not verified:
+            return None
+        # Rehash transparente si cambiaron los parámetros (o el algoritmo) del hash
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+
+        return user
+
+    async def _update(self, user: User, update_dict: dict[str, Any]) -> User:
+        password = update_dict.get("password")
+        if password is not None:
+            await self.validate_password(password, user)
+            update_dict = {key: value for key, value in update_dict.items() if key != "password"}
+            update_dict["hashed_password"] = await password_pool.hash(password)
+        return await super()._update(user, update_dict)
+
+    async def _invalidate_cached_user(self, user: User) -> None:
+        """Saca al usuario del cache de autenticación de todos los workers."""
+        session = self.user_db.session
+        await publish_user_invalidation(session, user.id)
+        await session.commit()
+
+    async def on_after_update(self, user: User, update_dict: dict[str, Any], request: Optional[Request] = None) -> None:
+        await self._invalidate_cached_user(user)
+
+    async def on_after_reset_password(self, user: User, request: Optional[Request] = None) -> None:
+        await self._invalidate_cached_user(user)
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None) -> None:
+        await self._invalidate_cached_user(user)
+
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
     yield SQLAlchemyUserDatabase(session, User)
 
 async def get_user_manager(user_db=Depends(get_user_db)):
-    yield UserManager(user_db)
+    yield UserManager(user_db, password_helper)
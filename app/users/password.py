@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+from fastapi_users.password import PasswordHelper
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from pwdlib.hashers.bcrypt import BcryptHasher
+from app.core.dependencies import get_env_vars
+from app.core.metrics import registry, Gauge
+
+logger = logging.getLogger(__name__)
+
+env = get_env_vars()
+
+T = TypeVar("T")
+
+# Espera en cola a partir de la cual se registra un warning
+SLOW_QUEUE_WAIT_SECONDS = 0.5
+
+
+def build_password_helper() -> PasswordHelper:
+    """
+    PasswordHelper con los parámetros de Argon2 configurados en EnvVars.
+    verify_and_update devuelve un hash nuevo cuando el guardado usa otros parámetros
+    (o bcrypt), así que subir los parámetros rehashea en el siguiente login.
+    """
+    return PasswordHelper(PasswordHash((
+        Argon2Hasher(
+            time_cost=env.ARGON2_TIME_COST,
+            memory_cost=env.ARGON2_MEMORY_COST_KIB,
+            parallelism=env.ARGON2_PARALLELISM,
+        ),
+        BcryptHasher(),
+    )))
+
+
+class PasswordHashingPool:
+    """
+    Ejecuta el hash y la verificación de contraseñas fuera del event loop.
+
+    Usa un ThreadPoolExecutor acotado (argon2-cffi y bcrypt liberan el GIL mientras
+    calculan) y un semáforo con el mismo tamaño, de modo que una ráfaga de logins
+    espera en asyncio sin bloquear los clock in/out del mismo worker.
+    """
+
+    def __init__(self, helper: PasswordHelper, max_workers: int):
+        self.helper = helper
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Métricas de cola
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.queue_wait_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="password-hash",
+            )
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        self._ensure_started()
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.perf_counter() - queued_at
+        self.queue_wait_seconds_total += wait
+        self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, wait)
+        if wait > SLOW_QUEUE_WAIT_SECONDS:
+            logger.warning("Password hashing queued for %.0f ms", wait * 1000)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.helper.hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self._run(self.helper.verify_and_update, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._semaphore = None
+
+
+def hash_password_chunk(passwords: list[str]) -> list[str]:
+    """Corre en un proceso de hash_passwords_parallel (mismos parámetros que la API)."""
+    return [password_helper.hash(password) for password in passwords]
+
+
+async def hash_passwords_parallel(passwords: list[str], workers: int, chunk_size: int = 25) -> list[str]:
+    """
+    Hashea muchas contraseñas (altas masivas) en un pool de procesos propio, en bloques
+    para amortizar el envío entre procesos. No usa password_pool: un import grande no
+    debe dejar esperando a los logins del worker. Devuelve los hashes en el mismo orden.
+    """
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    # spawn: no heredar el event loop ni las conexiones abiertas del proceso actual
+    executor = ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(chunks))),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        hashed = await asyncio.gather(*(
+            loop.run_in_executor(executor, hash_password_chunk, chunk) for chunk in chunks
+        ))
+    finally:
+        await loop.run_in_executor(None, executor.shutdown)
+    return [password_hash for chunk in hashed for password_hash in chunk]
+
+
+password_helper = build_password_helper()
+password_pool = PasswordHashingPool(password_helper, env.PASSWORD_HASH_WORKERS)
+
+password_hash_waiting = registry.register(Gauge("password_hash_waiting", "Password hash operations waiting for a thread"))
+password_hash_waiting.set_function(lambda: password_pool.waiting)
+password_hash_in_flight = registry.register(Gauge("password_hash_in_flight", "Password hash operations running"))
+password_hash_in_flight.set_function(lambda: password_pool.in_flight)
+password_hash_queue_wait = registry.register(Gauge("password_hash_queue_wait_seconds_max", "Longest queue wait for password hashing"))
+password_hash_queue_wait.set_function(lambda: password_pool.queue_wait_seconds_max)
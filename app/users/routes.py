@@ -1,23 +1,72 @@
 import uuid
-from fastapi import Depends, APIRouter
-from fastapi_users import FastAPIUsers
+import jwt
+from typing import AsyncGenerator, Optional
+from fastapi import Depends, APIRouter, HTTPException, Request
+from fastapi_users import FastAPIUsers, exceptions
+from fastapi_users.jwt import decode_jwt
 from fastapi_users.authentication import BearerTransport, AuthenticationBackend, JWTStrategy
 from fastapi_users.db import SQLAlchemyUserDatabase
 from app.users.models import User
-from app.db.postgres_connector import get_async_session
-from app.users.schemas import UserRead, UserCreate, UserUpdate
+from app.db.postgres_connector import AsyncSessionLocal, get_async_session, get_read_session, replica_router
+from app.users.schemas import UserRead, UserCreate, UserUpdate, UserImportResult
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.dependencies import get_env_vars
 from app.users.manager import get_user_manager, get_user_db, UserManager
+from app.users.bulk_import import import_users, parse_users_file
+from app.users.cache import auth_cache
+from app.users.password import password_helper
 
 env = get_env_vars()
 
 # Bearer transport
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
+class CachedJWTStrategy(JWTStrategy[User, int]):
+    """
+    JWTStrategy que reutiliza tokens ya decodificados y usuarios ya cargados
+    (ver app.users.cache) para evitar el lookup del usuario en cada request.
+    """
+
+    async def read_token(self, token: Optional[str], user_manager: UserManager) -> Optional[User]:
+        if token is None:
+            return None
+
+        cached_user = auth_cache.get(token)
+        if cached_user is not None:
+            return cached_user
+
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
+            return None
+
+        try:
+            user = await user_manager.get(user_manager.parse_id(user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+
+        auth_cache.put(token, user, data.get("exp"))
+        return user
+
+
 # JWT strategy
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=env.JWT_SECRET, lifetime_seconds=env.JWT_LIFETIME_SECONDS)
+    return CachedJWTStrategy(secret=env.JWT_SECRET, lifetime_seconds=env.JWT_LIFETIME_SECONDS)
+
+async def authenticate_token(token: Optional[str]) -> Optional[User]:
+    """
+    Usuario de un JWT con una sesión que se cierra al terminar.
+    Para respuestas de larga duración (streams), donde una dependencia con yield
+    retendría la conexión hasta que el cliente se desconecte.
+    """
+    if not token:
+        return None
+    async with AsyncSessionLocal() as session:
+        user_manager = UserManager(SQLAlchemyUserDatabase(session, User), password_helper)
+        return await get_jwt_strategy().read_token(token, user_manager)
 
 # Authentication backend
 auth_backend = AuthenticationBackend(
@@ -44,19 +93,59 @@ auth_router = fastapi_users.get_auth_router(auth_backend)
 # Admin router para crear usuarios (protegido, solo superuser)
 admin_router = APIRouter(prefix="/admin", tags=["admin"])
 
+async def get_admin_read_session(
+    current_user: User = Depends(get_current_superuser)
+) -> AsyncGenerator[AsyncSession, None]:
+    """Sesión de lectura (réplica si aplica) para listados de admin."""
+    async for session in get_read_session(current_user.id):
+        yield session
+
 @admin_router.post("/users", response_model=UserRead)
 async def create_user(
     user_create: UserCreate,
     user_manager: UserManager = Depends(get_user_manager),
-    _: User = Depends(get_current_superuser),  # Solo superusers pueden crear usuarios
+    admin: User = Depends(get_current_superuser),  # Solo superusers pueden crear usuarios
 ):
     """Crear un nuevo usuario (solo admin)"""
     user = await user_manager.create(user_create)
+    replica_router.note_write(admin.id)
     return user
 
+@admin_router.post("/users/bulk", response_model=UserImportResult)
+async def import_users_bulk(
+    request: Request,
+    admin: User = Depends(get_current_superuser),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Alta masiva de usuarios (solo admin).
+    Cuerpo: CSV (Content-Type: text/csv, con encabezado email,password,first_name,last_name)
+    o JSON (lista de objetos UserCreate). Devuelve el resultado de cada fila.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        file_format = "csv"
+    elif "json" in content_type:
+        file_format = "json"
+    else:
+        raise HTTPException(status_code=415, detail="Use Content-Type text/csv or application/json")
+
+    try:
+        rows = parse_users_file(await request.body(), file_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=400, detail="No users to import")
+    if len(rows) > env.USER_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Too many rows (max {env.USER_IMPORT_MAX_ROWS})")
+
+    summary = await import_users(session, rows)
+    replica_router.note_write(admin.id)
+    return summary
+
 @admin_router.get("/users", response_model=list[UserRead])
 async def get_all_users(
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_admin_read_session),
     _: User = Depends(get_current_superuser),  # Solo superusers pueden listar usuarios
 ):
     """Obtener lista de todos los usuarios (solo admin)"""
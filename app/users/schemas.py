@@ -1,5 +1,6 @@
 from fastapi_users import schemas
-from typing import Optional
+from pydantic import BaseModel
+from typing import List, Literal, Optional
 
 
 class UserRead(schemas.BaseUser[int]):
@@ -17,4 +18,22 @@ class UserCreate(schemas.BaseUserCreate):
 
 class UserUpdate(schemas.BaseUserUpdate):
     first_name: Optional[str] = None
-    last_name: Optional[str] = None
\ No newline at end of file
+    last_name: Optional[str] = None
+
+
+class UserImportRowResult(BaseModel):
+    """Resultado de una fila del import masivo (row = número de fila de datos, desde 1)"""
+    row: int
+    email: Optional[str] = None
+    status: Literal["created", "duplicate", "invalid"]
+    detail: Optional[str] = None
+    id: Optional[int] = None
+
+
+class UserImportResult(BaseModel):
+    """Resumen del import masivo de usuarios"""
+    total: int
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[UserImportRowResult]
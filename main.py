@@ -1,17 +1,75 @@
-from fastapi import FastAPI
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.dependencies import get_env_vars
-from app.users.routes import users_router, auth_router, admin_router
+from app.core.logging_config import RequestIdMiddleware, setup_logging
+from app.core.metrics import MetricsMiddleware, registry
+from app.db.notifications import listener
+from app.db.postgres_connector import prewarm_connections
+from app.marks.anomalies import anomaly_scan_loop
+from app.marks.events import MARK_EVENTS_CHANNEL, mark_event_hub
+from app.marks.partitions import partition_maintenance_loop
+from app.users.cache import AUTH_INVALIDATION_CHANNEL, handle_invalidation_notification
+from app.users.password import password_pool
+from app.users.models import User
+from app.users.routes import users_router, auth_router, admin_router, get_current_superuser
 from app.marks.routes import router as marks_router
 
 env = get_env_vars()
 
+# Logging antes de crear la app: JSON vía cola, sin escribir a stdout desde el event loop
+setup_logging(env.LOG_LEVEL, env.LOG_GEOCODING_SAMPLE_EVERY)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único LISTEN por worker: invalidaciones del cache de autenticación y feed en vivo de marcas
+    listener.subscribe(AUTH_INVALIDATION_CHANNEL, handle_invalidation_notification)
+    listener.subscribe(MARK_EVENTS_CHANNEL, mark_event_hub.dispatch)
+    listener.start()
+    # Abrir conexiones del pool sin bloquear el arranque (cold start de Fly)
+    prewarm_task = asyncio.create_task(prewarm_connections(env.DB_PREWARM_CONNECTIONS))
+    # Particiones mensuales de marks: mes actual y siguientes, luego una vez al día
+    partition_task = asyncio.create_task(partition_maintenance_loop())
+    # Índice de anomalías: escaneo incremental periódico (un worker a la vez por advisory lock)
+    anomaly_task = None
+    if env.ANOMALY_SCAN_INTERVAL_SECONDS > 0:
+        anomaly_task = asyncio.create_task(anomaly_scan_loop())
+    yield
+    mark_event_hub.close_all()
+    if anomaly_task is not None:
+        anomaly_task.cancel()
+    partition_task.cancel()
+    prewarm_task.cancel()
+    await listener.stop()
+    password_pool.shutdown()
+
+
 app = FastAPI(
     title="Clock Hourly Report API",
     description="API for managing employee clock in/out records",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Control de admisión (el más interno: CORS agrega sus headers también a los 429/503)
+if env.ADMISSION_ENABLED:
+    from app.core.admission import AdmissionMiddleware
+    app.add_middleware(
+        AdmissionMiddleware,
+        limits={
+            "critical": (env.ADMISSION_CRITICAL_CONCURRENCY, env.ADMISSION_CRITICAL_QUEUE_SECONDS),
+            "default": (env.ADMISSION_DEFAULT_CONCURRENCY, env.ADMISSION_DEFAULT_QUEUE_SECONDS),
+            "heavy": (env.ADMISSION_HEAVY_CONCURRENCY, env.ADMISSION_HEAVY_QUEUE_SECONDS),
+        },
+        rate_per_second=env.RATE_LIMIT_PER_SECOND,
+        burst=env.RATE_LIMIT_BURST,
+    )
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +79,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas (se agrega al final para envolver CORS y medir el request completo)
+if env.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Profiler de requests lentos (solo se agrega si está activado)
+if env.PROFILER_ENABLED:
+    from app.core.profiler import ProfilerMiddleware
+    app.add_middleware(
+        ProfilerMiddleware,
+        slow_ms=env.PROFILER_SLOW_MS,
+        sample_rate=env.PROFILER_SAMPLE_RATE,
+        buffer_size=env.PROFILER_BUFFER_SIZE,
+        max_statements=env.PROFILER_MAX_STATEMENTS,
+        stack_interval_ms=env.PROFILER_STACK_INTERVAL_MS,
+    )
+
+# Presupuesto de queries por ruta (app/core/query_budget.py)
+if env.QUERY_BUDGET_MODE != "off":
+    from app.core.query_budget import QueryBudgetMiddleware
+    app.add_middleware(QueryBudgetMiddleware)
+
+# Request id (el más externo: todo lo que se loguee en el request lleva el mismo id)
+app.add_middleware(RequestIdMiddleware)
+
 # Routers
 app.include_router(auth_router, prefix="/auth/jwt", tags=["auth"])
 app.include_router(users_router, prefix="/users", tags=["users"])
@@ -33,4 +115,35 @@ app.include_router(marks_router)  # Rutas de marcas (clock in/out)
 
 @app.get("/health")
 async def health_check():
-    return {"status_code": 200, "message": "OK"}
\ No newline at end of file
+    return {"status_code": 200, "message": "OK"}
+
+
+async def metrics(authorization: Optional[str] = Header(None)):
+    """
+    Métricas de este worker en formato de texto de Prometheus.
+    Con METRICS_TOKEN configurado exige `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    if env.METRICS_TOKEN and not hmac.compare_digest(
+        (authorization or "").encode(), f"Bearer {env.METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+if env.METRICS_ENABLED:
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+
+
+if env.PROFILER_ENABLED:
+    from app.core.profiler import profile_buffer
+
+    @app.get("/admin/profiles", tags=["admin"])
+    async def get_profiles(_: User = Depends(get_current_superuser)):
+        """Requests lentos o muestreados de este worker, más recientes primero (solo admin)."""
+        return profile_buffer.snapshot()
+
+    @app.delete("/admin/profiles", tags=["admin"])
+    async def clear_profiles(_: User = Depends(get_current_superuser)):
+        """Vaciar el buffer de capturas de este worker (solo admin)."""
+        profile_buffer.clear()
+        return {"message": "Profiles cleared"}
@@ -0,0 +1,48 @@
+import asyncio
+import sys
+import os
+from datetime import datetime
+
+# Agregar raíz del proyecto al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.marks.archive import archive_marks_before, load_manifest
+
+
+async def archive_marks():
+    print("\n=== Archivar Marcas Antiguas ===\n")
+
+    # Fecha de corte: se archivan los meses completos anteriores a su mes
+    before = sys.argv[1] if len(sys.argv) > 1 else input("Archivar meses anteriores a (YYYY-MM-DD): ").strip()
+    try:
+        cutoff = datetime.strptime(before, "%Y-%m-%d")
+    except ValueError:
+        print("Fecha inválida. Usa YYYY-MM-DD.")
+        return
+
+    archived = load_manifest()["months"]
+    if archived:
+        print(f"Meses ya archivados: {', '.join(sorted(archived))}")
+
+    confirm = input(f"\n¿Archivar y borrar de la base las marcas anteriores a {cutoff:%Y-%m}? (y/N): ").strip().lower()
+    if confirm != "y":
+        print("Cancelado.")
+        return
+
+    try:
+        summary = await archive_marks_before(cutoff)
+    except Exception as e:
+        print(f"\n❌ Error archivando marcas: {e}")
+        return
+
+    if not summary["months"]:
+        print("\nNo hay marcas para archivar.")
+        return
+
+    for month in summary["months"]:
+        print(f"  {month['month']}: {month['rows']} marcas archivadas, {month['deleted']} borradas")
+    print(f"\n✅ Archivado completo antes de {summary['cutoff']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(archive_marks())
@@ -8,7 +8,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.db.postgres_connector import get_async_session
 from app.users.routes import get_user_db
-from fastapi_users.password import PasswordHelper
+from app.users.password import password_pool
 
 # Importar modelos para registrar mapeos en SQLAlchemy antes de usar la sesión
 # (evita: InvalidRequestError: expression 'Mark' failed to locate a name 'Mark')
@@ -49,8 +49,8 @@ async def create_superuser_interactive():
         print("Cancelado.")
         return
 
-    password_helper = PasswordHelper()
-    hashed_password = password_helper.hash(pwd1)
+    # Mismos parámetros de Argon2 que la API, calculado fuera del event loop
+    hashed_password = await password_pool.hash(pwd1)
 
     user_dict = {
         "email": email,
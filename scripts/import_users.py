@@ -0,0 +1,54 @@
+import asyncio
+import sys
+import os
+
+# Agregar raíz del proyecto al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.postgres_connector import AsyncSessionLocal
+from app.users.bulk_import import import_users, parse_users_file
+
+# Importar modelos para registrar mapeos en SQLAlchemy antes de usar la sesión
+from app.users.models import User  # noqa: F401
+from app.marks.models import Mark  # noqa: F401
+
+
+async def import_users_from_file():
+    print("\n=== Alta Masiva de Usuarios ===\n")
+
+    path = sys.argv[1] if len(sys.argv) > 1 else input("Archivo CSV o JSON: ").strip()
+    file_format = "json" if path.lower().endswith(".json") else "csv"
+    try:
+        with open(path, "rb") as f:
+            rows = parse_users_file(f.read(), file_format)
+    except (OSError, ValueError) as e:
+        print(f"No se pudo leer el archivo: {e}")
+        return
+
+    if not rows:
+        print("El archivo no tiene usuarios.")
+        return
+
+    confirm = input(f"¿Importar {len(rows)} usuarios desde {path}? (y/N): ").strip().lower()
+    if confirm != "y":
+        print("Cancelado.")
+        return
+
+    try:
+        async with AsyncSessionLocal() as session:
+            summary = await import_users(session, rows)
+    except Exception as e:
+        print(f"\n❌ Error importando usuarios: {e}")
+        print("Asegúrate de haber corrido las migraciones (alembic upgrade head) y que la DB esté accesible.")
+        return
+
+    for result in summary["results"]:
+        if result["status"] != "created":
+            print(f"  Fila {result['row']} ({result['email'] or '-'}): {result['status']} - {result['detail']}")
+
+    print(f"\nCreados: {summary['created']}  Duplicados: {summary['duplicates']}  Inválidos: {summary['invalid']}")
+    print(f"✅ Import completo ({summary['total']} filas)")
+
+
+if __name__ == "__main__":
+    asyncio.run(import_users_from_file())
@@ -7,7 +7,8 @@ import getpass
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.db.postgres_connector import get_async_session
-from fastapi_users.password import PasswordHelper
+from app.users.cache import AUTH_INVALIDATION_CHANNEL
+from app.users.password import password_pool
 from sqlalchemy import text
 
 
@@ -32,9 +33,8 @@ async def reset_password():
             continue
         break
 
-    # Hash password usando el mismo helper que fastapi-users
-    password_helper = PasswordHelper()
-    hashed_password = password_helper.hash(pwd1)
+    # Hash password con los mismos parámetros de Argon2 que la API
+    hashed_password = await password_pool.hash(pwd1)
 
     # Actualizar en la base de datos
     async for session in get_async_session():
@@ -71,6 +71,12 @@ async def reset_password():
                     "hashed_password": hashed_password,
                 }
             )
+            # Invalidar el usuario en el cache de autenticación de la API
+            # (el NOTIFY se entrega a los workers al hacer commit)
+            await session.execute(
+                text("SELECT pg_notify(:channel, :user_id)"),
+                {"channel": AUTH_INVALIDATION_CHANNEL, "user_id": str(user[0])}
+            )
             await session.commit()
             print(f"\n✅ Contraseña actualizada exitosamente para: {email}")
             
@@ -0,0 +1,32 @@
+import asyncio
+import sys
+import os
+
+# Agregar raíz del proyecto al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.marks.anomalies import run_anomaly_scan
+
+
+async def scan_anomalies():
+    print("\n=== Escanear Anomalías de Marcas ===\n")
+
+    try:
+        summary = await run_anomaly_scan()
+    except Exception as e:
+        print(f"\n❌ Error escaneando anomalías: {e}")
+        return
+
+    if summary is None:
+        print("Otro escaneo está en curso. Intenta más tarde.")
+        return
+
+    print(f"  Instantes cambiados: {summary['changed_points']}")
+    print(f"  Usuarios / ventanas: {summary['users']} / {summary['windows']}")
+    print(f"  Anomalías vigentes en las ventanas: {summary['anomalies']}")
+    print(f"  Anomalías resueltas: {summary['resolved']}")
+    print(f"\n✅ Escaneo completo (marca de agua: id {summary['last_mark_id']})")
+
+
+if __name__ == "__main__":
+    asyncio.run(scan_anomalies())
@@ -0,0 +1,80 @@
+"""
+Envía el digest semanal por email a cada empleado (y el resumen a DIGEST_ADMIN_EMAILS).
+
+Uso (programarlo cada viernes, p. ej. con cron o `fly machine run --schedule weekly`):
+    python scripts/send_weekly_digests.py [--start-date YYYY-MM-DD --end-date YYYY-MM-DD]
+        [--tz America/Mexico_City | --timezone-offset-minutes N] [--to prueba@example.com] [--dry-run]
+
+Por defecto usa la semana actual (sábado a viernes), como los reportes.
+Contra un SMTP local de prueba: python -m aiosmtpd -n -l localhost:1025 y
+SMTP_HOST=localhost SMTP_PORT=1025.
+"""
+import argparse
+import asyncio
+import sys
+import os
+
+# Agregar raíz del proyecto al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.postgres_connector import AsyncSessionLocal
+from app.marks.digest import send_weekly_digests
+from app.marks.reports import resolve_report_range
+from app.marks.timezones import UnknownTimeZone
+
+# Importar modelos para registrar mapeos en SQLAlchemy antes de usar la sesión
+from app.users.models import User  # noqa: F401
+from app.marks.models import Mark  # noqa: F401
+
+
+async def send_digests(args):
+    print("\n=== Digest Semanal por Email ===\n")
+
+    try:
+        start_date_obj, end_date_obj = resolve_report_range(
+            args.start_date, args.end_date, args.timezone_offset_minutes, args.tz
+        )
+    except UnknownTimeZone as e:
+        print(e)
+        return 1
+    except ValueError:
+        print("Fecha inválida. Usa YYYY-MM-DD.")
+        return 1
+
+    try:
+        async with AsyncSessionLocal() as session:
+            summary = await send_weekly_digests(
+                session, start_date_obj, end_date_obj,
+                timezone_offset_minutes=args.timezone_offset_minutes,
+                tz=args.tz,
+                redirect_to=args.to,
+                dry_run=args.dry_run,
+            )
+    except Exception as e:
+        print(f"\n❌ Error enviando digests: {e}")
+        return 1
+
+    source = "snapshot de nómina" if summary["from_snapshot"] else "marcas"
+    print(f"  Semana: {summary['start_date']} a {summary['end_date']} ({source})")
+    print(f"  Usuarios: {summary['users']}  Emails: {summary['messages']}")
+    print(f"  Cálculo: {summary['compute_seconds']}s  Render: {summary['render_seconds']}s  "
+          f"Envío: {summary['send_seconds']}s ({summary['messages_per_second']} emails/s)")
+    for failure in summary["failed"]:
+        print(f"  ❌ {failure['to']}: {failure['error']}")
+
+    if args.dry_run:
+        print("\n✅ Dry run: no se envió ningún email")
+    else:
+        print(f"\n✅ Enviados {summary['sent']} de {summary['messages']} ({summary['retries']} reintentos)")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send the weekly hours digest emails")
+    parser.add_argument("--start-date")
+    parser.add_argument("--end-date")
+    parser.add_argument("--timezone-offset-minutes", type=int)
+    parser.add_argument("--tz", help="IANA time zone (overrides --timezone-offset-minutes)")
+    parser.add_argument("--to", help="Send every email to this address instead (testing)")
+    parser.add_argument("--dry-run", action="store_true", help="Compute and render without sending")
+    sys.exit(asyncio.run(send_digests(parser.parse_args())))
@@ -0,0 +1,66 @@
+"""Servidor SMTP mínimo en proceso para las pruebas del digest (sin TLS ni autenticación)."""
+import asyncio
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+
+
+class SmtpStandIn:
+    """
+    Acepta EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT y guarda los mensajes recibidos.
+    `reject` son destinatarios que responden 550; con `drop_first_data` la primera
+    transacción DATA corta la conexión sin aceptar el mensaje (fallo transitorio).
+    """
+
+    def __init__(self, reject: tuple[str, ...] = (), drop_first_data: bool = False):
+        self.reject = set(reject)
+        self.drop_first_data = drop_first_data
+        self.messages: list[EmailMessage] = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+
+        async def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        try:
+            await reply("220 localhost SMTP stand-in")
+            while line := await reader.readline():
+                command = line.decode().strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    await reply("250-localhost")
+                    await reply("250-8BITMIME")
+                    await reply("250 SMTPUTF8")
+                elif verb == "RCPT":
+                    address = command.split(":", 1)[1].split()[0].strip("<>")
+                    await reply("550 No such user" if address in self.reject else "250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = bytearray()
+                    while (chunk := await reader.readline()) != b".\r\n":
+                        data += chunk[1:] if chunk.startswith(b"..") else chunk
+                    if self.drop_first_data:
+                        self.drop_first_data = False
+                        return
+                    self.messages.append(message_from_bytes(bytes(data), policy=policy.default))
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    return
+                elif verb in ("HELO", "MAIL", "RSET", "NOOP"):
+                    await reply("250 OK")
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
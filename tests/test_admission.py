@@ -0,0 +1,129 @@
+"""
+Control de admisión (app/core/admission.py): clases de ruta, 503 con Retry-After al
+saturarse una clase sin afectar a las demás, y llave del rate limit (usuario de un token
+ya autenticado, o IP de Fly-Client-IP).
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.admission import AdmissionMiddleware, _client_key, classify
+from app.users.cache import auth_cache
+from app.users.models import User
+from app.users.routes import get_jwt_strategy
+
+
+async def _token(user_id: int) -> str:
+    return await get_jwt_strategy().write_token(User(id=user_id, email=f"user{user_id}@example.com"))
+
+
+def _scope(headers: dict[str, str], query_string: str = "", client_ip: str = "10.0.0.1") -> dict:
+    return {
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "query_string": query_string.encode(),
+        "client": (client_ip, 40000),
+    }
+
+
+@pytest.fixture
+def clean_auth_cache():
+    auth_cache.clear()
+    yield auth_cache
+    auth_cache.clear()
+
+
+async def test_authenticated_token_keys_on_user(clean_auth_cache):
+    token = await _token(7)
+    # Hasta que la autenticación de la ruta lo verifica, el token cuenta para la IP
+    assert _client_key(_scope({"Authorization": f"Bearer {token}"})) == "ip:10.0.0.1"
+
+    clean_auth_cache.put(token, User(id=7, email="user7@example.com"))
+
+    assert _client_key(_scope({"Authorization": f"Bearer {token}"})) == "u:7"
+    # EventSource manda el token en la query
+    assert _client_key(_scope({}, f"access_token={token}")) == "u:7"
+
+
+async def test_forged_tokens_fall_back_to_client_ip(clean_auth_cache):
+    token = await _token(7)
+    forged = token[:-4] + ("AAAA" if not token.endswith("AAAA") else "BBBB")
+
+    assert _client_key(_scope({"Authorization": f"Bearer {forged}"})) == "ip:10.0.0.1"
+    assert _client_key(_scope({"Authorization": "Bearer not-a-jwt"})) == "ip:10.0.0.1"
+
+
+def test_only_fly_client_ip_is_trusted():
+    assert _client_key(_scope({"X-Forwarded-For": "203.0.113.9"})) == "ip:10.0.0.1"
+    assert _client_key(_scope({"Fly-Client-IP": "198.51.100.4", "X-Forwarded-For": "203.0.113.9"})) == "ip:198.51.100.4"
+
+
+async def ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def test_rotating_forged_tokens_are_rate_limited(clean_auth_cache):
+    app = AdmissionMiddleware(ok, {"default": (10, 1.0)}, rate_per_second=0.001, burst=2)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        statuses = [
+            (await http.get("/users/me", headers={"Authorization": f"Bearer forged-{i}"})).status_code
+            for i in range(4)
+        ]
+
+    assert statuses == [200, 200, 429, 429]
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("POST", "/marks/clock-in", "critical"),
+    ("POST", "/marks/clock-out", "critical"),
+    ("GET", "/marks/summary-report", "heavy"),
+    ("GET", "/marks/weekly-report/7", "heavy"),
+    ("POST", "/marks/bulk", "heavy"),
+    # ORDER BY timestamp DESC LIMIT n sobre idx_marks_timestamp_desc: no compite con los reportes
+    ("GET", "/marks/all", "default"),
+    ("GET", "/marks/my-marks", "default"),
+    ("GET", "/health", None),
+    ("GET", "/marks/live", None),
+])
+def test_route_classes(method, path, expected):
+    assert classify(method, path) == expected
+
+
+class BlockingApp:
+    """Deja colgados los requests de reportes hasta `release`; el resto responde al instante."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"] == "/marks/summary-report":
+            self.started += 1
+            await self.release.wait()
+        await ok(scope, receive, send)
+
+
+async def test_saturated_heavy_class_sheds_with_retry_after_but_admits_clock_in():
+    inner = BlockingApp()
+    app = AdmissionMiddleware(inner, {"critical": (5, 1.0), "heavy": (1, 0.2), "default": (5, 1.0)})
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        report = asyncio.create_task(http.get("/marks/summary-report"))
+        while not inner.started:
+            await asyncio.sleep(0.01)
+
+        # Sin duración media conocida espera en cola hasta el plazo (0.2 s) y se rechaza
+        queued = await http.get("/marks/summary-report")
+        # Con la duración media conocida la espera estimada (10 s) supera el plazo: al instante
+        app.classes["heavy"].service_time = 10.0
+        shed = await http.get("/marks/weekly-report/7")
+        clock_in = await http.post("/marks/clock-in")
+
+        inner.release.set()
+        assert (await report).status_code == 200
+
+    assert (queued.status_code, queued.headers["retry-after"]) == (503, "1")
+    assert queued.json() == {"detail": "Server busy, retry later"}
+    assert (shed.status_code, shed.headers["retry-after"]) == (503, "10")
+    assert clock_in.status_code == 200
+    assert inner.started == 1
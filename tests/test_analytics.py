@@ -0,0 +1,51 @@
+"""Heatmap de horas (GET /marks/analytics/heatmap): resultado y tiempo con un año de datos."""
+import time
+from datetime import datetime
+
+import pytest
+
+from app.marks import analytics
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions, seed_workforce
+
+
+async def test_sessions_are_split_across_hours(db, client):
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    admin = await create_user("admin@example.com", superuser=True)
+    # Lunes 14:30-16:15 UTC = 8:30-10:15 con offset 360
+    await create_marks(admin.id, [(datetime(2026, 10, 5, 14, 30), datetime(2026, 10, 5, 16, 15))])
+
+    response = await client.get(
+        "/marks/analytics/heatmap",
+        params={"start_date": "2026-10-05", "end_date": "2026-10-11", "timezone_offset_minutes": 360},
+        headers=await auth_headers(admin),
+    )
+
+    assert response.status_code == 200, response.text
+    monday = response.json()["matrix"][0]
+    assert (monday[8], monday[9], monday[10]) == (0.5, 1.0, 0.25)
+    assert sum(sum(row) for row in response.json()["matrix"]) == 1.75
+
+
+@pytest.mark.benchmark
+async def test_heatmap_year_of_data_within_time_budget(db, client):
+    users = 200
+    await seed_workforce(users, datetime(2025, 10, 1), datetime(2026, 9, 30))
+    admin = await create_user("admin@example.com", superuser=True)
+    headers = await auth_headers(admin)
+    budget = analytics.env.ANALYTICS_STATEMENT_TIMEOUT_MS / 1000
+
+    for by_po in (False, True):
+        started = time.perf_counter()
+        response = await client.get(
+            "/marks/analytics/heatmap",
+            params={"start_date": "2025-10-01", "end_date": "2026-09-30", "by_po": str(by_po).lower()},
+            headers=headers,
+        )
+        elapsed = time.perf_counter() - started
+
+        # Un statement_timeout vencido responde 503
+        assert response.status_code == 200, response.text
+        total = sum(sum(row) for row in response.json()["matrix"])
+        print(f"\nheatmap by_po={by_po}: {users} users x 365 days, {total:,.0f} hours in {elapsed * 1000:.0f} ms")
+        assert total == users * 365 * 8
+        assert elapsed < budget
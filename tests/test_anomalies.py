@@ -0,0 +1,208 @@
+"""
+Índice de anomalías (app/marks/anomalies.py): reglas de _evaluate, ventanas de
+_rescan_window, pasadas incrementales de scan_anomalies con las marcas de agua y
+marks_rescan_queue, y marks.updated_at (marca de agua de ediciones).
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.marks import anomalies, routes
+from app.marks.models import Mark, MarkType
+# Import directo: conftest reemplaza routes.update_mark_address_background en cada prueba
+from app.marks.routes import update_mark_address_background
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+SHIFT = [(datetime(2026, 10, 5, 14), datetime(2026, 10, 5, 22))]
+
+
+async def _updated_at(db, mark_id: int):
+    async with db() as session:
+        return (await session.execute(text("SELECT updated_at FROM marks WHERE id = :id"), {"id": mark_id})).scalar_one()
+
+
+async def test_geocoded_address_does_not_touch_updated_at(db, monkeypatch):
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, SHIFT)
+
+    async def address(latitude, longitude):
+        return "Av. Insurgentes Sur 1000, Ciudad de México"
+
+    monkeypatch.setattr(routes, "get_address_from_coords", address)
+    await update_mark_address_background(1, 19.43, -99.13)
+
+    async with db() as session:
+        stored = (await session.execute(text("SELECT address FROM marks WHERE id = 1"))).scalar_one()
+    assert stored == "Av. Insurgentes Sur 1000, Ciudad de México"
+    assert await _updated_at(db, 1) is None
+
+
+async def test_edits_touch_updated_at_only_when_values_change(db, client):
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    admin = await create_user("admin@example.com", superuser=True)
+    await create_marks(admin.id, SHIFT)
+    headers = await auth_headers(admin)
+
+    assert (await client.put("/marks/1", json={"po_number": "PO-1"}, headers=headers)).status_code == 200
+    assert await _updated_at(db, 1) is None
+
+    assert (await client.put("/marks/1", json={"po_number": "PO-2"}, headers=headers)).status_code == 200
+    assert await _updated_at(db, 1) is not None
+
+
+WindowMark = namedtuple("WindowMark", "id mark_type timestamp po_number")
+IN, OUT = MarkType.CLOCK_IN, MarkType.CLOCK_OUT
+
+
+def test_evaluate_rules():
+    now = datetime(2026, 10, 19, 12)
+    marks = [
+        WindowMark(1, OUT, datetime(2026, 10, 1, 22), "PO-1"),  # sin clock in anterior
+        WindowMark(2, IN, datetime(2026, 10, 2, 14), "PO-1"),
+        WindowMark(3, OUT, datetime(2026, 10, 2, 22), "PO-2"),  # PO distinto al de su entrada
+        WindowMark(4, IN, datetime(2026, 10, 3, 14), "PO-1"),
+        WindowMark(5, OUT, datetime(2026, 10, 4, 8), "PO-1"),  # sesión cerrada de 18 horas
+        WindowMark(6, IN, datetime(2026, 10, 18, 14), "PO-1"),  # abierta hasta ahora: 22 horas
+    ]
+
+    found = anomalies._evaluate(marks, 0, len(marks), now, open_hours=16)
+
+    assert [(anomaly["kind"], anomaly["mark"].id, anomaly["detail"]) for anomaly in found] == [
+        ("orphan_clock_out", 1, {"previous_mark_id": None}),
+        ("po_mismatch", 3, {"clock_in_id": 2, "clock_in_po_number": "PO-1", "clock_out_po_number": "PO-2"}),
+        ("open_session", 4, {"hours": 18.0, "closed": True}),
+        ("open_session", 6, {"hours": 22.0, "closed": False}),
+    ]
+    # Solo se reportan las marcas del rango; las demás son contexto
+    assert [anomaly["mark"].id for anomaly in anomalies._evaluate(marks, 2, 4, now, open_hours=16)] == [3, 4]
+
+
+# Usuario A: turno normal, PO distinto al salir, entrada sin salida (24 h hasta la siguiente
+# marca), turno normal y una salida huérfana tres días después
+USER_A_MARKS = [
+    (IN, datetime(2026, 10, 5, 14), "PO-1"),
+    (OUT, datetime(2026, 10, 5, 22), "PO-1"),
+    (IN, datetime(2026, 10, 6, 14), "PO-1"),
+    (OUT, datetime(2026, 10, 6, 22), "PO-2"),
+    (IN, datetime(2026, 10, 8, 14), "PO-1"),
+    (IN, datetime(2026, 10, 9, 14), "PO-1"),
+    (OUT, datetime(2026, 10, 9, 22), "PO-1"),
+    (OUT, datetime(2026, 10, 12, 22), "PO-1"),
+]
+# Usuario B: turno normal y, dos semanas después, una salida duplicada
+USER_B_MARKS = [
+    (IN, datetime(2026, 10, 1, 14), "PO-7"),
+    (OUT, datetime(2026, 10, 1, 22), "PO-7"),
+    (IN, datetime(2026, 10, 14, 14), "PO-7"),
+    (OUT, datetime(2026, 10, 14, 22), "PO-7"),
+    (OUT, datetime(2026, 10, 14, 23), "PO-7"),
+]
+
+
+async def _insert_marks(db, user_id: int, rows: list[tuple]) -> list[int]:
+    async with db() as session:
+        marks = [
+            Mark(user_id=user_id, mark_type=mark_type, timestamp=timestamp, latitude=19.43,
+                 longitude=-99.13, address="Av. Reforma 222", po_number=po_number)
+            for mark_type, timestamp, po_number in rows
+        ]
+        session.add_all(marks)
+        await session.commit()
+        return [mark.id for mark in marks]
+
+
+async def _anomaly_rows(db) -> set[tuple]:
+    async with db() as session:
+        result = await session.execute(text("SELECT kind, mark_id FROM mark_anomalies"))
+        return {tuple(row) for row in result}
+
+
+@pytest.fixture
+async def two_workers(db):
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    user_a = await create_user("worker-a@example.com")
+    user_b = await create_user("worker-b@example.com")
+    return (
+        (user_a.id, await _insert_marks(db, user_a.id, USER_A_MARKS)),
+        (user_b.id, await _insert_marks(db, user_b.id, USER_B_MARKS)),
+    )
+
+
+async def test_rescan_window_evaluates_the_window_and_its_nearest_neighbours(db, two_workers):
+    (user_a, ids), _ = two_workers
+    now = datetime(2026, 10, 19, 12)
+
+    # Ventana de la entrada sin salida: la salida del 6 (antes) y la entrada del 9 (después)
+    # se evalúan con su otra vecina como contexto; la salida huérfana del 12 queda fuera
+    async with db() as session:
+        window = await anomalies._rescan_window(session, user_a, USER_A_MARKS[4][1], USER_A_MARKS[4][1], now, 16)
+        await session.commit()
+    assert window == ({("po_mismatch", ids[3]), ("open_session", ids[4])}, 0)
+    assert await _anomaly_rows(db) == {("po_mismatch", ids[3]), ("open_session", ids[4])}
+
+    # Con la salida corregida, la misma ventana borra la anomalía que ya no aplica
+    async with db() as session:
+        await session.execute(text("UPDATE marks SET po_number = 'PO-1' WHERE id = :id"), {"id": ids[3]})
+        window = await anomalies._rescan_window(session, user_a, USER_A_MARKS[4][1], USER_A_MARKS[4][1], now, 16)
+        await session.commit()
+    assert window == ({("open_session", ids[4])}, 1)
+    assert await _anomaly_rows(db) == {("open_session", ids[4])}
+
+
+async def test_incremental_scan_resolves_edits_moves_and_deletes(db, two_workers, monkeypatch):
+    (user_a, a_ids), (user_b, b_ids) = two_workers
+    # Sin el solapamiento de ids (pensado para tablas grandes) cada pasada ve solo lo nuevo
+    monkeypatch.setattr(anomalies, "ID_OVERLAP", 0)
+
+    async with db() as session:
+        first = await anomalies.scan_anomalies(session, open_hours=16)
+    async with db() as session:
+        detail = (await session.execute(text(
+            "SELECT detail FROM mark_anomalies WHERE kind = 'open_session'"
+        ))).scalar_one()
+
+    assert await _anomaly_rows(db) == {
+        ("po_mismatch", a_ids[3]),
+        ("open_session", a_ids[4]),
+        ("orphan_clock_out", a_ids[7]),
+        ("orphan_clock_out", b_ids[4]),
+    }
+    assert detail == {"hours": 24.0, "closed": False}
+    # Primera pasada: todas las marcas; A en dos ventanas (3 días sin marcas), B en dos.
+    # La salida huérfana del 12 es vecina de la primera ventana de A, pero cuenta una vez
+    assert {key: first[key] for key in ("changed_points", "users", "windows", "anomalies", "resolved")} == {
+        "changed_points": 13, "users": 2, "windows": 4, "anomalies": 4, "resolved": 0,
+    }
+    assert first["last_mark_id"] == b_ids[-1]
+
+    async with db() as session:
+        # Edición (updated_at): la salida del 6 toma el PO de su entrada
+        await session.execute(text("UPDATE marks SET po_number = 'PO-1' WHERE id = :id"), {"id": a_ids[3]})
+        # Movida (updated_at + cola con el instante anterior): la salida huérfana cierra la entrada del 8
+        await session.execute(
+            text("UPDATE marks SET timestamp = '2026-10-08 22:00' WHERE id = :id"), {"id": a_ids[7]}
+        )
+        # Eliminada (cola): la salida duplicada de B
+        await session.execute(text("DELETE FROM marks WHERE id = :id"), {"id": b_ids[4]})
+        await session.commit()
+
+    async with db() as session:
+        second = await anomalies.scan_anomalies(session, open_hours=16)
+        queued = (await session.execute(text("SELECT count(*) FROM marks_rescan_queue"))).scalar_one()
+
+    assert await _anomaly_rows(db) == set()
+    assert queued == 0
+    # Solo los cuatro instantes cambiados: 6 y 8 de octubre en una ventana, el 12 (de donde
+    # salió la marca movida) en otra y la salida borrada de B; los turnos sin cambios no se leen
+    assert {key: second[key] for key in ("changed_points", "users", "windows", "anomalies", "resolved")} == {
+        "changed_points": 4, "users": 2, "windows": 3, "anomalies": 0, "resolved": 4,
+    }
+
+    # El solapamiento de updated_at relee las ediciones recientes sin cambiar el índice
+    async with db() as session:
+        third = await anomalies.scan_anomalies(session, open_hours=16)
+    assert (third["changed_points"], third["resolved"], third["anomalies"]) == (2, 0, 0)
+    assert await _anomaly_rows(db) == set()
@@ -0,0 +1,138 @@
+"""Archivo en frío de marcas: congelamiento del mes, borrado exacto y meses vacíos."""
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.marks import archive
+from app.marks.archive import archive_marks_before
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+AUGUST = [(datetime(2026, 8, 3 + day, 14), datetime(2026, 8, 3 + day, 22)) for day in range(5)]
+JUNE = [(datetime(2026, 6, 1, 14), datetime(2026, 6, 1, 22))]
+
+
+@pytest.fixture
+async def archive_dir(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive.env, "ARCHIVE_DIR", str(tmp_path))
+    await ensure_partitions(datetime(2026, 6, 1), datetime(2026, 9, 30))
+    return tmp_path
+
+
+async def _scalar(db, sql: str, **params):
+    async with db() as session:
+        return (await session.execute(text(sql), params)).scalar_one()
+
+
+def _manifest(archive_dir) -> dict:
+    with open(archive_dir / "manifest.json") as f:
+        return json.load(f)["months"]
+
+
+async def test_archive_moves_month_to_file(db, archive_dir, client):
+    admin = await create_user("admin@example.com", superuser=True)
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, AUGUST)
+
+    summary = await archive_marks_before(datetime(2026, 9, 1))
+
+    assert summary["months"] == [{"month": "2026-08", "rows": 10, "deleted": 10}]
+    assert _manifest(archive_dir)["2026-08"]["status"] == "complete"
+    assert await _scalar(db, "SELECT count(*) FROM marks") == 0
+    # Los borrados del archivo no llenan la cola de reescaneo de anomalías
+    assert await _scalar(db, "SELECT count(*) FROM marks_rescan_queue") == 0
+
+    report = await client.get(
+        f"/marks/weekly-report/{user.id}?start_date=2026-08-01&end_date=2026-08-07",
+        headers=await auth_headers(admin),
+    )
+    assert report.json()["total_hours"] == 40.0
+
+
+async def test_empty_months_are_skipped(db, archive_dir):
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, JUNE + AUGUST)
+
+    summary = await archive_marks_before(datetime(2026, 9, 1))
+
+    assert [month["month"] for month in summary["months"]] == ["2026-06", "2026-08"]
+    assert "2026-07" not in _manifest(archive_dir)
+    assert not os.path.exists(archive_dir / "marks_2026_07.arrow")
+
+
+async def test_delete_keeps_marks_not_in_file(db, archive_dir, monkeypatch):
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, [(datetime(2026, 9, 7, 14), datetime(2026, 9, 7, 22))])
+    await create_marks(user.id, AUGUST)
+    export_month = archive._export_month
+
+    async def export_then_move(session, month):
+        exported = await export_month(session, month)
+        # Una marca con id bajo que llega al mes después de exportar (fuera de la API)
+        async with db() as other:
+            await other.execute(text("UPDATE marks SET timestamp = '2026-08-20 09:00' WHERE id = 1"))
+            await other.commit()
+        return exported
+
+    monkeypatch.setattr(archive, "_export_month", export_then_move)
+
+    summary = await archive_marks_before(datetime(2026, 9, 1))
+
+    assert summary["months"] == [{"month": "2026-08", "rows": 10, "deleted": 10}]
+    assert await _scalar(db, "SELECT count(*) FROM marks WHERE id = 1") == 1
+
+
+async def test_month_is_frozen_while_archiving(db, archive_dir, client, monkeypatch):
+    admin = await create_user("admin@example.com", superuser=True)
+    await create_marks(admin.id, AUGUST)
+    headers = await auth_headers(admin)
+    export_month = archive._export_month
+    responses = {}
+
+    async def export_and_write(session, month):
+        assert _manifest(archive_dir)["2026-08"]["status"] == "exporting"
+        responses["create"] = await client.post("/marks/create", json={
+            "user_id": admin.id, "mark_type": "clock_in", "timestamp": "2026-08-25T14:00:00",
+            "latitude": 19.43, "longitude": -99.13,
+        }, headers=headers)
+        responses["update"] = await client.put("/marks/1", json={"po_number": "PO-2"}, headers=headers)
+        responses["delete"] = await client.delete("/marks/3", headers=headers)
+        responses["bulk"] = await client.post(
+            "/marks/bulk", json={"operations": [{"op": "delete", "mark_id": 5}]}, headers=headers
+        )
+        return await export_month(session, month)
+
+    monkeypatch.setattr(archive, "_export_month", export_and_write)
+
+    summary = await archive_marks_before(datetime(2026, 9, 1))
+
+    assert {name: response.status_code for name, response in responses.items()} == {
+        "create": 409, "update": 409, "delete": 409, "bulk": 400,
+    }
+    assert responses["bulk"].json()["detail"]["results"][0]["status_code"] == 409
+    assert summary["months"] == [{"month": "2026-08", "rows": 10, "deleted": 10}]
+
+    # Archivado el mes, se vuelve a poder escribir en él
+    response = await client.post("/marks/create", json={
+        "user_id": admin.id, "mark_type": "clock_in", "timestamp": "2026-08-25T14:00:00",
+        "latitude": 19.43, "longitude": -99.13,
+    }, headers=headers)
+    assert response.status_code == 200
+
+
+async def test_failed_export_unfreezes_month(db, archive_dir, monkeypatch):
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, AUGUST)
+
+    async def broken_export(session, month):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(archive, "_export_month", broken_export)
+
+    with pytest.raises(OSError):
+        await archive_marks_before(datetime(2026, 9, 1))
+
+    assert "2026-08" not in _manifest(archive_dir)
+    assert await _scalar(db, "SELECT count(*) FROM marks") == 10
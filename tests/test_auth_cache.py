@@ -0,0 +1,140 @@
+"""
+Cache de autenticación (app/users/cache.py, CachedJWTStrategy): un token en cache no
+consulta la tabla user, y desactivar, degradar o resetear la contraseña de un usuario
+se aplica antes de que venza el TTL.
+"""
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+from sqlalchemy import text
+
+from app.core import query_budget
+from app.core.query_budget import QueryBudgetMiddleware
+from app.db.notifications import PgListener, asyncpg_dsn
+from app.users.cache import AUTH_INVALIDATION_CHANNEL, auth_cache, handle_invalidation_notification
+from main import app
+from scripts import reset_password
+from tests.utils import auth_headers, create_user
+
+READY_CHANNEL = "auth_cache_test_ready"
+
+
+@pytest.fixture
+def long_ttl(monkeypatch):
+    """TTL de una hora: lo que cambie antes es por invalidación, no por vencimiento."""
+    monkeypatch.setattr(auth_cache, "ttl_seconds", 3600)
+
+
+def _token(headers: dict) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+async def test_cached_token_skips_the_user_select(db, watched_engines, monkeypatch, long_ttl):
+    user = await create_user("worker@example.com")
+    headers = await auth_headers(user)
+    # Presupuesto 0: el middleware reporta todos los statements de cada request
+    monkeypatch.setitem(query_budget.ROUTE_QUERY_BUDGETS, ("GET", "/users/me"), 0)
+    exceeded = []
+    checked_app = QueryBudgetMiddleware(app, on_exceeded=exceeded.append)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=checked_app), base_url="http://test") as http:
+        cold = await http.get("/users/me", headers=headers)
+        statements = exceeded[0].statements if exceeded else []
+        exceeded.clear()
+        warm = await http.get("/users/me", headers=headers)
+
+    assert cold.status_code == warm.status_code == 200
+    assert warm.json() == cold.json()
+    assert any('FROM "user"' in statement for statement in statements)
+    assert exceeded == []
+
+
+async def test_deactivated_user_is_rejected_before_the_ttl(db, client, long_ttl):
+    admin = await create_user("admin@example.com", superuser=True)
+    worker = await create_user("worker@example.com")
+    headers = await auth_headers(worker)
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+    assert auth_cache.get(_token(headers)) is not None
+
+    response = await client.patch(f"/users/{worker.id}", json={"is_active": False}, headers=await auth_headers(admin))
+
+    assert response.status_code == 200, response.text
+    assert (await client.get("/users/me", headers=headers)).status_code == 401
+
+
+async def test_demoted_superuser_loses_admin_routes_before_the_ttl(db, client, long_ttl):
+    owner = await create_user("owner@example.com", superuser=True)
+    admin = await create_user("admin@example.com", superuser=True)
+    headers = await auth_headers(admin)
+    assert (await client.get("/admin/users", headers=headers)).status_code == 200
+
+    response = await client.patch(f"/users/{admin.id}", json={"is_superuser": False}, headers=await auth_headers(owner))
+
+    assert response.status_code == 200, response.text
+    assert (await client.get("/admin/users", headers=headers)).status_code == 403
+    assert (await client.get("/users/me", headers=headers)).json()["is_superuser"] is False
+
+
+@pytest.fixture
+async def invalidation_listener(db):
+    """LISTEN de auth_invalidations como el de un worker (lifespan en main.py), ya activo."""
+    ready = asyncio.Event()
+    listener = PgListener(asyncpg_dsn(os.environ["POSTGRES_DATABASE_URL"]), reconnect_delay=0.1)
+    listener.subscribe(AUTH_INVALIDATION_CHANNEL, handle_invalidation_notification)
+    listener.subscribe(READY_CHANNEL, lambda _payload: ready.set())
+    listener.start()
+    async with db() as session:
+        while not ready.is_set():
+            await session.execute(text(f"NOTIFY {READY_CHANNEL}"))
+            await session.commit()
+            try:
+                await asyncio.wait_for(ready.wait(), timeout=0.2)
+            except asyncio.TimeoutError:
+                pass
+    yield
+    await listener.stop()
+
+
+async def test_reset_password_script_notifies_the_workers(db, client, long_ttl, invalidation_listener, monkeypatch):
+    worker = await create_user("worker@example.com")
+    headers = await auth_headers(worker)
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+    answers = iter(["worker@example.com", "y"])
+    monkeypatch.setattr("builtins.input", lambda _prompt: next(answers))
+    monkeypatch.setattr(reset_password.getpass, "getpass", lambda _prompt: "n3w-passw0rd")
+
+    await reset_password.reset_password()
+
+    # El NOTIFY llega por la conexión LISTEN después del commit del script
+    deadline = time.monotonic() + 5
+    while auth_cache.get(_token(headers)) is not None and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    assert auth_cache.get(_token(headers)) is None
+    async with db() as session:
+        hashed = (await session.execute(
+            text('SELECT hashed_password FROM "user" WHERE id = :id'), {"id": worker.id}
+        )).scalar_one()
+    assert hashed.startswith("$argon2")
+
+
+@pytest.mark.benchmark
+async def test_authenticated_request_throughput(db, monkeypatch):
+    user = await create_user("worker@example.com")
+    headers = await auth_headers(user)
+    requests = 500
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        for name, ttl in (("no cache", 0), ("auth cache", 3600)):
+            monkeypatch.setattr(auth_cache, "ttl_seconds", ttl)
+            auth_cache.clear()
+            (await http.get("/users/me", headers=headers)).raise_for_status()  # warm-up
+            started = time.perf_counter()
+            for _ in range(requests):
+                (await http.get("/users/me", headers=headers)).raise_for_status()
+            results[name] = requests / (time.perf_counter() - started)
+            print(f"\nGET /users/me, {name}: {results[name]:.0f} req/s")
+    print(f"speedup: {results['auth cache'] / results['no cache']:.2f}x")
+    assert results["auth cache"] > results["no cache"]
@@ -0,0 +1,221 @@
+"""
+POST /marks/bulk (app/marks/bulk.py): todo o nada con resultado por operación, revalidación
+de clock outs contra el lote aplicado en memoria, PO tomado del nuevo clock in de referencia
+y 409 en periodos de nómina cerrados.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+# Turnos del usuario: lunes a miércoles, cada uno con su PO, y el lunes siguiente
+SHIFTS = [
+    ((datetime(2026, 10, 5, 14), datetime(2026, 10, 5, 22)), "PO-1"),
+    ((datetime(2026, 10, 6, 14), datetime(2026, 10, 6, 22)), "PO-2"),
+    ((datetime(2026, 10, 7, 14), datetime(2026, 10, 7, 22)), "PO-3"),
+    ((datetime(2026, 10, 12, 14), datetime(2026, 10, 12, 22)), "PO-4"),
+]
+
+
+@pytest.fixture
+async def shifts(db):
+    """(marcas del worker en orden [in, out, in, out, ...], marcas de otro worker, headers de admin)."""
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    admin = await create_user("admin@example.com", superuser=True)
+    worker = await create_user("worker@example.com")
+    other = await create_user("other@example.com")
+    marks = []
+    for pair, po_number in SHIFTS:
+        marks += await create_marks(worker.id, [pair], po_number=po_number)
+    other_marks = await create_marks(other.id, [(datetime(2026, 10, 5, 15), datetime(2026, 10, 5, 23))], "PO-9")
+    return marks, other_marks, await auth_headers(admin)
+
+
+async def _stored(db) -> list[tuple]:
+    async with db() as session:
+        result = await session.execute(text(
+            "SELECT id, mark_type, timestamp, address, po_number FROM marks ORDER BY id"
+        ))
+        return [tuple(row) for row in result]
+
+
+async def _versions(db) -> dict[int, int]:
+    async with db() as session:
+        return dict((await session.execute(text("SELECT user_id, version FROM mark_versions"))).all())
+
+
+async def test_batch_is_applied_in_one_transaction(db, client, shifts):
+    marks, other_marks, headers = shifts
+
+    response = await client.post("/marks/bulk", json={"operations": [
+        {"op": "update", "mark_id": marks[0].id, "address": "Bodega 4"},
+        {"op": "update", "mark_id": marks[3].id, "timestamp": "2026-10-06T21:00:00"},
+        {"op": "delete", "mark_id": other_marks[1].id},
+    ]}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["applied"] == 3
+    assert [(item["status"], item["status_code"]) for item in body["results"]] == [("ok", 200)] * 3
+    assert body["results"][0]["mark"]["address"] == "Bodega 4"
+    assert body["results"][1]["mark"]["timestamp"] == "2026-10-06T21:00:00"
+    assert body["results"][2]["mark"] is None
+    stored = {row[0]: row for row in await _stored(db)}
+    assert stored[marks[0].id][3] == "Bodega 4"
+    assert stored[marks[3].id][2] == datetime(2026, 10, 6, 21)
+    assert other_marks[1].id not in stored
+    # Una versión nueva por usuario afectado, aunque tenga varias operaciones
+    assert await _versions(db) == {marks[0].user_id: 1, other_marks[0].user_id: 1}
+
+
+async def test_any_failure_rejects_the_whole_batch_with_per_item_results(db, client, shifts):
+    marks, other_marks, headers = shifts
+    before = await _stored(db)
+
+    response = await client.post("/marks/bulk", json={"operations": [
+        {"op": "update", "mark_id": marks[0].id, "address": "Bodega 4"},
+        {"op": "delete", "mark_id": 999999},
+        {"op": "delete", "mark_id": other_marks[1].id},
+        {"op": "update", "mark_id": other_marks[1].id, "address": "Twice"},
+        {"op": "update", "mark_id": marks[1].id, "po_number": "PO-X"},
+    ]}, headers=headers)
+
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["message"] == "No changes were applied"
+    assert [
+        (item["index"], item["mark_id"], item["status"], item["status_code"], item["detail"])
+        for item in detail["results"]
+    ] == [
+        (0, marks[0].id, "ok", 200, None),
+        (1, 999999, "error", 404, "Mark not found"),
+        (2, other_marks[1].id, "ok", 200, None),
+        (3, other_marks[1].id, "error", 400, "Mark appears more than once in the batch."),
+        (4, marks[1].id, "error", 400, "Clock out PO number must match its clock in and cannot be modified."),
+    ]
+    assert await _stored(db) == before
+    assert await _versions(db) == {}
+
+
+@pytest.mark.parametrize("operations, error", [
+    # La salida del lunes cruza la entrada del martes: queda en el intervalo del martes,
+    # que ya tiene salida
+    (lambda m: [{"op": "update", "mark_id": m[1].id, "timestamp": "2026-10-06T15:00:00"}],
+     "There is already a clock out registered for that interval."),
+    # La salida del martes movida hacia atrás, al lunes, que ya tiene la suya
+    (lambda m: [{"op": "update", "mark_id": m[3].id, "timestamp": "2026-10-05T23:00:00"}],
+     "There is already a clock out registered for that interval."),
+    # La salida del lunes movida antes de su entrada
+    (lambda m: [{"op": "update", "mark_id": m[1].id, "timestamp": "2026-10-05T13:00:00"}],
+     "Clock out requires an earlier clock in."),
+])
+async def test_moved_clock_outs_are_revalidated(db, client, shifts, operations, error):
+    marks, _, headers = shifts
+
+    response = await client.post("/marks/bulk", json={"operations": operations(marks)}, headers=headers)
+
+    assert response.status_code == 400
+    [result] = response.json()["detail"]["results"]
+    assert (result["status_code"], result["detail"]) == (400, error)
+
+
+async def test_revalidation_sees_the_rest_of_the_batch(db, client, shifts):
+    marks, _, headers = shifts
+
+    response = await client.post("/marks/bulk", json={"operations": [
+        # Cada salida movida fallaría en un lote propio: la entrada del martes se atrasa y deja
+        # lugar a la salida del lunes, y la salida del martes reemplaza a la del miércoles
+        {"op": "update", "mark_id": marks[1].id, "timestamp": "2026-10-06T15:00:00"},
+        {"op": "update", "mark_id": marks[2].id, "timestamp": "2026-10-06T16:00:00"},
+        {"op": "delete", "mark_id": marks[5].id},
+        {"op": "update", "mark_id": marks[3].id, "timestamp": "2026-10-07T23:00:00"},
+    ]}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    stored = {row[0]: row for row in await _stored(db)}
+    assert stored[marks[1].id][2] == datetime(2026, 10, 6, 15)
+    assert stored[marks[2].id][2] == datetime(2026, 10, 6, 16)
+    assert marks[5].id not in stored
+    # La salida del martes ahora cierra la entrada del miércoles: toma su PO
+    assert (stored[marks[3].id][2], stored[marks[3].id][4]) == (datetime(2026, 10, 7, 23), "PO-3")
+    assert response.json()["results"][3]["mark"]["po_number"] == "PO-3"
+
+
+async def test_moved_clock_out_takes_the_po_of_its_new_clock_in(db, client, shifts):
+    marks, _, headers = shifts
+
+    # La salida del martes pasa al lunes en lugar de la salida del lunes
+    response = await client.post("/marks/bulk", json={"operations": [
+        {"op": "delete", "mark_id": marks[1].id},
+        {"op": "update", "mark_id": marks[3].id, "timestamp": "2026-10-05T23:00:00"},
+    ]}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["results"][1]["mark"]["po_number"] == "PO-1"
+    stored = {row[0]: row for row in await _stored(db)}
+    assert stored[marks[3].id][2] == datetime(2026, 10, 5, 23)
+    assert stored[marks[3].id][4] == "PO-1"
+
+
+async def test_closed_payroll_period_rejects_the_batch_with_409_items(db, client, shifts):
+    marks, _, headers = shifts
+    closed = await client.post(
+        "/marks/payroll-periods/close", json={"start_date": "2026-10-03", "end_date": "2026-10-09"}, headers=headers
+    )
+    assert closed.status_code == 200, closed.text
+    before = await _stored(db)
+
+    response = await client.post("/marks/bulk", json={"operations": [
+        {"op": "update", "mark_id": marks[0].id, "address": "Bodega 4"},
+        {"op": "delete", "mark_id": marks[5].id},
+        # Del lunes 12 (abierto) hacia el periodo cerrado
+        {"op": "update", "mark_id": marks[6].id, "timestamp": "2026-10-08T14:00:00"},
+        {"op": "update", "mark_id": marks[7].id, "address": "Bodega 4"},
+    ]}, headers=headers)
+
+    assert response.status_code == 400
+    closed_detail = "Payroll period 2026-10-03 to 2026-10-09 is closed. Reopen it to modify its marks."
+    assert [(item["status_code"], item["detail"]) for item in response.json()["detail"]["results"]] == [
+        (409, closed_detail), (409, closed_detail), (409, closed_detail), (200, None),
+    ]
+    assert await _stored(db) == before
+
+
+async def test_statements_do_not_grow_with_the_batch(db, client, shifts):
+    marks, other_marks, headers = shifts
+    operations = []
+    # Diez usuarios más: a cada uno se le mueve la salida y se le borra un turno
+    for i in range(10):
+        user = await create_user(f"crew{i}@example.com")
+        crew_marks = await create_marks(user.id, [
+            (datetime(2026, 10, 13, 14), datetime(2026, 10, 13, 22)),
+            (datetime(2026, 10, 14, 14), datetime(2026, 10, 14, 22)),
+        ])
+        operations += [
+            {"op": "update", "mark_id": crew_marks[1].id, "timestamp": "2026-10-13T21:30:00"},
+            {"op": "delete", "mark_id": crew_marks[2].id},
+            {"op": "delete", "mark_id": crew_marks[3].id},
+        ]
+
+    # El fixture `client` falla si se pasa del presupuesto de la ruta
+    response = await client.post("/marks/bulk", json={"operations": operations}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["applied"] == 30
+    assert len(await _versions(db)) == 10
+
+
+async def test_move_to_a_month_without_partition_fails_the_item(db, client, shifts):
+    marks, _, headers = shifts
+
+    response = await client.post("/marks/bulk", json={"operations": [
+        {"op": "update", "mark_id": marks[6].id, "timestamp": "2031-01-05T14:00:00"},
+        {"op": "update", "mark_id": marks[0].id, "address": "Bodega 4"},
+    ]}, headers=headers)
+
+    assert response.status_code == 400
+    assert [(item["status_code"], item["detail"]) for item in response.json()["detail"]["results"]] == [
+        (400, "Marks for 2031-01 cannot be stored: that month has no partition"), (200, None),
+    ]
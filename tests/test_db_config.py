@@ -0,0 +1,49 @@
+"""Validación de la configuración del pool y de la conexión directa (PgBouncer)."""
+import pytest
+
+from app.db import postgres_connector
+from app.db.postgres_connector import connection_budget, direct_database_url
+
+env = postgres_connector.env
+
+
+@pytest.mark.parametrize("pool_size", [0, -1])
+def test_pool_size_must_be_positive_without_pgbouncer(monkeypatch, pool_size):
+    monkeypatch.setattr(env, "DB_PGBOUNCER_TRANSACTION_MODE", False)
+    monkeypatch.setattr(env, "DB_POOL_SIZE", pool_size)
+
+    with pytest.raises(RuntimeError, match="DB_POOL_SIZE"):
+        connection_budget()
+
+
+def test_pool_size_zero_allowed_with_pgbouncer(monkeypatch):
+    monkeypatch.setattr(env, "DB_PGBOUNCER_TRANSACTION_MODE", True)
+    monkeypatch.setattr(env, "DB_POOL_SIZE", 0)
+    monkeypatch.setattr(env, "DB_CLUSTER_MAX_CONNECTIONS", None)
+
+    assert connection_budget() == (0, env.DB_MAX_OVERFLOW)
+
+
+def test_negative_overflow_is_rejected(monkeypatch):
+    monkeypatch.setattr(env, "DB_MAX_OVERFLOW", -1)
+
+    with pytest.raises(RuntimeError, match="DB_MAX_OVERFLOW"):
+        connection_budget()
+
+
+def test_pgbouncer_mode_requires_direct_url(monkeypatch):
+    monkeypatch.setattr(env, "DB_PGBOUNCER_TRANSACTION_MODE", True)
+    monkeypatch.setattr(env, "POSTGRES_DIRECT_URL", None)
+
+    with pytest.raises(RuntimeError, match="POSTGRES_DIRECT_URL"):
+        direct_database_url()
+
+    monkeypatch.setattr(env, "POSTGRES_DIRECT_URL", "postgresql://direct-host:5432/db")
+    assert direct_database_url() == "postgresql://direct-host:5432/db"
+
+
+def test_direct_url_defaults_to_database_url(monkeypatch):
+    monkeypatch.setattr(env, "DB_PGBOUNCER_TRANSACTION_MODE", False)
+    monkeypatch.setattr(env, "POSTGRES_DIRECT_URL", None)
+
+    assert direct_database_url() == env.POSTGRES_DATABASE_URL
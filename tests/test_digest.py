@@ -0,0 +1,81 @@
+"""Digest semanal por email contra un SMTP local (tests/smtp.py)."""
+from datetime import datetime
+from email.message import EmailMessage
+
+import pytest
+
+from app.marks import digest
+from app.marks.digest import send_messages, send_weekly_digests
+from tests.smtp import SmtpStandIn
+from tests.utils import create_marks, create_user, ensure_partitions
+
+START, END = datetime(2026, 10, 3), datetime(2026, 10, 9, 23, 59, 59, 999999)
+SHIFT = [(datetime(2026, 10, 5, 14), datetime(2026, 10, 5, 22))]
+
+
+@pytest.fixture
+async def smtp(monkeypatch):
+    """Servidor SMTP local; devuelve una función que lo arranca con sus opciones."""
+    servers = []
+
+    async def start(**options) -> SmtpStandIn:
+        server = SmtpStandIn(**options)
+        port = await server.start()
+        servers.append(server)
+        monkeypatch.setattr(digest.env, "SMTP_HOST", "127.0.0.1")
+        monkeypatch.setattr(digest.env, "SMTP_PORT", port)
+        return server
+
+    yield start
+    for server in servers:
+        await server.stop()
+
+
+def _text(message: EmailMessage) -> str:
+    return message.get_body(("plain",)).get_content()
+
+
+async def test_weekly_digests_are_sent_over_reused_connections(db, smtp, monkeypatch):
+    server = await smtp()
+    monkeypatch.setattr(digest.env, "DIGEST_SMTP_CONNECTIONS", 2)
+    monkeypatch.setattr(digest.env, "DIGEST_ADMIN_EMAILS", "boss@example.com")
+    await ensure_partitions(START, END)
+    ana = await create_user("ana@example.com", first_name="Ana", last_name="López")
+    luis = await create_user("luis@example.com")
+    inactive = await create_user("former@example.com", is_active=False)
+    await create_user("idle@example.com")
+    for user in (ana, luis, inactive):
+        await create_marks(user.id, SHIFT)
+
+    async with db() as session:
+        summary = await send_weekly_digests(session, START, END, timezone_offset_minutes=360)
+
+    assert (summary["messages"], summary["sent"], summary["failed"]) == (3, 3, [])
+    assert server.connections == 2
+    received = {message["To"]: message for message in server.messages}
+    assert set(received) == {"ana@example.com", "luis@example.com", "boss@example.com"}
+    assert received["ana@example.com"]["Subject"] == "Weekly hours 2026-10-03 to 2026-10-09: 8.00 h"
+    # Horas en local (offset 360): 14:00-22:00 UTC = 08:00-16:00
+    assert "Hi Ana López," in _text(received["ana@example.com"])
+    assert "2026-10-05 | 08:00 | 16:00 | PO-1 | 8.00" in _text(received["ana@example.com"])
+    assert "luis@example.com | 8.00" in _text(received["boss@example.com"])
+
+
+async def test_transient_errors_are_retried_and_rejections_are_not(smtp, monkeypatch):
+    server = await smtp(reject=("bounce@example.com",), drop_first_data=True)
+    monkeypatch.setattr(digest, "RETRY_BASE_SECONDS", 0)
+    messages = []
+    for to_address in ("ana@example.com", "bounce@example.com", "luis@example.com"):
+        message = EmailMessage()
+        message["From"], message["To"], message["Subject"] = "reports@localhost", to_address, "Weekly hours"
+        message.set_content("8.00 h")
+        messages.append(message)
+
+    stats = await send_messages(messages, connections=1)
+
+    assert stats["sent"] == 2
+    assert stats["retries"] == 1
+    assert [failure["to"] for failure in stats["failed"]] == ["bounce@example.com"]
+    assert [message["To"] for message in server.messages] == ["ana@example.com", "luis@example.com"]
+    # La conexión cortada se reabrió una vez; el resto reutilizó la misma
+    assert server.connections == 2
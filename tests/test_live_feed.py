@@ -0,0 +1,108 @@
+"""
+Feed en vivo (/marks/live) con cientos de clientes SSE: servidor uvicorn real, LISTEN
+sobre la base de pruebas y una marca nueva que debe llegar a todos los streams.
+"""
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import pytest
+import uvicorn
+from sqlalchemy import text
+
+from app.db.notifications import PgListener, asyncpg_dsn
+from app.marks.events import MARK_EVENTS_CHANNEL, MarkEventHub, mark_event_hub
+from main import app
+from tests.utils import auth_headers, create_user
+
+SUBSCRIBERS = 300
+READY_CHANNEL = "live_feed_test_ready"
+CLOCK_IN = {"mark_type": "clock_in", "latitude": 19.43, "longitude": -99.13, "po_number": "PO-1"}
+
+
+@pytest.fixture
+async def live_server(db):
+    """uvicorn en un puerto libre con el listener del worker conectado; devuelve la URL base."""
+    ready = asyncio.Event()
+    listener = PgListener(asyncpg_dsn(os.environ["POSTGRES_DATABASE_URL"]), reconnect_delay=0.1)
+    listener.subscribe(MARK_EVENTS_CHANNEL, mark_event_hub.dispatch)
+    listener.subscribe(READY_CHANNEL, lambda _payload: ready.set())
+    listener.start()
+
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=0, lifespan="off", log_level="warning", backlog=SUBSCRIBERS * 2,
+    ))
+    serving = asyncio.create_task(server.serve())
+    async with db() as session:
+        # Esperar a que el LISTEN esté activo (NOTIFY de prueba hasta que llegue)
+        while not ready.is_set():
+            await session.execute(text(f"NOTIFY {READY_CHANNEL}"))
+            await session.commit()
+            try:
+                await asyncio.wait_for(ready.wait(), timeout=0.2)
+            except asyncio.TimeoutError:
+                pass
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    yield f"http://127.0.0.1:{port}"
+
+    mark_event_hub.close_all()
+    server.should_exit = True
+    await serving
+    await listener.stop()
+
+
+async def _first_mark_event(http: httpx.AsyncClient, headers: dict, received: list) -> None:
+    async with http.stream("GET", "/marks/live", headers=headers) as response:
+        assert response.status_code == 200
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "mark":
+                received.append((json.loads(line[len("data: "):]), time.perf_counter()))
+                return
+
+
+async def test_hundreds_of_subscribers_receive_each_event(live_server):
+    admin = await create_user("admin@example.com", superuser=True)
+    headers = await auth_headers(admin)
+    received: list = []
+    limits = httpx.Limits(max_connections=SUBSCRIBERS + 10, max_keepalive_connections=0)
+
+    async with httpx.AsyncClient(base_url=live_server, limits=limits, timeout=30) as http:
+        streams = [asyncio.create_task(_first_mark_event(http, headers, received)) for _ in range(SUBSCRIBERS)]
+        while len(mark_event_hub) < SUBSCRIBERS:
+            assert not any(stream.done() for stream in streams), [s.exception() for s in streams if s.done()]
+            await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        response = await http.post("/marks/clock-in", json=CLOCK_IN, headers=headers)
+        assert response.status_code == 200
+        await asyncio.wait_for(asyncio.gather(*streams), timeout=10)
+
+    assert len(received) == SUBSCRIBERS
+    assert {payload["mark"]["id"] for payload, _ in received} == {response.json()["id"]}
+    assert {payload["event"] for payload, _ in received} == {"created"}
+    last = max(at for _, at in received)
+    print(f"\n{SUBSCRIBERS} subscribers: all received the event {(last - started) * 1000:.0f} ms after the request")
+    assert mark_event_hub.dropped_total == 0
+
+
+async def test_slow_subscriber_is_dropped_without_delaying_others():
+    hub = MarkEventHub(buffer_size=2, max_subscribers=SUBSCRIBERS)
+    subscribers = [hub.subscribe() for _ in range(SUBSCRIBERS)]
+    slow, fast = subscribers[0], subscribers[1:]
+
+    for n in range(3):
+        hub.dispatch(json.dumps({"n": n}))
+        for subscriber in fast:
+            assert subscriber.queue.get_nowait() is not None
+
+    assert slow.dropped and slow.queue.get_nowait() is None
+    assert len(hub) == SUBSCRIBERS - 1
+    assert hub.subscribe() is not None
@@ -0,0 +1,221 @@
+"""
+Logging (app/core/logging_config.py): X-Request-ID de RequestIdMiddleware en la respuesta
+y en los registros JSON, muestreo de app.marks.geocoding y latencia de loguear desde el
+event loop con el handler directo anterior frente a QueueHandler/QueueListener.
+"""
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueListener
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.core.logging_config import (
+    GEOCODING_LOGGER,
+    REQUEST_ID_HEADER,
+    JsonFormatter,
+    RequestIdMiddleware,
+    RequestQueueHandler,
+    SampleFilter,
+)
+
+
+class ListHandler(logging.Handler):
+    """Guarda las líneas ya formateadas (lo que el listener escribiría a stdout)."""
+
+    def __init__(self):
+        super().__init__()
+        self.lines: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
+
+
+@pytest.fixture
+def json_records():
+    """Logger de prueba con la misma cadena que setup_logging: cola, listener y JsonFormatter."""
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    output = ListHandler()
+    output.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, output)
+    listener.start()
+
+    test_logger = logging.getLogger("tests.logging")
+    test_logger.addHandler(RequestQueueHandler(log_queue))
+    test_logger.setLevel(logging.INFO)
+    test_logger.propagate = False
+
+    def records() -> list[dict]:
+        listener.stop()  # vacía la cola
+        return [json.loads(line) for line in output.lines]
+
+    yield test_logger, records
+    test_logger.handlers.clear()
+    if listener._thread is not None:
+        listener.stop()
+
+
+def _app(test_logger: logging.Logger) -> RequestIdMiddleware:
+    inner = FastAPI()
+
+    @inner.get("/ping")
+    async def ping():
+        test_logger.info("ping %s", "handled")
+        return {"ok": True}
+
+    return RequestIdMiddleware(inner)
+
+
+async def test_request_id_is_echoed_and_stamped_on_json_records(json_records):
+    test_logger, records = json_records
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app(test_logger)), base_url="http://test") as http:
+        echoed = await http.get("/ping", headers={REQUEST_ID_HEADER: "client-id-123"})
+        generated = await http.get("/ping")
+    test_logger.info("outside a request")
+
+    assert echoed.headers[REQUEST_ID_HEADER] == "client-id-123"
+    generated_id = generated.headers[REQUEST_ID_HEADER]
+    assert len(generated_id) == 32 and generated_id != "client-id-123"
+
+    lines = records()
+    assert [(line["message"], line["request_id"]) for line in lines] == [
+        ("ping handled", "client-id-123"),
+        ("ping handled", generated_id),
+        ("outside a request", "-"),
+    ]
+    assert lines[0]["logger"] == "tests.logging" and lines[0]["level"] == "INFO"
+
+
+async def test_request_id_from_the_client_is_truncated(json_records):
+    test_logger, _ = json_records
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app(test_logger)), base_url="http://test") as http:
+        response = await http.get("/ping", headers={REQUEST_ID_HEADER: "x" * 200})
+
+    assert response.headers[REQUEST_ID_HEADER] == "x" * 64
+
+
+def test_geocoding_logger_keeps_one_in_n_and_every_error():
+    geocoding_logger = logging.getLogger(GEOCODING_LOGGER)
+    output = ListHandler()
+    # setup_logging (al importar main) ya instaló el filtro con LOG_GEOCODING_SAMPLE_EVERY
+    previous_filters = geocoding_logger.filters
+    geocoding_logger.filters = [SampleFilter(every=5)]
+    geocoding_logger.addHandler(output)
+    previous_level, previous_propagate = geocoding_logger.level, geocoding_logger.propagate
+    geocoding_logger.setLevel(logging.INFO)
+    geocoding_logger.propagate = False
+    try:
+        for i in range(20):
+            geocoding_logger.info("geocoded mark %s", i)
+        for i in range(3):
+            geocoding_logger.error("geocoding failed for mark %s", i)
+    finally:
+        geocoding_logger.filters = previous_filters
+        geocoding_logger.removeHandler(output)
+        geocoding_logger.setLevel(previous_level)
+        geocoding_logger.propagate = previous_propagate
+
+    assert output.lines == [f"geocoded mark {i}" for i in (0, 5, 10, 15)] + [
+        f"geocoding failed for mark {i}" for i in range(3)
+    ]
+
+
+class SlowStream(io.TextIOBase):
+    """stdout con un consumidor lento (pipe lleno de Docker o del colector de logs)."""
+
+    def __init__(self, delay_seconds: float):
+        self.delay_seconds = delay_seconds
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay_seconds)
+        return len(text)
+
+
+def _pipe_stream() -> io.TextIOBase:
+    """stdout a un pipe que otro hilo vacía (el caso normal)."""
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, "rb") as reader:
+            while reader.read(65536):
+                pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(write_fd, "w", buffering=1)
+
+
+def _old_handler(stream) -> tuple[logging.Handler, None]:
+    """Como era setup_logging antes: StreamHandler síncrono con formato de texto."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(
+        fmt='%(asctime)s | %(levelname)-8s | %(name)s:%(lineno)d | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+    return handler, None
+
+
+def _queue_handler(stream) -> tuple[logging.Handler, QueueListener]:
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, console_handler)
+    listener.start()
+    return RequestQueueHandler(log_queue), listener
+
+
+def _call_latencies(handler: logging.Handler, calls: int) -> list[float]:
+    """Segundos que cada logger.info bloquea al que loguea (el event loop en la app)."""
+    bench_logger = logging.getLogger("tests.logging.benchmark")
+    bench_logger.handlers = [handler]
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    samples = []
+    try:
+        for i in range(calls):
+            started = time.perf_counter()
+            bench_logger.info("geocoded mark %s at %s, %s", i, 19.4326, -99.1332)
+            samples.append(time.perf_counter() - started)
+            if i % 10 == 0:
+                time.sleep(0.001)  # entre requests el listener alcanza a vaciar la cola
+    finally:
+        bench_logger.handlers = []
+    return samples
+
+
+def _percentile_us(samples: list[float], percentile: float) -> float:
+    return sorted(samples)[int(len(samples) * percentile) - 1] * 1e6
+
+
+@pytest.mark.benchmark
+def test_queue_handler_latency_against_the_old_stream_handler():
+    calls = 2000
+    results = {}
+    for sink_name, make_stream in (("pipe", _pipe_stream), ("slow sink, 200 us per write", lambda: SlowStream(0.0002))):
+        for handler_name, make_handler in (("old StreamHandler", _old_handler), ("QueueHandler", _queue_handler)):
+            stream = make_stream()
+            handler, listener = make_handler(stream)
+            try:
+                _call_latencies(handler, 100)  # warm-up
+                samples = _call_latencies(handler, calls)
+            finally:
+                if listener is not None:
+                    listener.stop()
+                handler.close()
+                stream.close()
+            results[(sink_name, handler_name)] = samples
+            print(
+                f"\n{sink_name}, {handler_name}: mean {sum(samples) / len(samples) * 1e6:.1f} us, "
+                f"p50 {_percentile_us(samples, 0.5):.1f} us, p99 {_percentile_us(samples, 0.99):.1f} us",
+                end="",
+            )
+    print()
+
+    # Con un stdout lento el handler directo bloquea cada write; la cola no
+    slow = "slow sink, 200 us per write"
+    assert _percentile_us(results[(slow, "QueueHandler")], 0.5) < _percentile_us(results[(slow, "old StreamHandler")], 0.5) / 4
@@ -0,0 +1,100 @@
+"""/metrics (apagado por defecto, Bearer METRICS_TOKEN) y el costo de la instrumentación en el hot path."""
+import os
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import main
+from app.core.metrics import MetricsMiddleware
+from app.db.instrumentation import InstrumentedAsyncAdaptedQueuePool, instrument_engine
+from app.db.postgres_connector import clean_postgres_url
+
+
+async def test_metrics_route_is_off_by_default(client):
+    assert (await client.get("/metrics")).status_code == 404
+
+
+async def test_metrics_token_is_required_when_configured(monkeypatch):
+    monkeypatch.setattr(main.env, "METRICS_TOKEN", "scrape-secret")
+    metrics_app = FastAPI()
+    metrics_app.add_api_route("/metrics", main.metrics, methods=["GET"])
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=metrics_app), base_url="http://test") as http:
+        anonymous = await http.get("/metrics")
+        wrong = await http.get("/metrics", headers={"Authorization": "Bearer guess"})
+        scraper = await http.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+
+    assert anonymous.status_code == wrong.status_code == 401
+    assert scraper.status_code == 200
+    assert "# TYPE http_request_duration_seconds histogram" in scraper.text
+
+
+async def _noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _asgi_seconds(app, requests: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/health", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(scope, receive, send)
+    return time.perf_counter() - started
+
+
+async def _statement_seconds(engine, statements: int) -> float:
+    async with engine.connect() as conn:  # warm-up: abrir la conexión del pool
+        await conn.execute(text("SELECT 1"))
+    # CPU de este proceso: excluye el trabajo de Postgres y la espera de red
+    started = time.process_time()
+    for _ in range(statements):
+        # Un checkout y un statement por iteración, como una consulta corta de un request
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    return time.process_time() - started
+
+
+@pytest.mark.benchmark
+async def test_instrumentation_overhead(migrated_db):
+    requests, statements, rounds = 20000, 400, 5
+
+    bare, wrapped = await _asgi_seconds(_noop_app, requests), await _asgi_seconds(MetricsMiddleware(_noop_app), requests)
+    middleware_us = (wrapped - bare) / requests * 1e6
+    print(f"\nMetricsMiddleware: {middleware_us:.1f} us per request")
+
+    url = clean_postgres_url(os.environ["POSTGRES_DATABASE_URL"])
+    plain = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, pool_size=1)
+    instrumented = create_async_engine(
+        url, poolclass=InstrumentedAsyncAdaptedQueuePool, pool_size=1, pool_logging_name="benchmark"
+    )
+    instrument_engine(instrumented, "benchmark")
+    try:
+        # Rondas alternadas y la mejor de cada engine
+        results = {"plain": float("inf"), "instrumented": float("inf")}
+        for _ in range(rounds):
+            for name, engine in (("plain", plain), ("instrumented", instrumented)):
+                per_statement = await _statement_seconds(engine, statements) / statements * 1e6
+                results[name] = min(results[name], per_statement)
+        for name, per_statement in results.items():
+            print(f"checkout + SELECT 1, {name} engine: {per_statement:.0f} us of CPU")
+    finally:
+        await plain.dispose()
+        await instrumented.dispose()
+    statement_us = results["instrumented"] - results["plain"]
+    print(f"pool and cursor events: {statement_us:.1f} us per checkout + statement")
+
+    # Microsegundos frente a los milisegundos de un request con SQL
+    assert middleware_us < 100
+    assert statement_us < 100
@@ -0,0 +1,186 @@
+"""
+Particiones mensuales: los requests no crean particiones (solo el mantenimiento), y el
+benchmark de varios años de marcas (poda, tiempos e índices frente a una tabla sin particionar).
+"""
+import re
+import statistics
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.marks import partitions, queries
+from app.marks.partitions import ensure_future_partitions
+from tests.utils import auth_headers, create_marks, create_user, explain_sql, seed_workforce, walk_plan
+
+MISSING = "2020-01-15T12:00:00"
+
+
+def _mark(user_id: int, timestamp: str) -> dict:
+    return {
+        "user_id": user_id, "mark_type": "clock_in", "timestamp": timestamp,
+        "latitude": 19.43, "longitude": -99.13, "po_number": "PO-1",
+    }
+
+
+async def _partition_exists(db, name: str) -> bool:
+    async with db() as session:
+        return (await session.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar_one()
+
+
+async def test_create_in_month_without_partition_fails_fast(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+
+    response = await client.post("/marks/create", json=_mark(admin.id, MISSING), headers=await auth_headers(admin))
+
+    assert response.status_code == 400
+    assert "2020-01" in response.json()["detail"]
+    assert not await _partition_exists(db, "marks_2020_01")
+    assert (2020, 1) not in partitions._known_months
+
+
+async def test_create_in_existing_month(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+
+    response = await client.post(
+        "/marks/create", json=_mark(admin.id, "2026-10-12T14:00:00"), headers=await auth_headers(admin)
+    )
+
+    assert response.status_code == 200
+    assert (2026, 10) in partitions._known_months
+
+
+async def test_update_to_month_without_partition_keeps_mark(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+    await create_marks(admin.id, [(datetime(2026, 10, 12, 14), datetime(2026, 10, 12, 22))])
+    headers = await auth_headers(admin)
+
+    response = await client.put("/marks/1", json={"timestamp": MISSING}, headers=headers)
+
+    assert response.status_code == 400
+    assert not await _partition_exists(db, "marks_2020_01")
+    async with db() as session:
+        timestamp = (await session.execute(text("SELECT timestamp FROM marks WHERE id = 1"))).scalar_one()
+    assert timestamp == datetime(2026, 10, 12, 14)
+
+
+async def test_bulk_move_to_month_without_partition_is_an_item_error(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+    await create_marks(admin.id, [(datetime(2026, 10, 12, 14), datetime(2026, 10, 12, 22))])
+
+    response = await client.post("/marks/bulk", json={"operations": [
+        {"op": "update", "mark_id": 1, "timestamp": MISSING},
+        {"op": "update", "mark_id": 2, "po_number": "PO-1"},
+    ]}, headers=await auth_headers(admin))
+
+    assert response.status_code == 400
+    results = response.json()["detail"]["results"]
+    assert results[0]["status_code"] == 400 and "2020-01" in results[0]["detail"]
+    assert not await _partition_exists(db, "marks_2020_01")
+
+
+async def test_maintenance_creates_months_ahead(db, monkeypatch):
+    monkeypatch.setattr(partitions, "_known_months", set())
+
+    await ensure_future_partitions(months_ahead=5)
+
+    month = datetime.utcnow().replace(day=1)
+    for _ in range(6):
+        assert await _partition_exists(db, f"marks_{month:%Y_%m}")
+        assert (month.year, month.month) in partitions._known_months
+        month = partitions._add_months(month, 1)
+
+
+# Índices padre de marks y la suma del tamaño de sus índices de partición
+PARTITIONED_INDEX_SIZES = text("""
+    SELECT p.relname, sum(pg_relation_size(i.inhrelid))
+    FROM pg_inherits i
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relkind = 'I' AND p.relname IN (SELECT indexname FROM pg_indexes WHERE tablename = 'marks')
+    GROUP BY p.relname
+""")
+MARKS_PARTITIONS = text("""
+    SELECT count(*), sum(pg_relation_size(inhrelid)) FROM pg_inherits WHERE inhparent = 'marks'::regclass
+""")
+
+
+async def _median_ms(client, path: str, params: dict, headers: dict, repeat: int = 10) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return statistics.median(samples) * 1000
+
+
+@pytest.mark.benchmark
+async def test_partitioned_marks_over_several_years(db, client):
+    users, start, end = 100, datetime(2023, 10, 1), datetime(2026, 9, 30)
+    await seed_workforce(users, start, end)
+    admin = await create_user("admin@example.com", superuser=True)
+    headers = await auth_headers(admin)
+    week = {"start": datetime(2026, 9, 14), "end": datetime(2026, 9, 20, 23, 59, 59)}
+
+    async with db() as session:
+        partition_count, heap_bytes = (await session.execute(MARKS_PARTITIONS)).one()
+        pruning = {}
+        for name, statement, params in (
+            ("weekly-report", queries.user_range_query(("id", "timestamp")), {"user_id": 7, **week}),
+            ("summary-report", queries.ALL_USERS_RANGE, week),
+            ("my-marks", queries.user_marks_query(("id", "timestamp")), {"user_id": 7, "limit": 100}),
+        ):
+            plan = (await session.execute(text(explain_sql(statement, params, analyze=True)))).scalar_one()[0]["Plan"]
+            # Las particiones podadas al planificar no aparecen en el plan; de las que
+            # aparecen, el Append ordenado con LIMIT deja sin ejecutar las que no alcanza
+            nodes = [node for node in walk_plan(plan) if "Relation Name" in node]
+            planned = {node["Relation Name"] for node in nodes}
+            read = {node["Relation Name"] for node in nodes if node.get("Actual Rows", 0) > 0}
+            pruning[name] = (partition_count - len(planned), len(read))
+
+        # Misma tabla e índices sin particionar, cargada igual que marks (índices antes que
+        # las filas, en orden cronológico) para que los tamaños sean comparables
+        await session.execute(text("CREATE TABLE marks_baseline (LIKE marks INCLUDING DEFAULTS)"))
+        try:
+            index_defs = (await session.execute(
+                text("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'marks'")
+            )).all()
+            for name, definition in index_defs:
+                await session.execute(text(re.sub(
+                    r"INDEX \S+ ON (ONLY )?public\.marks ", f"INDEX baseline_{name} ON marks_baseline ", definition
+                )))
+            await session.execute(text("INSERT INTO marks_baseline SELECT * FROM marks ORDER BY timestamp"))
+            baseline_sizes = dict((await session.execute(text("""
+                SELECT substr(indexname, 10), pg_relation_size(('public.' || indexname)::regclass)
+                FROM pg_indexes WHERE tablename = 'marks_baseline'
+            """))).all())
+            baseline_heap = (await session.execute(text("SELECT pg_relation_size('marks_baseline')"))).scalar_one()
+            partitioned_sizes = dict((await session.execute(PARTITIONED_INDEX_SIZES)).all())
+        finally:
+            await session.rollback()
+
+    timings = {
+        "weekly-report": await _median_ms(client, "/marks/weekly-report/7", {"start_date": "2026-09-12", "end_date": "2026-09-18"}, headers),
+        "summary-report": await _median_ms(client, "/marks/summary-report", {"start_date": "2026-09-12", "end_date": "2026-09-18"}, headers),
+        "my-marks": await _median_ms(client, "/marks/user/7", {"limit": 100}, headers),
+        "all": await _median_ms(client, "/marks/all", {"limit": 100}, headers),
+    }
+
+    print(f"\n{users} users x {(end - start).days + 1} days, {partition_count} monthly partitions")
+    for name, (pruned, read) in pruning.items():
+        print(f"{name}: {pruned} of {partition_count} partitions pruned at plan time, rows read from {read}")
+    for name, ms in timings.items():
+        print(f"GET {name}: {ms:.1f} ms (median)")
+    print(f"heap: partitions {heap_bytes / 2**20:.1f} MiB, unpartitioned {baseline_heap / 2**20:.1f} MiB")
+    for name in sorted(partitioned_sizes):
+        print(
+            f"{name}: partitions {partitioned_sizes[name] / 2**20:.2f} MiB, "
+            f"unpartitioned {baseline_sizes[name] / 2**20:.2f} MiB"
+        )
+
+    assert pruning["weekly-report"] == (partition_count - 1, 1)
+    assert pruning["summary-report"] == (partition_count - 1, 1)
+    # 100 marcas del usuario 7 = 50 días: el mes actual y el anterior
+    assert pruning["my-marks"][1] <= 2
+    assert set(partitioned_sizes) == set(baseline_sizes)
@@ -0,0 +1,113 @@
+"""
+Hash de contraseñas fuera del event loop (app/users/password.py): contabilidad de la
+cola de PasswordHashingPool, rehash a Argon2 en el login y clock-ins durante una
+ráfaga de logins.
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+from pwdlib.hashers.bcrypt import BcryptHasher
+from sqlalchemy import text
+
+from app.users.password import PasswordHashingPool, password_pool
+from main import app
+from tests.utils import auth_headers, create_user, ensure_partitions
+
+CLOCK_IN = {"mark_type": "clock_in", "latitude": 19.4326, "longitude": -99.1332, "po_number": "PO-1"}
+
+
+class BlockingHelper:
+    """PasswordHelper de prueba: cada hash espera a que la prueba lo libere."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def hash(self, password: str) -> str:
+        self.release.wait(timeout=5)
+        return f"hashed:{password}"
+
+
+async def test_pool_accounts_for_waiting_and_running_hashes():
+    helper = BlockingHelper()
+    pool = PasswordHashingPool(helper, max_workers=2)
+    try:
+        tasks = [asyncio.create_task(pool.hash(f"password-{i}")) for i in range(5)]
+        await asyncio.sleep(0.2)
+
+        # El semáforo deja correr max_workers; el resto espera en asyncio, no en el executor
+        assert (pool.in_flight, pool.waiting, pool.completed) == (2, 3, 0)
+
+        helper.release.set()
+        hashes = await asyncio.gather(*tasks)
+    finally:
+        pool.shutdown()
+
+    assert hashes == [f"hashed:password-{i}" for i in range(5)]
+    assert (pool.in_flight, pool.waiting, pool.completed) == (0, 0, 5)
+    assert pool.queue_wait_seconds_max >= 0.2
+    assert pool.queue_wait_seconds_total >= 3 * 0.2
+
+
+async def test_login_rehashes_a_legacy_bcrypt_hash_to_argon2(db, client):
+    await create_user("worker@example.com", hashed_password=BcryptHasher().hash("s3cret-pass"))
+    form = {"username": "worker@example.com", "password": "s3cret-pass"}
+
+    first = await client.post("/auth/jwt/login", data=form)
+    async with db() as session:
+        stored = (await session.execute(
+            text('SELECT hashed_password FROM "user" WHERE email = :email'), {"email": "worker@example.com"}
+        )).scalar_one()
+    second = await client.post("/auth/jwt/login", data=form)
+    wrong = await client.post("/auth/jwt/login", data={**form, "password": "not-it"})
+
+    assert first.status_code == 200, first.text
+    assert stored.startswith("$argon2id$")
+    assert "m=65536,t=3,p=4" in stored
+    assert second.status_code == 200
+    assert wrong.status_code == 400
+
+
+def _p95(samples: list[float]) -> float:
+    return sorted(samples)[int(len(samples) * 0.95) - 1]
+
+
+@pytest.mark.benchmark
+async def test_clock_in_latency_during_a_login_storm(db):
+    logins, clock_ins = 16, 40
+    await ensure_partitions(datetime.utcnow(), datetime.utcnow())
+    password = "storm-passw0rd"
+    await create_user("storm@example.com", hashed_password=await password_pool.hash(password))
+    headers = await auth_headers(await create_user("worker@example.com"))
+    form = {"username": "storm@example.com", "password": password}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        async def clock_in_latencies() -> list[float]:
+            samples = []
+            for _ in range(clock_ins):
+                started = time.perf_counter()
+                (await http.post("/marks/clock-in", json=CLOCK_IN, headers=headers)).raise_for_status()
+                samples.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+            return samples
+
+        (await http.post("/marks/clock-in", json=CLOCK_IN, headers=headers)).raise_for_status()  # warm-up
+        idle = await clock_in_latencies()
+
+        started = time.perf_counter()
+        storm = asyncio.gather(*(http.post("/auth/jwt/login", data=form) for _ in range(logins)))
+        during = await clock_in_latencies()
+        responses = await storm
+        storm_seconds = time.perf_counter() - started
+
+    assert all(response.status_code == 200 for response in responses)
+    print(
+        f"\nclock-in p95 idle: {_p95(idle) * 1000:.0f} ms, during {logins} concurrent logins: "
+        f"{_p95(during) * 1000:.0f} ms (logins finished in {storm_seconds:.1f} s, "
+        f"longest hash queue wait {password_pool.queue_wait_seconds_max * 1000:.0f} ms)"
+    )
+    # Las verificaciones esperan en el semáforo del pool, no delante de los clock-ins
+    assert _p95(during) < storm_seconds / 2
@@ -0,0 +1,113 @@
+"""
+Cierre de periodos de nómina con zona IANA: los reportes con ?tz= se sirven del snapshot,
+las ediciones de marcas del periodo cerrado dan 409 y reabrir y volver a cerrar crea una
+versión nueva sin perder la anterior.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+# Semana sábado-viernes en que Chicago pasa a horario de verano (8 de marzo, 2:00 CST)
+WEEK = {"start_date": "2026-03-07", "end_date": "2026-03-13"}
+TZ = "America/Chicago"
+SHIFTS = [
+    (datetime(2026, 3, 7, 14), datetime(2026, 3, 7, 22)),  # 8:00-16:00 CST
+    (datetime(2026, 3, 9, 13), datetime(2026, 3, 9, 21)),  # 8:00-16:00 CDT
+    (datetime(2026, 3, 14, 4), datetime(2026, 3, 14, 4, 30)),  # viernes 23:00-23:30 CDT
+]
+
+
+@pytest.fixture
+async def closed_week(db, client):
+    await ensure_partitions(datetime(2026, 3, 1), datetime(2026, 3, 31))
+    admin = await create_user("admin@example.com", superuser=True)
+    user = await create_user("worker@example.com")
+    marks = await create_marks(user.id, SHIFTS)
+    headers = await auth_headers(admin)
+
+    response = await client.post("/marks/payroll-periods/close", json={**WEEK, "tz": TZ}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["timezone"] == TZ
+    return user, headers, marks, response.json()
+
+
+async def test_tz_reports_are_served_from_snapshot(closed_week, client):
+    user, headers, _, _ = closed_week
+    params = {**WEEK, "tz": TZ}
+
+    weekly = (await client.get(f"/marks/weekly-report/{user.id}", params=params, headers=headers)).json()
+    summary = (await client.get("/marks/summary-report", params=params, headers=headers)).json()
+
+    assert weekly["snapshot_version"] == 1
+    assert weekly["total_hours"] == 16.5
+    assert [day["date"] for day in weekly["daily_reports"]] == ["2026-03-07", "2026-03-09", "2026-03-13"]
+    assert summary["snapshot_version"] == 1
+    assert summary["employees"][-1]["total_hours"] == 16.5
+
+
+async def test_other_zone_for_same_dates_is_recomputed(closed_week, client):
+    user, headers, _, _ = closed_week
+    # Offset fijo de CST: el fin de la semana cae una hora después que en CDT
+    params = {**WEEK, "timezone_offset_minutes": 360}
+
+    weekly = (await client.get(f"/marks/weekly-report/{user.id}", params=params, headers=headers)).json()
+
+    assert weekly.get("snapshot_version") is None
+
+
+CLOSED_DETAIL = "Payroll period 2026-03-07 to 2026-03-13 is closed. Reopen it to modify its marks."
+
+
+@pytest.mark.parametrize("edit", ["update", "move_into", "create", "delete"])
+async def test_edits_inside_a_closed_period_are_rejected(closed_week, client, db, edit):
+    user, headers, marks, _ = closed_week
+    # Turno del domingo siguiente, fuera del periodo: se intenta mover hacia adentro
+    marks += await create_marks(user.id, [(datetime(2026, 3, 15, 14), datetime(2026, 3, 15, 22))])
+    monday_in, monday_out, outside_in = marks[2], marks[3], marks[6]
+    method, url, body = {
+        "update": ("PUT", f"/marks/{monday_out.id}", {"address": "Edited"}),
+        "move_into": ("PUT", f"/marks/{outside_in.id}", {"timestamp": "2026-03-10T14:00:00"}),
+        "create": ("POST", "/marks/create", {
+            "user_id": user.id, "mark_type": "clock_in", "timestamp": "2026-03-10T14:00:00",
+            "latitude": 19.4326, "longitude": -99.1332, "po_number": "PO-2",
+        }),
+        "delete": ("DELETE", f"/marks/{monday_in.id}", None),
+    }[edit]
+
+    response = await client.request(method, url, json=body, headers=headers)
+
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"] == CLOSED_DETAIL
+    async with db() as session:
+        rows = (await session.execute(text("SELECT id, timestamp, address FROM marks ORDER BY timestamp"))).all()
+        versions = (await session.execute(text("SELECT count(*) FROM mark_versions"))).scalar_one()
+    assert [(row.id, row.timestamp, row.address) for row in rows] == [
+        (mark.id, mark.timestamp, mark.address) for mark in marks
+    ]
+    assert versions == 0
+
+
+async def test_reopen_and_close_again_creates_version_2_and_keeps_version_1(closed_week, client, db):
+    user, headers, marks, period = closed_week
+    params = {**WEEK, "tz": TZ}
+
+    reopened = await client.post(f"/marks/payroll-periods/{period['id']}/reopen", headers=headers)
+    # Lunes: salida una hora después (16.5 -> 17.5 horas)
+    edited = await client.put(f"/marks/{marks[3].id}", json={"timestamp": "2026-03-09T22:00:00"}, headers=headers)
+    closed = await client.post("/marks/payroll-periods/close", json=params, headers=headers)
+    weekly = (await client.get(f"/marks/weekly-report/{user.id}", params=params, headers=headers)).json()
+
+    assert reopened.status_code == 200 and reopened.json()["closed_at"] is None
+    assert reopened.json()["version"] == 1
+    assert edited.status_code == 200, edited.text
+    assert closed.status_code == 200, closed.text
+    assert (closed.json()["id"], closed.json()["version"]) == (period["id"], 2)
+    assert (weekly["snapshot_version"], weekly["total_hours"]) == (2, 17.5)
+    async with db() as session:
+        snapshots = (await session.execute(text(
+            "SELECT version, total_hours FROM payroll_snapshots WHERE user_id = :user_id ORDER BY version"
+        ), {"user_id": user.id})).all()
+    assert [tuple(snapshot) for snapshot in snapshots] == [(1, 16.5), (2, 17.5)]
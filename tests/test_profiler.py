@@ -0,0 +1,172 @@
+"""
+Profiler de requests lentos (app/core/profiler.py): captura con su SQL de los requests que
+superan PROFILER_SLOW_MS, ring buffer de PROFILER_BUFFER_SIZE, /admin/profiles solo para
+admins y nada registrado con PROFILER_ENABLED=false.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app.core.logging_config import REQUEST_ID_HEADER, RequestIdMiddleware
+from app.core.profiler import ProfileBuffer, ProfilerMiddleware, RequestProfile, profile_buffer, profile_engine
+from app.db import postgres_connector
+from main import app
+from tests.conftest import ROOT
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+SLOW_PATH = "/marks/my-marks"
+
+
+@pytest.fixture(scope="session")
+def profiled_engines():
+    """Eventos de SQL del profiler en los engines de la app (sin perfil activo no hacen nada)."""
+    for name, engine in (("primary", postgres_connector.engine), ("read", postgres_connector.read_engine)):
+        profile_engine(engine, name)
+
+
+@pytest.fixture
+def captures(profiled_engines):
+    profile_buffer.clear()
+    yield profile_buffer
+    profile_buffer.clear()
+
+
+def _slow_down(inner, path: str, seconds: float):
+    """Demora los requests a `path` antes de la app (un request lento sin depender de la base)."""
+    async def slowed(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == path:
+            await asyncio.sleep(seconds)
+        await inner(scope, receive, send)
+    return slowed
+
+
+def _profiled_client(slow_ms: float, buffer_size: int = 100) -> httpx.AsyncClient:
+    profiled = ProfilerMiddleware(
+        _slow_down(app, SLOW_PATH, 0.15), slow_ms=slow_ms, sample_rate=0.0,
+        buffer_size=buffer_size, max_statements=200,
+    )
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=RequestIdMiddleware(profiled)), base_url="http://test")
+
+
+async def test_slow_request_is_captured_with_its_sql(db, captures):
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, [(datetime(2026, 10, 5, 14), datetime(2026, 10, 5, 22))])
+    headers = await auth_headers(user)
+
+    async with _profiled_client(slow_ms=100) as http:
+        fast = await http.get("/health")
+        slow = await http.get(SLOW_PATH, headers={**headers, REQUEST_ID_HEADER: "slow-request-1"})
+
+    assert fast.status_code == slow.status_code == 200
+    [capture] = captures.snapshot()
+    assert (capture["method"], capture["path"], capture["route"], capture["status"]) == ("GET", SLOW_PATH, SLOW_PATH, 200)
+    assert capture["request_id"] == "slow-request-1"
+    assert capture["wall_ms"] >= 150
+    # Autenticación (cache vacío) y el listado, con tiempo de base acumulado
+    assert capture["query_count"] == len(capture["statements"]) >= 2
+    assert any('FROM "user"' in statement["sql"] for statement in capture["statements"])
+    assert any("FROM marks" in statement["sql"] for statement in capture["statements"])
+    assert capture["db_ms"] == pytest.approx(sum(statement["ms"] for statement in capture["statements"]), abs=0.1)
+
+
+async def test_statements_are_capped_but_still_counted(db, captures):
+    headers = await auth_headers(await create_user("worker@example.com"))
+    profiled = ProfilerMiddleware(app, slow_ms=0, sample_rate=0.0, buffer_size=10, max_statements=1)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=profiled), base_url="http://test") as http:
+        assert (await http.get(SLOW_PATH, headers=headers)).status_code == 200
+
+    [capture] = captures.snapshot()
+    assert len(capture["statements"]) == 1
+    assert capture["query_count"] >= 2
+
+
+def test_profile_buffer_evicts_the_oldest_capture():
+    buffer = ProfileBuffer(size=3)
+    for i in range(5):
+        buffer.append(RequestProfile("GET", f"/request/{i}", max_statements=0))
+
+    assert [capture["path"] for capture in buffer.snapshot()] == ["/request/4", "/request/3", "/request/2"]
+
+    buffer.resize(2)
+    assert [capture["path"] for capture in buffer.snapshot()] == ["/request/4", "/request/3"]
+
+
+async def test_middleware_sizes_the_buffer_from_profiler_buffer_size(db, captures):
+    async with _profiled_client(slow_ms=0, buffer_size=2) as http:
+        for i in range(4):
+            await http.get("/health", headers={REQUEST_ID_HEADER: f"request-{i}"})
+
+    assert [capture["request_id"] for capture in captures.snapshot()] == ["request-3", "request-2"]
+
+
+# Importa la app en un proceso nuevo (PROFILER_* se leen al importar) y reporta qué quedó
+# registrado y el status de GET /admin/profiles con cada juego de headers de TEST_HEADERS
+APP_PROBE = """
+import asyncio, json, os, sys
+import httpx
+from main import app
+from app.db import postgres_connector
+
+async def probe():
+    report = {
+        "middleware": [middleware.cls.__name__ for middleware in app.user_middleware],
+        "routes": sorted({route.path for route in app.routes if route.path.startswith("/admin/profiles")}),
+        "profiler_imported": "app.core.profiler" in sys.modules,
+        "sql_listeners": [
+            listener.__module__ for listener in postgres_connector.engine.sync_engine.dispatch.after_cursor_execute
+        ],
+        "status": {},
+    }
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        for name, headers in json.loads(os.environ["TEST_HEADERS"]).items():
+            report["status"][name] = (await http.get("/admin/profiles", headers=headers)).status_code
+    await postgres_connector.engine.dispose()
+    print(json.dumps(report))
+
+asyncio.run(probe())
+"""
+
+
+def _probe_app(enabled: bool, headers: dict[str, dict]) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", APP_PROBE],
+        cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PROFILER_ENABLED": str(enabled).lower(), "TEST_HEADERS": json.dumps(headers)},
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+async def test_admin_profiles_is_superuser_only(db):
+    headers = {
+        "anonymous": {},
+        "worker": await auth_headers(await create_user("worker@example.com")),
+        "admin": await auth_headers(await create_user("admin@example.com", superuser=True)),
+    }
+
+    report = _probe_app(enabled=True, headers=headers)
+
+    assert "ProfilerMiddleware" in report["middleware"]
+    assert report["routes"] == ["/admin/profiles"]
+    assert "app.core.profiler" in report["sql_listeners"]
+    assert report["status"] == {"anonymous": 401, "worker": 403, "admin": 200}
+
+
+async def test_nothing_is_registered_when_the_profiler_is_disabled(db):
+    admin = await auth_headers(await create_user("admin@example.com", superuser=True))
+
+    report = _probe_app(enabled=False, headers={"admin": admin})
+
+    assert "ProfilerMiddleware" not in report["middleware"]
+    assert report["routes"] == []
+    assert not report["profiler_imported"]
+    assert "app.core.profiler" not in report["sql_listeners"]
+    assert report["status"] == {"admin": 404}
@@ -0,0 +1,70 @@
+"""
+Statements pre-construidos de app/marks/queries.py frente a un select() armado en cada
+request: costo de construcción, de compilación y de ejecución completa.
+"""
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.marks import queries
+from app.marks.models import Mark
+from tests.utils import create_marks, create_user, ensure_partitions
+
+FIELDS = ("id", "timestamp", "mark_type", "po_number")
+
+
+def _ad_hoc_user_marks(user_id: int, limit: int):
+    """Como se armaba el listado antes de queries.py: columnas y valores en cada request."""
+    return (
+        select(*(queries.MARK_FIELD_COLUMNS[f] for f in FIELDS))
+        .where(Mark.user_id == user_id)
+        .order_by(Mark.timestamp.desc())
+        .limit(limit)
+    )
+
+
+def _per_call_us(fn, calls: int) -> float:
+    started = time.process_time()
+    for i in range(calls):
+        fn(i)
+    return (time.process_time() - started) / calls * 1e6
+
+
+@pytest.mark.benchmark
+async def test_prebuilt_statements_overhead(db):
+    calls, executions = 20000, 1000
+    dialect = postgresql.asyncpg.dialect()
+
+    build = {
+        "ad-hoc select()": _per_call_us(lambda i: _ad_hoc_user_marks(i, 100), calls),
+        "lru_cached bindparam": _per_call_us(lambda i: queries.user_marks_query(FIELDS), calls),
+    }
+    # Sin cache de compilación: lo que cuesta un SQL distinto (o una cache key nueva) cada vez
+    compile_ = {
+        "ad-hoc select()": _per_call_us(lambda i: _ad_hoc_user_marks(i, 100).compile(dialect=dialect), calls // 10),
+        "lru_cached bindparam": _per_call_us(lambda i: queries.user_marks_query(FIELDS).compile(dialect=dialect), calls // 10),
+    }
+
+    await ensure_partitions(datetime(2026, 10, 1), datetime(2026, 10, 31))
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, [(datetime(2026, 10, day, 14), datetime(2026, 10, day, 22)) for day in range(1, 31)])
+    execute = {}
+    async with db() as session:
+        for name, statement in (
+            ("ad-hoc select()", lambda: (_ad_hoc_user_marks(user.id, 100), {})),
+            ("lru_cached bindparam", lambda: (queries.user_marks_query(FIELDS), {"user_id": user.id, "limit": 100})),
+        ):
+            await session.execute(*statement())  # warm-up: compilación y prepared statement
+            started = time.process_time()
+            for _ in range(executions):
+                rows = (await session.execute(*statement())).all()
+            execute[name] = (time.process_time() - started) / executions * 1e6
+            assert len(rows) == 60
+
+    for label, results in (("build", build), ("build + compile, no cache", compile_), ("build + execute, CPU", execute)):
+        print(f"\n{label}: " + ", ".join(f"{name} {us:.1f} us" for name, us in results.items()))
+    assert build["lru_cached bindparam"] < build["ad-hoc select()"]
+    assert execute["lru_cached bindparam"] < execute["ad-hoc select()"] * 1.1
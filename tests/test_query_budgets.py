@@ -0,0 +1,22 @@
+"""El conteo de statements por request que usa el fixture `client` para los presupuestos."""
+import httpx
+
+from app.core import query_budget
+from app.core.query_budget import QueryBudgetMiddleware
+from main import app
+from tests.utils import auth_headers, create_user
+
+
+async def test_request_over_budget_is_reported(db, watched_engines, monkeypatch):
+    user = await create_user("worker@example.com")
+    monkeypatch.setitem(query_budget.ROUTE_QUERY_BUDGETS, ("GET", "/marks/my-marks"), 1)
+    exceeded = []
+    checked_app = QueryBudgetMiddleware(app, on_exceeded=exceeded.append)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=checked_app), base_url="http://test") as http:
+        response = await http.get("/marks/my-marks", headers=await auth_headers(user))
+
+    assert response.status_code == 200
+    assert [(queries.route, queries.budget) for queries in exceeded] == [("/marks/my-marks", 1)]
+    assert exceeded[0].count > 1
+    assert "ran" in exceeded[0].describe()
@@ -0,0 +1,73 @@
+"""
+EXPLAIN de las consultas frecuentes de marcas: deben usar los índices de marksindexes004
+y markstimestamp007 y podar las particiones mensuales de partitionmarks003. Falla si una
+migración o un cambio en app/marks/queries.py cambia el plan.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.marks import queries
+from tests.utils import explain_sql, seed_workforce, walk_plan
+
+# Índice de partición -> índice padre (las particiones reciben nombres propios)
+PARENT_INDEXES = text("""
+    SELECT c.relname, p.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relkind = 'I' AND p.relname LIKE 'idx_marks_%'
+""")
+
+WEEK_START = datetime(2026, 9, 14)
+WEEK_END = datetime(2026, 9, 20, 23, 59, 59)
+SEPTEMBER = {"marks_2026_09"}
+# Particiones con datos; las vacías que dejan otras pruebas se recorren con Seq Scan
+SEEDED = {"marks_2026_08", "marks_2026_09", "marks_2026_10"}
+USER_ID = 7
+
+# (nombre, statement, params, índice padre esperado, particiones permitidas o None)
+HOT_QUERIES = [
+    ("my-marks", queries.user_marks_query(("id", "timestamp", "mark_type")),
+     {"user_id": USER_ID, "limit": 100}, "idx_marks_user_timestamp_covering", None),
+    ("weekly-report", queries.user_range_query(("id", "timestamp", "po_number")),
+     {"user_id": USER_ID, "start": WEEK_START, "end": WEEK_END}, "idx_marks_user_timestamp_covering", SEPTEMBER),
+    ("summary-report", queries.ALL_USERS_RANGE,
+     {"start": WEEK_START, "end": WEEK_END}, "idx_marks_timestamp_desc", SEPTEMBER),
+    ("all-marks", queries.all_marks_query(("id", "timestamp", "user_email")),
+     {"limit": 100}, "idx_marks_timestamp_desc", None),
+    ("latest-clock-in", queries.LATEST_CLOCK_IN_AT_OR_BEFORE,
+     {"user_id": USER_ID, "timestamp": WEEK_END}, "idx_marks_clock_in_user_timestamp", None),
+    ("next-clock-in", queries.NEXT_CLOCK_IN_AFTER,
+     {"user_id": USER_ID, "timestamp": WEEK_START}, "idx_marks_clock_in_user_timestamp", None),
+    ("clock-out-overlap", queries.clock_out_overlap_query(False, True),
+     {"user_id": USER_ID, "after": WEEK_START, "before": WEEK_END}, "idx_marks_user_timestamp_covering", SEPTEMBER),
+]
+
+
+@pytest.fixture
+async def seeded(db):
+    """Tres meses de turnos de 200 usuarios; devuelve índice de partición -> índice padre."""
+    await seed_workforce(200, datetime(2026, 8, 1), datetime(2026, 10, 31))
+    async with db() as session:
+        return dict((await session.execute(PARENT_INDEXES)).all())
+
+
+@pytest.mark.parametrize(
+    "statement, params, expected_index, allowed_partitions",
+    [check[1:] for check in HOT_QUERIES],
+    ids=[check[0] for check in HOT_QUERIES],
+)
+async def test_hot_query_plan(db, seeded, statement, params, expected_index, allowed_partitions):
+    async with db() as session:
+        plan = (await session.execute(text(explain_sql(statement, params)))).scalar_one()[0]["Plan"]
+
+    nodes = list(walk_plan(plan))
+    indexes = {seeded.get(node["Index Name"], node["Index Name"]) for node in nodes if "Index Name" in node}
+    relations = {node["Relation Name"] for node in nodes if "Relation Name" in node}
+
+    assert expected_index in indexes, f"plan uses {sorted(indexes) or 'no index'}"
+    assert not any(node["Node Type"] == "Seq Scan" and node["Relation Name"] in SEEDED for node in nodes)
+    if allowed_partitions is not None:
+        assert relations <= allowed_partitions, f"no partition pruning: {sorted(relations - allowed_partitions)}"
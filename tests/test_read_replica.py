@@ -0,0 +1,111 @@
+"""
+Ruteo de lecturas con réplica: dos bases (primary y una "réplica" con otros datos) para
+ver a cuál va cada lectura. Read-your-writes tras una escritura y guard de lag.
+"""
+import os
+from urllib.parse import urlparse
+
+import asyncpg
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import postgres_connector
+from app.db.postgres_connector import clean_postgres_url, replica_router
+from tests.conftest import migrate_like_production
+from tests.utils import auth_headers, create_user
+
+CLOCK_IN = {"mark_type": "clock_in", "latitude": 19.43, "longitude": -99.13, "po_number": "PRIMARY"}
+
+
+def _replica_url() -> str:
+    parsed = urlparse(os.environ["POSTGRES_DATABASE_URL"])
+    return parsed._replace(path=parsed.path + "_replica").geturl()
+
+
+@pytest.fixture(scope="session")
+async def replica_url(migrated_db):
+    """Segunda base con el mismo esquema (hace de réplica)."""
+    url = _replica_url()
+    name = urlparse(url).path.lstrip("/")
+    conn = await asyncpg.connect(os.environ["POSTGRES_DATABASE_URL"])
+    try:
+        if not await conn.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", name):
+            await conn.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await conn.close()
+    result = await migrate_like_production(url)
+    assert result.returncode == 0, result.stderr
+    return url
+
+
+@pytest.fixture
+async def replica(db, replica_url, monkeypatch):
+    """Conecta la réplica al ReplicaRouter; devuelve una conexión asyncpg a ella."""
+    replica_engine = create_async_engine(clean_postgres_url(replica_url))
+    monkeypatch.setattr(postgres_connector, "read_engine", replica_engine)
+    monkeypatch.setattr(postgres_connector, "ReadSessionLocal", sessionmaker(
+        replica_engine, class_=AsyncSession, expire_on_commit=False
+    ))
+    monkeypatch.setattr(replica_router, "lag_check_seconds", 0.0)
+    monkeypatch.setattr(replica_router, "_recent_writers", {})
+
+    conn = await asyncpg.connect(replica_url)
+    await conn.execute('TRUNCATE "user", marks, mark_versions RESTART IDENTITY CASCADE')
+    yield conn
+    await conn.close()
+    await replica_engine.dispose()
+
+
+async def _seed_replica(conn, user_id: int) -> None:
+    """Lo que la réplica tiene del usuario: una marca distinta a la del primary."""
+    await conn.execute(
+        'INSERT INTO "user" (id, email, hashed_password) VALUES ($1, $2, $3)',
+        user_id, "worker@example.com", "not-a-hash",
+    )
+    await conn.execute(
+        "INSERT INTO marks (user_id, mark_type, timestamp, latitude, longitude, po_number) "
+        "VALUES ($1, 'CLOCK_IN', now() AT TIME ZONE 'utc', 0, 0, 'REPLICA')",
+        user_id,
+    )
+
+
+async def _listed_po(client, headers) -> list[str]:
+    response = await client.get("/marks/my-marks?fields=po_number", headers=headers)
+    assert response.status_code == 200
+    return [item["po_number"] for item in response.json()]
+
+
+async def test_reads_go_to_replica_without_recent_writes(replica, client):
+    user = await create_user("worker@example.com")
+    await _seed_replica(replica, user.id)
+
+    assert await _listed_po(client, await auth_headers(user)) == ["REPLICA"]
+
+
+async def test_read_your_writes_goes_to_primary(replica, client, monkeypatch):
+    user = await create_user("worker@example.com")
+    await _seed_replica(replica, user.id)
+    headers = await auth_headers(user)
+
+    assert (await client.post("/marks/clock-in", json=CLOCK_IN, headers=headers)).status_code == 200
+    # Dentro de la ventana: el usuario ve su escritura aunque la réplica no la tenga
+    assert await _listed_po(client, headers) == ["PRIMARY"]
+
+    # Ventana vencida: vuelve a la réplica
+    monkeypatch.setattr(replica_router, "_recent_writers", {user.id: 0.0})
+    assert await _listed_po(client, headers) == ["REPLICA"]
+
+
+async def test_lagging_replica_falls_back_to_primary(replica, client, monkeypatch):
+    user = await create_user("worker@example.com")
+    await _seed_replica(replica, user.id)
+    headers = await auth_headers(user)
+    assert (await client.post("/marks/clock-in", json=CLOCK_IN, headers=headers)).status_code == 200
+    monkeypatch.setattr(replica_router, "_recent_writers", {})
+
+    monkeypatch.setattr(replica_router, "max_lag_seconds", -1.0)
+    assert await _listed_po(client, headers) == ["PRIMARY"]
+
+    monkeypatch.setattr(replica_router, "max_lag_seconds", 5.0)
+    assert await _listed_po(client, headers) == ["REPLICA"]
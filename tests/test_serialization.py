@@ -0,0 +1,86 @@
+"""
+Serialización de listados de marcas: _json_list_response (filas de columnas + TypeAdapter
++ dump_json) frente al camino anterior (entidades Mark con response_model de FastAPI).
+"""
+import json
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import List
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.marks.models import Mark, MarkType
+from app.marks.routes import _json_list_response
+from app.marks.schemas import MarkRead, mark_read_list_adapter
+
+MarkRow = namedtuple("MarkRow", [field for field in MarkRead.model_fields])
+
+
+def _marks(count: int) -> list[dict]:
+    start = datetime(2026, 10, 5, 8, 0)
+    return [
+        {
+            "id": i + 1,
+            "user_id": 1 + i % 50,
+            "mark_type": MarkType.CLOCK_IN if i % 2 == 0 else MarkType.CLOCK_OUT,
+            "timestamp": start + timedelta(minutes=17 * i),
+            "latitude": 19.4326 + i / 10000,
+            "longitude": -99.1332 - i / 10000,
+            "address": f"Av. Reforma {i}, Ciudad de México",
+            "po_number": f"PO-{i % 40:04d}",
+        }
+        for i in range(count)
+    ]
+
+
+def _apps(count: int) -> tuple[FastAPI, FastAPI]:
+    data = _marks(count)
+    entities = [Mark(**values) for values in data]
+    rows = [MarkRow(**values) for values in data]
+
+    before = FastAPI()
+
+    @before.get("/marks", response_model=List[MarkRead])
+    async def list_entities():
+        return entities
+
+    after = FastAPI()
+
+    @after.get("/marks")
+    async def list_rows():
+        return _json_list_response(mark_read_list_adapter, rows)
+
+    return before, after
+
+
+async def _get(app: FastAPI) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        return await http.get("/marks")
+
+
+async def test_fast_path_matches_response_model():
+    before, after = _apps(50)
+    old, new = await _get(before), await _get(after)
+    assert new.headers["content-type"] == "application/json"
+    assert json.loads(new.content) == json.loads(old.content)
+
+
+@pytest.mark.benchmark
+async def test_list_serialization_throughput():
+    count, requests = 1000, 50
+    before, after = _apps(count)
+    results = {}
+    for name, app in (("response_model", before), ("_json_list_response", after)):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            await http.get("/marks")  # warm-up
+            started = time.perf_counter()
+            for _ in range(requests):
+                (await http.get("/marks")).raise_for_status()
+            elapsed = time.perf_counter() - started
+        results[name] = requests * count / elapsed
+        print(f"\n{name}: {requests / elapsed:.1f} req/s, {results[name]:,.0f} marks/s ({count} marks per response)")
+    print(f"speedup: {results['_json_list_response'] / results['response_model']:.1f}x")
+    assert results["_json_list_response"] > results["response_model"]
@@ -0,0 +1,59 @@
+"""?fields= en listados de marcas y reporte semanal: solo los campos pedidos y payload menor."""
+import json
+from datetime import datetime
+
+from tests.utils import auth_headers, create_marks, create_user
+
+# Semana sábado 2026-10-10 a viernes 2026-10-16, 5 sesiones de 8 horas
+WEEK = [(datetime(2026, 10, 12 + day, 14), datetime(2026, 10, 12 + day, 22)) for day in range(5)]
+
+
+async def test_my_marks_fields_shrink_payload(db, client):
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, WEEK)
+    headers = await auth_headers(user)
+
+    full = await client.get("/marks/my-marks", headers=headers)
+    sparse = await client.get("/marks/my-marks?fields=timestamp,mark_type", headers=headers)
+
+    assert full.status_code == sparse.status_code == 200
+    assert [set(item) for item in sparse.json()] == [{"timestamp", "mark_type"}] * 10
+    assert [item["timestamp"] for item in sparse.json()] == [item["timestamp"] for item in full.json()]
+    assert len(sparse.content) < len(full.content) / 3
+
+
+async def test_all_marks_fields_without_user_columns(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+    await create_marks(admin.id, WEEK[:1])
+
+    response = await client.get("/marks/all?fields=id,po_number", headers=await auth_headers(admin))
+
+    assert response.status_code == 200
+    assert response.json() == [{"id": 2, "po_number": "PO-1"}, {"id": 1, "po_number": "PO-1"}]
+
+
+async def test_unknown_field_is_rejected(db, client):
+    user = await create_user("worker@example.com")
+
+    response = await client.get("/marks/my-marks?fields=timestamp,password", headers=await auth_headers(user))
+
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+
+
+async def test_weekly_report_fields_shrink_sessions(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+    user = await create_user("worker@example.com")
+    await create_marks(user.id, WEEK)
+    headers = await auth_headers(admin)
+    params = "start_date=2026-10-10&end_date=2026-10-16"
+
+    full = await client.get(f"/marks/weekly-report/{user.id}?{params}", headers=headers)
+    sparse = await client.get(f"/marks/weekly-report/{user.id}?{params}&fields=timestamp", headers=headers)
+
+    assert full.status_code == sparse.status_code == 200
+    assert sparse.json()["total_hours"] == full.json()["total_hours"] == 40.0
+    sessions = [s for day in sparse.json()["daily_reports"] for s in day["sessions"]]
+    assert len(sessions) == 5
+    assert all(set(s["clock_in"]) == {"timestamp"} and set(s["clock_out"]) == {"timestamp"} for s in sessions)
+    assert len(json.dumps(sparse.json())) < len(json.dumps(full.json())) / 2
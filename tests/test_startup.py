@@ -0,0 +1,113 @@
+"""
+Arranque en frío (máquinas que escalan a cero): tiempo de import de main con -X importtime,
+tiempo hasta el primer /health y hasta el primer request autenticado, con y sin
+DB_PREWARM_CONNECTIONS. Contra el Postgres local el handshake es barato; en producción
+(TLS hacia otra máquina) la diferencia del prewarm es mayor.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from tests.conftest import ROOT
+from tests.utils import auth_headers, create_user
+
+
+def _importtime() -> tuple[float, list[tuple[float, str]], set[str]]:
+    """
+    Import de main en un proceso nuevo: total en ms, [(acumulado ms, módulo)] de los
+    imports que hace main directamente (más pesados primero) y todos los módulos importados.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True, env=os.environ.copy(),
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    total, direct, modules = 0.0, [], set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # La sangría del nombre (dos espacios por nivel) indica quién lo importó
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        modules.add(name.strip())
+        if depth == 0 and name.strip() == "main":
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            direct.append((int(cumulative) / 1000, name.strip()))
+    return total, sorted(direct, reverse=True), modules
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _cold_start(headers: dict, prewarm: int) -> dict[str, float]:
+    """Arranca uvicorn (con lifespan) y mide en ms desde el exec hasta cada primer request."""
+    port = _free_port()
+    env = {**os.environ, "DB_PREWARM_CONNECTIONS": str(prewarm)}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=5) as http:
+            while True:
+                try:
+                    if (await http.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                assert server.poll() is None, "uvicorn exited"
+                assert time.perf_counter() - started < 30
+                await asyncio.sleep(0.005)
+            health = time.perf_counter() - started
+            # Lo que tarda en llegar un cliente real: el prewarm corre mientras tanto
+            await asyncio.sleep(0.2)
+            request_started = time.perf_counter()
+            response = await http.get("/users/me", headers=headers)
+            assert response.status_code == 200, response.text
+            first_done = time.perf_counter()
+            await http.get("/users/me", headers=headers)
+            second_done = time.perf_counter()
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return {
+        "health": health * 1000,
+        "first_auth": (first_done - started) * 1000,
+        "first_auth_request": (first_done - request_started) * 1000,
+        "second_auth_request": (second_done - first_done) * 1000,
+    }
+
+
+@pytest.mark.benchmark
+async def test_cold_start(db):
+    headers = await auth_headers(await create_user("worker@example.com"))
+
+    total, direct, modules = _importtime()
+    print(f"\nimport main: {total:.0f} ms; heaviest imports made by main:")
+    for ms, name in direct[:8]:
+        print(f"  {name}: {ms:.0f} ms")
+
+    results = {prewarm: await _cold_start(headers, prewarm) for prewarm in (0, 2)}
+    for prewarm, timings in results.items():
+        print(
+            f"DB_PREWARM_CONNECTIONS={prewarm}: first /health at {timings['health']:.0f} ms, "
+            f"first authenticated request done at {timings['first_auth']:.0f} ms "
+            f"(that request {timings['first_auth_request']:.0f} ms, the next one "
+            f"{timings['second_auth_request']:.0f} ms)"
+        )
+
+    # httpx solo se importa al geocodificar, jose nunca
+    assert not {"httpx", "jose"} & modules
+    # /health no espera al prewarm ni a la base
+    assert results[2]["health"] < total + 2000
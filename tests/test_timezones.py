@@ -0,0 +1,145 @@
+"""
+Reportes con ?tz= en semanas con cambio de horario (America/Chicago) y costo por marca de
+la tabla de offsets frente a convertir cada marca con ZoneInfo.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.marks.timezones import UnknownTimeZone, _year_intervals, get_zone, local_range_to_utc, local_time_function
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+TZ = "America/Chicago"
+# Semana sábado-viernes en que termina el horario de verano (1 de noviembre, 2:00 CDT -> 1:00 CST)
+FALL_BACK_WEEK = {"start_date": "2026-10-31", "end_date": "2026-11-06", "tz": TZ}
+FALL_BACK_SHIFTS = [
+    # Sábado 22:00 CDT -> domingo 6:00 CST: 9 horas reales, cuenta para el sábado
+    (datetime(2026, 11, 1, 3), datetime(2026, 11, 1, 12)),
+    # Viernes 22:00-23:30 CST: dentro del último día solo con el offset de CST
+    (datetime(2026, 11, 7, 4), datetime(2026, 11, 7, 5, 30)),
+]
+# Semana en que empieza (8 de marzo, 2:00 CST -> 3:00 CDT)
+SPRING_FORWARD_WEEK = {"start_date": "2026-03-07", "end_date": "2026-03-13", "tz": TZ}
+SPRING_FORWARD_SHIFTS = [
+    # Sábado 0:30-1:30 CST: el primer día empieza a las 6:00 UTC
+    (datetime(2026, 3, 7, 6, 30), datetime(2026, 3, 7, 7, 30)),
+    # Domingo 1:00 CST -> 5:00 CDT: 3 horas reales
+    (datetime(2026, 3, 8, 7), datetime(2026, 3, 8, 10)),
+]
+
+
+def test_local_range_uses_the_offset_of_each_boundary():
+    assert local_range_to_utc(TZ, datetime(2026, 10, 31).date(), datetime(2026, 11, 6).date()) == (
+        datetime(2026, 10, 31, 5), datetime(2026, 11, 7, 5, 59, 59, 999999),
+    )
+    with pytest.raises(UnknownTimeZone):
+        get_zone("America/Atlantis")
+
+
+@pytest.fixture
+async def admin_headers(db):
+    await ensure_partitions(datetime(2026, 3, 1), datetime(2026, 11, 30))
+    admin = await create_user("admin@example.com", superuser=True)
+    return admin, await auth_headers(admin)
+
+
+async def test_fall_back_week(admin_headers, client):
+    admin, headers = admin_headers
+    await create_marks(admin.id, FALL_BACK_SHIFTS)
+
+    report = (await client.get(f"/marks/weekly-report/{admin.id}", params=FALL_BACK_WEEK, headers=headers)).json()
+
+    assert [(day["date"], day["total_hours"]) for day in report["daily_reports"]] == [
+        ("2026-10-31", 9.0), ("2026-11-01", 0), ("2026-11-06", 1.5),
+    ]
+    assert report["total_hours"] == 10.5
+    summary = (await client.get("/marks/summary-report", params=FALL_BACK_WEEK, headers=headers)).json()
+    assert summary["employees"][0]["total_hours"] == 10.5
+
+
+async def test_spring_forward_week(admin_headers, client):
+    admin, headers = admin_headers
+    await create_marks(admin.id, SPRING_FORWARD_SHIFTS)
+
+    report = (await client.get(f"/marks/weekly-report/{admin.id}", params=SPRING_FORWARD_WEEK, headers=headers)).json()
+
+    assert [(day["date"], day["total_hours"]) for day in report["daily_reports"]] == [
+        ("2026-03-07", 1.0), ("2026-03-08", 3.0),
+    ]
+    assert report["total_hours"] == 4.0
+
+
+@pytest.mark.parametrize("method, path, payload", [
+    ("GET", "/marks/weekly-report/1", None),
+    ("GET", "/marks/summary-report", None),
+    ("POST", "/marks/payroll-periods/close", {"start_date": "2026-03-07", "end_date": "2026-03-13"}),
+])
+async def test_unknown_zone_is_a_bad_request(admin_headers, client, method, path, payload):
+    _, headers = admin_headers
+    if payload is None:
+        response = await client.request(method, path, params={**SPRING_FORWARD_WEEK, "tz": "Mars/Olympus"}, headers=headers)
+    else:
+        response = await client.request(method, path, json={**payload, "tz": "Mars/Olympus"}, headers=headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown time zone: Mars/Olympus"
+
+
+async def test_invalid_date_is_a_bad_request(admin_headers, client):
+    _, headers = admin_headers
+    response = await client.get("/marks/summary-report", params={"start_date": "2026-13-01", "end_date": "2026-13-07"}, headers=headers)
+
+    assert response.status_code == 400
+
+
+def _marks_every(start: datetime, end: datetime, step: timedelta) -> list[datetime]:
+    marks, current = [], start
+    while current <= end:
+        marks.append(current)
+        current += step
+    return marks
+
+
+def _ns_per_mark(convert, marks: list[datetime], rounds: int = 5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for timestamp in marks:
+            convert(timestamp)
+        best = min(best, time.perf_counter() - started)
+    return best / len(marks) * 1e9
+
+
+@pytest.mark.benchmark
+def test_per_mark_conversion_against_zoneinfo():
+    zone = get_zone(TZ)
+
+    def with_zoneinfo(timestamp: datetime) -> datetime:
+        return timestamp.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+
+    # Marcas cada 7 segundos: ~86k por semana (UTC naive, como se guardan)
+    weeks = {
+        "fall-back week (bisect)": (datetime(2026, 10, 31, 5), datetime(2026, 11, 7, 5, 59, 59)),
+        "regular week (fixed offset)": (datetime(2026, 10, 17, 5), datetime(2026, 10, 24, 4, 59, 59)),
+    }
+    results = {}
+    for name, (start, end) in weeks.items():
+        marks = _marks_every(start, end, timedelta(seconds=7))
+        _year_intervals.cache_clear()
+        started = time.perf_counter()
+        to_local = local_time_function(start, end, tz=TZ)
+        table_ms = (time.perf_counter() - started) * 1000
+        assert [to_local(timestamp) for timestamp in marks] == [with_zoneinfo(timestamp) for timestamp in marks]
+
+        results[name] = (_ns_per_mark(to_local, marks), _ns_per_mark(with_zoneinfo, marks))
+        print(
+            f"\n{name}, {len(marks)} marks: offset table {results[name][0]:.0f} ns/mark "
+            f"(built in {table_ms:.1f} ms, cached per zone and year), "
+            f"ZoneInfo per mark {results[name][1]:.0f} ns/mark",
+            end="",
+        )
+    print()
+
+    for table_ns, zoneinfo_ns in results.values():
+        assert table_ns < zoneinfo_ns
@@ -0,0 +1,74 @@
+"""Alta masiva de usuarios (POST /admin/users/bulk) y su benchmark de 5,000 usuarios."""
+import os
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.users.password import password_helper
+from tests.utils import auth_headers, create_user
+
+CSV_HEADER = "email,password,first_name,last_name\n"
+
+
+def _csv(rows: list[str]) -> bytes:
+    return (CSV_HEADER + "\n".join(rows) + "\n").encode()
+
+
+async def test_import_reports_each_row(db, client):
+    admin = await create_user("admin@example.com", superuser=True)
+    await create_user("existing@example.com")
+    body = _csv([
+        "ana@example.com,secret-1,Ana,López",
+        "existing@example.com,secret-2,,",
+        "ANA@example.com,secret-3,,",
+        "not-an-email,secret-4,,",
+        "luis@example.com,secret-5,Luis,",
+    ])
+
+    response = await client.post(
+        "/admin/users/bulk", content=body,
+        headers={**await auth_headers(admin), "Content-Type": "text/csv"},
+    )
+
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert (summary["created"], summary["duplicates"], summary["invalid"]) == (2, 2, 1)
+    assert [result["status"] for result in summary["results"]] == [
+        "created", "duplicate", "duplicate", "invalid", "created",
+    ]
+    async with db() as session:
+        stored = (await session.execute(
+            text('SELECT hashed_password FROM "user" WHERE email = :email'), {"email": "ana@example.com"}
+        )).scalar_one()
+    assert password_helper.verify_and_update("secret-1", stored)[0]
+
+
+@pytest.mark.benchmark
+async def test_import_5000_users_throughput(db, client):
+    count = 5000
+    admin = await create_user("admin@example.com", superuser=True)
+    body = _csv([f"worker{i}@example.com,password-{i},Worker,{i}" for i in range(count)])
+
+    sample = 5
+    started = time.perf_counter()
+    for i in range(sample):
+        password_helper.hash(f"password-{i}")
+    serial_hash_seconds = (time.perf_counter() - started) / sample
+
+    started = time.perf_counter()
+    response = await client.post(
+        "/admin/users/bulk", content=body,
+        headers={**await auth_headers(admin), "Content-Type": "text/csv"}, timeout=None,
+    )
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == count
+    serial_estimate = serial_hash_seconds * count
+    print(
+        f"\n{count} users in {elapsed:.1f} s ({count / elapsed:.1f} users/s, {os.cpu_count()} CPUs); "
+        f"serial hashing estimate {serial_estimate:.1f} s ({serial_estimate / elapsed:.1f}x)"
+    )
+    if (os.cpu_count() or 1) > 1:
+        assert elapsed < serial_estimate
@@ -0,0 +1,90 @@
+"""ETag de los listados de marcas (app/marks/versions.py): 304 sin cambios y cada mutación lo invalida."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from tests.utils import auth_headers, create_marks, create_user, ensure_partitions
+
+SHIFTS = [
+    (datetime(2026, 10, 5, 14), datetime(2026, 10, 5, 22)),
+    (datetime(2026, 10, 6, 14), datetime(2026, 10, 6, 22)),
+]
+CLOCK_IN = {"mark_type": "clock_in", "latitude": 19.4326, "longitude": -99.1332, "po_number": "PO-9"}
+
+
+@pytest.fixture
+async def worker(db):
+    """Empleado con dos turnos, sus headers y los del admin; devuelve (marcas, headers, admin headers)."""
+    now = datetime.utcnow()
+    await ensure_partitions(datetime(2026, 10, 1), max(now, datetime(2026, 10, 31)))
+    user = await create_user("worker@example.com")
+    admin = await create_user("admin@example.com", superuser=True)
+    marks = await create_marks(user.id, SHIFTS)
+    return marks, await auth_headers(user), await auth_headers(admin)
+
+
+async def _mark_version(db, user_id: int) -> int:
+    async with db() as session:
+        result = await session.execute(
+            text("SELECT version FROM mark_versions WHERE user_id = :user_id"), {"user_id": user_id}
+        )
+        return result.scalar_one_or_none() or 0
+
+
+async def test_my_marks_revalidates_with_if_none_match(worker, client):
+    _, headers, _ = worker
+
+    first = await client.get("/marks/my-marks", headers=headers)
+    etag = first.headers["etag"]
+    again = await client.get("/marks/my-marks", headers={**headers, "If-None-Match": etag})
+
+    assert first.status_code == 200 and len(first.json()) == 4
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+    # Comparación débil y listas de candidatos
+    weak = await client.get("/marks/my-marks", headers={**headers, "If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+
+async def test_fields_change_the_etag(worker, client):
+    _, headers, _ = worker
+
+    etags = {
+        fields: (await client.get("/marks/my-marks", params={"fields": fields}, headers=headers)).headers["etag"]
+        for fields in ("timestamp", "timestamp,mark_type", "po_number")
+    }
+    full = (await client.get("/marks/my-marks", headers=headers)).headers["etag"]
+
+    assert len(set(etags.values()) | {full}) == 4
+    sparse = await client.get(
+        "/marks/my-marks", params={"fields": "timestamp"}, headers={**headers, "If-None-Match": full}
+    )
+    assert sparse.status_code == 200
+
+
+@pytest.mark.parametrize("mutation", ["clock-in", "update", "delete", "bulk"])
+async def test_every_mutation_bumps_the_version_and_invalidates_the_etag(db, worker, client, mutation):
+    marks, headers, admin_headers = worker
+    user_id, clock_out = marks[0].user_id, marks[3]
+    etag = (await client.get("/marks/my-marks", headers=headers)).headers["etag"]
+    version = await _mark_version(db, user_id)
+
+    if mutation == "clock-in":
+        response = await client.post("/marks/clock-in", json=CLOCK_IN, headers=headers)
+    elif mutation == "update":
+        response = await client.put(f"/marks/{clock_out.id}", json={"address": "Bodega 4"}, headers=admin_headers)
+    elif mutation == "delete":
+        response = await client.delete(f"/marks/{clock_out.id}", headers=admin_headers)
+    else:
+        response = await client.post("/marks/bulk", json={"operations": [
+            {"op": "update", "mark_id": clock_out.id, "timestamp": "2026-10-06T21:00:00"},
+        ]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    assert await _mark_version(db, user_id) == version + 1
+    revalidated = await client.get("/marks/my-marks", headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 200
+    assert revalidated.headers["etag"] != etag
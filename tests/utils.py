@@ -0,0 +1,98 @@
+"""Helpers de datos para las pruebas (importar después de conftest, que fija la configuración)."""
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from app.db.postgres_connector import AsyncSessionLocal
+from app.marks.models import Mark, MarkType
+from app.users.models import User
+from app.users.routes import get_jwt_strategy
+
+
+async def create_user(email: str, superuser: bool = False, **fields) -> User:
+    """Inserta un usuario (sin hashear contraseña: las pruebas usan tokens)."""
+    async with AsyncSessionLocal() as session:
+        user = User(**{
+            "email": email, "hashed_password": "not-a-hash", "is_active": True,
+            "is_superuser": superuser, "is_verified": True, **fields,
+        })
+        session.add(user)
+        await session.commit()
+        return user
+
+
+async def auth_headers(user: User) -> dict[str, str]:
+    token = await get_jwt_strategy().write_token(user)
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def ensure_partitions(start: datetime, end: datetime) -> None:
+    """Crea las particiones mensuales de marks para [start, end] (datos de prueba antiguos)."""
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("SELECT ensure_marks_partitions(:start, :end)"), {"start": start, "end": end})
+        await session.commit()
+
+
+# Usuarios worker1..workerN con un turno de 8 horas por día en [start, end], insertados en
+# orden cronológico como en producción. Parámetros: users, start, end
+SEED_USERS = text("""
+    INSERT INTO "user" (email, hashed_password, is_active, is_superuser, is_verified)
+    SELECT 'worker' || g || '@example.com', 'not-a-hash', true, false, true
+    FROM generate_series(1, :users) AS g
+""")
+SEED_MARKS = text("""
+    INSERT INTO marks (user_id, mark_type, timestamp, latitude, longitude, address, po_number)
+    SELECT
+        u,
+        t,
+        d + INTERVAL '14 hours' + (u % 60) * INTERVAL '1 minute'
+          + CASE WHEN t = 'CLOCK_OUT' THEN INTERVAL '8 hours' ELSE INTERVAL '0' END,
+        19.43, -99.13, 'Av. Reforma ' || u, 'PO-' || (u % 40)
+    FROM generate_series(1, :users) AS u,
+         generate_series(CAST(:start AS timestamp), CAST(:end AS timestamp), INTERVAL '1 day') AS d,
+         unnest(ARRAY['CLOCK_IN', 'CLOCK_OUT']::marktype[]) AS t
+    ORDER BY 3
+""")
+
+
+async def seed_workforce(users: int, start: datetime, end: datetime) -> None:
+    """Carga de volumen (planes de consulta, benchmarks): usuarios y sus turnos, con ANALYZE."""
+    await ensure_partitions(start, end + timedelta(days=1))
+    params = {"users": users, "start": start, "end": end}
+    async with AsyncSessionLocal() as session:
+        await session.execute(SEED_USERS, params)
+        await session.execute(SEED_MARKS, params)
+        await session.commit()
+        await session.execute(text("ANALYZE marks"))
+        await session.commit()
+
+
+def explain_sql(statement, params: dict, analyze: bool = False) -> str:
+    """EXPLAIN en JSON de un statement con los valores como literales (poda en tiempo de plan)."""
+    compiled = statement.params(**params).compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    return f"EXPLAIN ({'ANALYZE, ' if analyze else ''}FORMAT JSON) {compiled}"
+
+
+def walk_plan(plan: dict):
+    """Nodos de un plan de EXPLAIN (FORMAT JSON), en profundidad."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk_plan(child)
+
+
+async def create_marks(user_id: int, pairs: list[tuple[datetime, datetime]], po_number: str = "PO-1") -> list[Mark]:
+    """Inserta un clock in y un clock out por cada (entrada, salida) del usuario; devuelve las marcas en orden."""
+    marks = []
+    async with AsyncSessionLocal() as session:
+        for clock_in, clock_out in pairs:
+            for mark_type, timestamp in ((MarkType.CLOCK_IN, clock_in), (MarkType.CLOCK_OUT, clock_out)):
+                marks.append(Mark(
+                    user_id=user_id, mark_type=mark_type, timestamp=timestamp,
+                    latitude=19.4326, longitude=-99.1332,
+                    address="Av. Paseo de la Reforma 222, Juárez, Cuauhtémoc, Ciudad de México",
+                    po_number=po_number,
+                ))
+        session.add_all(marks)
+        await session.commit()
+    return marks